@@ -0,0 +1 @@
+"""Benchmarks of the pastebin API, run each module with `python -m benchmarks.<module>`."""
@@ -0,0 +1,120 @@
+"""Synthetic dataset of users and snippets written directly with the ORM, much faster than through the API."""
+import random
+from typing import Dict, List, Sequence, Tuple
+
+from pygments.lexers import get_all_lexers
+from pygments.styles import get_all_styles
+from tortoise.transactions import in_transaction
+
+from cli.main import upsert_names
+from pastebin.snippets.contents import add_references, create_contents, get_code_hash
+from pastebin.snippets.models import Language, Snippet, Style
+from pastebin.snippets.search import index_snippets
+from pastebin.users.hashing import hash_password
+from pastebin.users.models import User
+
+PASSWORD = 'benchmark'
+# words of generated codes and titles, searches use them too
+WORDS = (
+    'alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliet', 'kilo', 'lima',
+    'mike', 'november', 'oscar', 'papa', 'quebec', 'romeo', 'sierra', 'tango', 'uniform', 'victor', 'whiskey'
+)
+LANGUAGES = ('Python', 'JavaScript', 'Go', 'Rust', 'SQL')
+STYLES = ('monokai', 'friendly', 'default')
+
+
+def parse_code_sizes(value: str) -> List[Tuple[int, float]]:
+    """Parses a "size:weight,..." distribution of code sizes in bytes, e.g. "200:0.7,4000:0.25,64000:0.05"."""
+    distribution = []
+    for item in value.split(','):
+        size, _, weight = item.partition(':')
+        distribution.append((int(size), float(weight or 1)))
+    return distribution
+
+
+def generate_code(rng: random.Random, size: int) -> str:
+    """Returns python-like code of about `size` bytes, varied enough to be neither trivially compressible nor cached."""
+    lines = []
+    length = 0
+    while length < size:
+        name, value = rng.choice(WORDS), rng.choice(WORDS)
+        line = rng.choice((
+            f'def {name}_{rng.randrange(1000)}(value):',
+            f'    return {{"{name}": value, "{value}": {rng.randrange(10_000)}}}',
+            f'    # {name} {value} {rng.random():.6f}',
+            f'{name.upper()}_{rng.randrange(100)} = "{value}" * {rng.randrange(1, 10)}'
+        ))
+        lines.append(line)
+        length += len(line) + 1
+    return '\n'.join(lines)
+
+
+async def create_users(count: int, admin: bool = False, prefix: str = 'user') -> List[User]:
+    # bcrypt is deliberately slow, all users share the same hash
+    password_hash = hash_password(PASSWORD)
+    users = [
+        User(
+            firstname=prefix, lastname=f'{prefix}-{index}', pseudo=f'{prefix}-{index}',
+            email=f'{prefix}-{index}@bench.example.com', password_hash=password_hash, is_admin=admin
+        )
+        for index in range(count)
+    ]
+    await User.bulk_create(users)
+    return await User.filter(pseudo__in=[user.pseudo for user in users]).order_by('pseudo')
+
+
+async def create_snippets(
+        rng: random.Random,
+        users: Sequence[User],
+        count: int,
+        code_sizes: Sequence[Tuple[int, float]],
+        batch_size: int = 500
+) -> List[Snippet]:
+    languages = await Language.filter(name__in=LANGUAGES)
+    styles = await Style.filter(name__in=STYLES)
+    sizes, weights = zip(*code_sizes)
+    created: List[Snippet] = []
+    for start in range(0, count, batch_size):
+        snippets = []
+        codes = []
+        for index in range(start, min(start + batch_size, count)):
+            snippets.append(Snippet(
+                title=f'{rng.choice(WORDS)} {rng.choice(WORDS)} {index}',
+                print_line_number=rng.random() < 0.5,
+                language=rng.choice(languages),
+                style=rng.choice(styles),
+                user=rng.choice(users)
+            ))
+            codes.append(generate_code(rng, rng.choices(sizes, weights)[0]))
+        contents = await create_contents(codes)
+        for snippet, code in zip(snippets, codes):
+            snippet.content = contents[get_code_hash(code)]
+        async with in_transaction('default'):
+            await add_references(snippet.content for snippet in snippets)
+            await Snippet.bulk_create(snippets)
+            await index_snippets(snippets)
+        created.extend(snippets)
+    return created
+
+
+async def seed_dataset(
+        rng: random.Random, users: int, snippets: int, code_sizes: Sequence[Tuple[int, float]], disposable: int
+) -> Dict[str, List]:
+    """
+    Creates the catalogues, `users` users owning `snippets` snippets, an admin, and `disposable` users and snippets
+    for the routes deleting them.
+    """
+    await upsert_names(Language, [lexer[0] for lexer in get_all_lexers()])
+    await upsert_names(Style, get_all_styles())
+    regular_users = await create_users(users)
+    admins = await create_users(1, admin=True, prefix='admin')
+    disposable_users = await create_users(disposable, prefix='disposable')
+    owner = regular_users[0]
+    return {
+        'users': regular_users,
+        'admins': admins,
+        'disposable_users': disposable_users,
+        'snippets': await create_snippets(rng, regular_users, snippets, code_sizes),
+        # owned by the first user so that its token can delete them
+        'disposable_snippets': await create_snippets(rng, [owner], disposable, code_sizes)
+    }
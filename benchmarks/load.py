@@ -0,0 +1,343 @@
+"""
+Load test of every route of the API, run in process through the ASGI transport of httpx so that only the application
+is measured. A synthetic dataset is seeded first, then each route receives `--requests` requests from `--concurrency`
+concurrent clients. Throughput and latency percentiles of each route are reported as JSON, and compared to a
+previous report given with --baseline: the command fails if a route got slower than the allowed tolerance.
+
+    python -m benchmarks.load --users 50 --snippets 5000 --concurrency 16 --output report.json
+    python -m benchmarks.load --users 50 --snippets 5000 --concurrency 16 --baseline report.json
+"""
+import argparse
+import asyncio
+import inspect
+import itertools
+import json
+import random
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import httpx
+from fastapi.routing import APIRoute
+from tortoise import Tortoise
+
+from pastebin.database import monitor_pools
+from pastebin.metrics import monitor_queries
+from pastebin.main import app, close_tortoise, init_tortoise
+from pastebin.snippets.catalogue import load_catalogues
+from pastebin.snippets.indexes import create_name_indexes
+from pastebin.snippets.search import create_search_table
+from .dataset import LANGUAGES, PASSWORD, STYLES, WORDS, generate_code, parse_code_sizes, seed_dataset
+
+MODULES = {'pastebin': ['pastebin.users.models', 'pastebin.snippets.models']}
+
+
+class Context:
+    """Dataset and credentials shared by the scenarios."""
+
+    def __init__(self, rng: random.Random, dataset: Dict[str, List], code_sizes: Sequence[Tuple[int, float]]):
+        self.rng = rng
+        self.users = [str(user.id) for user in dataset['users']]
+        self.owner = self.users[0]
+        self.pseudos = [user.pseudo for user in dataset['users']]
+        self.snippets = [str(snippet.id) for snippet in dataset['snippets']]
+        self.owned_snippets = [
+            str(snippet.id) for snippet in dataset['snippets'] if str(snippet.user_id) == self.owner
+        ]
+        self.disposable_users = [str(user.id) for user in dataset['disposable_users']]
+        self.disposable_snippets = [str(snippet.id) for snippet in dataset['disposable_snippets']]
+        self.code_sizes = code_sizes
+        self.counter = itertools.count()
+        self.owner_headers: Dict[str, str] = {}
+        self.admin_headers: Dict[str, str] = {}
+
+    async def login(self, client: httpx.AsyncClient, admin_pseudo: str) -> None:
+        for pseudo, attribute in ((self.pseudos[0], 'owner_headers'), (admin_pseudo, 'admin_headers')):
+            response = await client.post('/token', data={'username': pseudo, 'password': PASSWORD})
+            response.raise_for_status()
+            setattr(self, attribute, {'Authorization': f'Bearer {response.json()["access_token"]}'})
+
+    def snippet_payload(self) -> Dict[str, Any]:
+        sizes, weights = zip(*self.code_sizes)
+        return {
+            'title': f'{self.rng.choice(WORDS)} {next(self.counter)}',
+            'code': generate_code(self.rng, self.rng.choices(sizes, weights)[0]),
+            'language': self.rng.choice(LANGUAGES),
+            'style': self.rng.choice(STYLES)
+        }
+
+
+Scenario = Callable[[httpx.AsyncClient, Context], Awaitable[httpx.Response]]
+# route ("METHOD path" as declared) -> (scenario, expected status codes)
+SCENARIOS: Dict[str, Tuple[Scenario, Tuple[int, ...]]] = {}
+
+
+def scenario(route: str, *statuses: int) -> Callable[[Scenario], Scenario]:
+    def decorator(func: Scenario) -> Scenario:
+        SCENARIOS[route] = (func, statuses or (200,))
+        return func
+
+    return decorator
+
+
+def page_params(ctx: Context, pages: int = 5) -> Dict[str, int]:
+    return {'page': ctx.rng.randint(1, pages), 'page_size': 50}
+
+
+@scenario('GET /languages')
+async def get_languages(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.get('/languages', params=page_params(ctx))
+
+
+@scenario('GET /styles')
+async def get_styles(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.get('/styles', params={'page': 1, 'page_size': 50})
+
+
+@scenario('POST /token')
+async def login(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.post('/token', data={'username': ctx.rng.choice(ctx.pseudos), 'password': PASSWORD})
+
+
+@scenario('GET /internationalization')
+async def internationalization(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    language = ctx.rng.choice(('fr-FR,fr;q=0.9,en;q=0.8', 'en-US,en;q=0.5', 'de;q=0.7,*;q=0.1'))
+    return await client.get('/internationalization', headers={'Accept-Language': language})
+
+
+@scenario('POST /users/', 201)
+async def create_user(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    index = next(ctx.counter)
+    return await client.post('/users/', json={
+        'firstname': 'load', 'lastname': f'test-{index}', 'pseudo': f'load-{index}',
+        'email': f'load-{index}@bench.example.com', 'password': PASSWORD
+    })
+
+
+@scenario('GET /users/')
+async def get_users(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.get('/users/', params=page_params(ctx, pages=1))
+
+
+@scenario('GET /users/{user_id}')
+async def get_user(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.get(f'/users/{ctx.rng.choice(ctx.users)}')
+
+
+@scenario('PATCH /users/{user_id}')
+async def update_user(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.patch(
+        f'/users/{ctx.owner}', json={'firstname': f'owner {next(ctx.counter)}'}, headers=ctx.owner_headers
+    )
+
+
+@scenario('DELETE /users/{user_id}', 204)
+async def delete_user(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.delete(f'/users/{ctx.disposable_users.pop()}', headers=ctx.admin_headers)
+
+
+@scenario('POST /users/{user_id}/snippets', 201)
+async def create_snippet(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.post(f'/users/{ctx.owner}/snippets', json=ctx.snippet_payload(), headers=ctx.owner_headers)
+
+
+@scenario('POST /users/{user_id}/snippets/batch', 201)
+async def create_snippets(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    payload = [ctx.snippet_payload() for _ in range(10)]
+    return await client.post(f'/users/{ctx.owner}/snippets/batch', json=payload, headers=ctx.owner_headers)
+
+
+@scenario('GET /users/{user_id}/snippets')
+async def get_user_snippets(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.get(f'/users/{ctx.rng.choice(ctx.users)}/snippets', params={'cursor': ''})
+
+
+@scenario('GET /snippets/')
+async def get_snippets(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.get('/snippets/', params=page_params(ctx))
+
+
+@scenario('GET /snippets/export')
+async def export_snippets(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.get('/snippets/export', params={'user_id': ctx.rng.choice(ctx.users)})
+
+
+@scenario('GET /snippets/search')
+async def search_snippets(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    query = ' '.join(ctx.rng.sample(WORDS, ctx.rng.randint(1, 2)))
+    return await client.get('/snippets/search', params={'q': query, 'page_size': 20})
+
+
+@scenario('GET /snippets/{snippet_id}')
+async def get_snippet(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.get(f'/snippets/{ctx.rng.choice(ctx.snippets)}')
+
+
+@scenario('GET /snippets/{snippet_id}/highlight')
+async def get_highlighted_snippet(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.get(f'/snippets/{ctx.rng.choice(ctx.snippets)}/highlight')
+
+
+@scenario('PATCH /snippets/{snippet_id}')
+async def update_snippet(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.patch(
+        f'/snippets/{ctx.rng.choice(ctx.owned_snippets)}', json={'title': f'updated {next(ctx.counter)}'},
+        headers=ctx.owner_headers
+    )
+
+
+@scenario('DELETE /snippets/{snippet_id}', 204)
+async def delete_snippet(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.delete(f'/snippets/{ctx.disposable_snippets.pop()}', headers=ctx.owner_headers)
+
+
+@scenario('GET /metrics')
+async def get_metrics(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.get('/metrics')
+
+
+def get_app_routes() -> List[str]:
+    return [
+        f'{method} {route.path}'
+        for route in app.routes if isinstance(route, APIRoute)
+        for method in sorted(route.methods)
+    ]
+
+
+def percentile(sorted_values: Sequence[float], percent: float) -> float:
+    """Nearest-rank percentile."""
+    index = max(0, min(len(sorted_values) - 1, round(percent / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+async def run_route(
+        client: httpx.AsyncClient, ctx: Context, route: str, requests: int, concurrency: int
+) -> Dict[str, Any]:
+    func, statuses = SCENARIOS[route]
+    latencies: List[float] = []
+    errors: List[str] = []
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await func(client, ctx)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code not in statuses:
+                errors.append(f'{response.status_code} {response.text[:200]}')
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    result = {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput': len(latencies) / elapsed,
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000
+    }
+    if errors:
+        result['first_error'] = errors[0]
+    return result
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Returns the regressions of the report: a p95 latency or a throughput worse than the baseline by `tolerance`."""
+    regressions = []
+    for route, result in report['routes'].items():
+        base = baseline.get('routes', {}).get(route)
+        if base is None:
+            continue
+        if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f'{route}: p95 {result["p95_ms"]:.2f}ms, baseline {base["p95_ms"]:.2f}ms')
+        if result['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(
+                f'{route}: throughput {result["throughput"]:.1f}/s, baseline {base["throughput"]:.1f}/s'
+            )
+        if result['errors'] > base['errors']:
+            regressions.append(f'{route}: {result["errors"]} errors, baseline {base["errors"]}')
+    return regressions
+
+
+async def run_handlers(handlers: Iterable[Callable]) -> None:
+    for handler in handlers:
+        result = handler()
+        if inspect.isawaitable(result):
+            await result
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    code_sizes = parse_code_sizes(args.code_sizes)
+    routes = [route for route in get_app_routes() if not args.routes or any(name in route for name in args.routes)]
+    missing = [route for route in routes if route not in SCENARIOS]
+    if missing:
+        raise LookupError(f'no scenario for routes: {", ".join(missing)}')
+
+    # the application database is replaced by the benchmark one, other startup handlers are run as is
+    await Tortoise.init(db_url=args.db_url, modules=MODULES)
+    monitor_pools()
+    monitor_queries()
+    await run_handlers(handler for handler in app.router.on_startup if handler is not init_tortoise)
+    try:
+        await Tortoise.generate_schemas()
+        await create_name_indexes()
+        await create_search_table()
+        start = time.perf_counter()
+        dataset = await seed_dataset(rng, args.users, args.snippets, code_sizes, disposable=args.requests)
+        print(f'dataset seeded in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+        await load_catalogues()
+
+        ctx = Context(rng, dataset, code_sizes)
+        report: Dict[str, Any] = {'config': {
+            key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'tolerance')
+        }, 'routes': {}}
+        async with httpx.AsyncClient(app=app, base_url='http://bench') as client:
+            await ctx.login(client, dataset['admins'][0].pseudo)
+            for route in routes:
+                report['routes'][route] = result = await run_route(client, ctx, route, args.requests, args.concurrency)
+                print(
+                    f'{route:<40} {result["throughput"]:>9.1f}/s  p50 {result["p50_ms"]:>8.2f}ms'
+                    f'  p95 {result["p95_ms"]:>8.2f}ms  p99 {result["p99_ms"]:>8.2f}ms  errors {result["errors"]}',
+                    file=sys.stderr
+                )
+        return report
+    finally:
+        await run_handlers(handler for handler in app.router.on_shutdown if handler is not close_tortoise)
+        await Tortoise.close_connections()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20, help='number of users owning snippets')
+    parser.add_argument('--snippets', type=int, default=1000, help='number of snippets')
+    parser.add_argument('--code-sizes', default='200:0.7,4000:0.25,64000:0.05',
+                        help='distribution of code sizes in bytes, as size:weight pairs')
+    parser.add_argument('--requests', type=int, default=200, help='requests sent to each route')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--routes', nargs='*', help='only run routes containing one of these strings')
+    parser.add_argument('--db-url', default='sqlite://:memory:', help='database filled with the synthetic dataset')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the dataset and of the requests')
+    parser.add_argument('--output', type=argparse.FileType('w'), default=sys.stdout, help='json report file')
+    parser.add_argument('--baseline', type=argparse.FileType('r'), help='previous json report to compare to')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative degradation of p95 or throughput flagged as a regression')
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    json.dump(report, args.output, indent=2)
+    args.output.write('\n')
+    if args.baseline is None:
+        return 0
+
+    regressions = compare(report, json.load(args.baseline), args.tolerance)
+    for regression in regressions:
+        print(f'regression: {regression}', file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""
+Microbenchmarks of the helpers run on every request or write: language negotiation, token creation and decoding,
+snippet encoding, email validation and highlighting.
+
+Each benchmark runs `--repeat` times a number of loops, with the garbage collector disabled, and reports the median
+and interquartile range of the time per loop. By default the number of loops is calibrated so that a run lasts about
+0.1s. With --fixed, loops, inputs and seed do not change between runs and times are rounded to 3 significant
+digits, so that reports of two commits can be diffed:
+
+    python -m benchmarks.micro --fixed > before.txt
+    python -m benchmarks.micro --fixed > after.txt
+    diff before.txt after.txt
+"""
+import argparse
+import asyncio
+import gc
+import json
+import random
+import statistics
+import sys
+import time
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from jose import jwt
+from tortoise import Tortoise
+from tortoise.exceptions import ValidationError
+
+from cli.main import upsert_names
+from pastebin.config import settings
+from pastebin.dependencies import parse_accept_language, set_language
+from pastebin.helpers import SetupTranslations, create_access_token
+from pastebin.main import locales_dir
+from pastebin.snippets.highlighting import highlight_code
+from pastebin.snippets.models import Language, Snippet, Style
+from pastebin.snippets.search import create_search_table
+from pastebin.snippets.views import get_snippet_info_to_display, snippet_json_response
+from pastebin.users.models import email_validator
+from .dataset import LANGUAGES, STYLES, create_snippets, create_users, generate_code
+
+MODULES = {'pastebin': ['pastebin.users.models', 'pastebin.snippets.models']}
+ACCEPT_LANGUAGES = {
+    'simple': 'en',
+    'weighted': 'fr-CH, fr;q=0.9, en;q=0.8, de;q=0.7, *;q=0.5',
+    'unsupported': 'es-ES, es;q=0.9, pt;q=0.8'
+}
+EMAILS = {'valid': 'jean.dupont@example.com', 'invalid': 'jean.dupont@example'}
+CODE_SIZES = (200, 4000, 64000)
+PAGE_SIZE = 50
+# loops per run in fixed mode, chosen so that a run lasts between 10ms and 100ms
+FIXED_LOOPS = {
+    'accept_language': 20_000,
+    'set_language': 10_000,
+    'token': 1000,
+    'email': 1000,
+    'snippet': 200,
+    'highlight': 1
+}
+
+Benchmark = Tuple[str, Callable[[], Any]]
+
+
+def run_coroutine(coroutine: Coroutine) -> Any:
+    """Runs a coroutine which never suspends without the overhead of an event loop."""
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coroutine.close()
+    raise RuntimeError('the coroutine suspended')
+
+
+def validate_email(value: str) -> None:
+    try:
+        email_validator(value)
+    except ValidationError:
+        pass
+
+
+async def get_snippets(rng: random.Random) -> List[Snippet]:
+    await Tortoise.generate_schemas()
+    await create_search_table()
+    await upsert_names(Language, LANGUAGES)
+    await upsert_names(Style, STYLES)
+    users = await create_users(1)
+    await create_snippets(rng, users, PAGE_SIZE, [(200, 1)])
+    # the list endpoint fetches snippets the same way
+    snippets = await Snippet.all().prefetch_related('language', 'style', 'content').order_by('created_at', 'id')
+    for snippet in snippets:
+        # decompresses codes once, as the routes do
+        snippet.code
+    return snippets
+
+
+def get_benchmarks(rng: random.Random, snippets: List[Snippet]) -> List[Benchmark]:
+    benchmarks: List[Benchmark] = []
+    for name, value in ACCEPT_LANGUAGES.items():
+        benchmarks.append((f'accept_language.parse[{name}]', lambda value=value: parse_accept_language(value)))
+        benchmarks.append((
+            f'set_language[{name}]', lambda value=value: run_coroutine(set_language(value))
+        ))
+
+    token = create_access_token({'sub': 'jean-dupont'})
+    benchmarks.append(('token.create', lambda: create_access_token({'sub': 'jean-dupont'})))
+    benchmarks.append((
+        'token.decode', lambda: jwt.decode(token, settings.secret_key, algorithms=[settings.jwt_algorithm])
+    ))
+
+    for name, value in EMAILS.items():
+        benchmarks.append((f'email.validate[{name}]', lambda value=value: validate_email(value)))
+
+    for rows in (1, PAGE_SIZE):
+        page = snippets[:rows]
+        benchmarks.append((
+            f'snippet.jsonable_encoder[{rows}]',
+            lambda page=page: jsonable_encoder([get_snippet_info_to_display(snippet) for snippet in page])
+        ))
+        benchmarks.append((
+            f'snippet.orjson[{rows}]',
+            lambda page=page: snippet_json_response([get_snippet_info_to_display(snippet) for snippet in page])
+        ))
+
+    for size in CODE_SIZES:
+        code = generate_code(rng, size)
+        benchmarks.append((
+            f'highlight[{size}]', lambda code=code: highlight_code(code, 'python', 'benchmark', 'monokai', True)
+        ))
+    return benchmarks
+
+
+def get_fixed_loops(name: str) -> int:
+    return FIXED_LOOPS[name.split('.')[0].split('[')[0]]
+
+
+def calibrate(func: Callable[[], Any], target: float = 0.1) -> int:
+    """Returns the number of loops lasting about `target` seconds, a power of 10 like timeit."""
+    loops = 1
+    while True:
+        if time_loops(func, loops) >= target / 10 or loops >= 10 ** 6:
+            return loops
+        loops *= 10
+
+
+def time_loops(func: Callable[[], Any], loops: int) -> float:
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        return time.perf_counter() - start
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def measure(func: Callable[[], Any], loops: int, repeat: int) -> Dict[str, Any]:
+    """Returns the median and interquartile range of the time per loop in microseconds."""
+    # warmup: imports, caches and lazy initializations
+    time_loops(func, 1)
+    times = sorted(time_loops(func, loops) / loops * 1_000_000 for _ in range(repeat))
+    quartiles = statistics.quantiles(times, n=4) if repeat > 1 else [times[0]] * 3
+    return {'loops': loops, 'median_us': statistics.median(times), 'iqr_us': quartiles[2] - quartiles[0]}
+
+
+def round_significant(value: float, digits: int = 3) -> float:
+    return float(f'{value:.{digits}g}')
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    rng = random.Random(args.seed)
+    SetupTranslations(locales_dir=f'{locales_dir}')()
+    await Tortoise.init(db_url='sqlite://:memory:', modules=MODULES)
+    try:
+        # aiosqlite threads keep the process alive if connections are not closed, even on errors
+        snippets = await get_snippets(rng)
+    finally:
+        await Tortoise.close_connections()
+
+    results = {}
+    for name, func in get_benchmarks(rng, snippets):
+        if args.filter and not any(pattern in name for pattern in args.filter):
+            continue
+        loops = get_fixed_loops(name) if args.fixed else calibrate(func)
+        result = measure(func, loops, args.repeat)
+        if args.fixed:
+            result = {**result, 'median_us': round_significant(result['median_us']),
+                      'iqr_us': round_significant(result['iqr_us'])}
+        results[name] = result
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fixed', action='store_true', help='fixed loops and rounded times, for diffs')
+    parser.add_argument('--repeat', type=int, default=15, help='runs of each benchmark')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generated inputs')
+    parser.add_argument('--filter', nargs='*', help='only run benchmarks containing one of these strings')
+    parser.add_argument('--json', action='store_true', help='print results as json')
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    if args.json:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print()
+        return
+    print(f'{"benchmark":<36} {"median µs":>12} {"iqr µs":>10} {"loops":>8}')
+    for name in sorted(results):
+        result = results[name]
+        print(f'{name:<36} {result["median_us"]:>12.6g} {result["iqr_us"]:>10.3g} {result["loops"]:>8}')
+
+
+if __name__ == '__main__':
+    main()
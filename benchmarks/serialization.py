@@ -0,0 +1,97 @@
+"""
+Per-row cost of serializing snippets. The former path encoded the dicts with jsonable_encoder, validated them against
+the response model and encoded them again with ORJSONResponse, the current one encodes them in a single orjson pass.
+
+    python -m benchmarks.serialization --rows 1 10 100 1000
+"""
+import argparse
+import asyncio
+import time
+from typing import Callable, List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+from fastapi.routing import serialize_response
+from tortoise import Tortoise
+
+from pastebin.main import app
+from pastebin.snippets.contents import add_references, create_contents, get_code_hash
+from pastebin.snippets.models import Language, Snippet, Style
+from pastebin.snippets.schemas import SNIPPET_FIELDS
+from pastebin.snippets.views import get_snippet_info_to_display, snippet_json_response
+from pastebin.users.models import User
+
+CODE = 'def hello(name):\n    return f"hello {name}"\n'
+
+
+async def create_dataset(rows: int) -> List[Snippet]:
+    await Tortoise.generate_schemas()
+    language = await Language.create(name='python')
+    style = await Style.create(name='monokai')
+    user = await User.create(
+        firstname='bench', lastname='mark', pseudo='bench', password_hash='x', email='bench@example.com'
+    )
+    codes = [f'{CODE}# {index}\n' for index in range(rows)]
+    contents = await create_contents(codes)
+    snippets = []
+    for index, code in enumerate(codes):
+        snippet = Snippet(title=f'snippet {index}', language=language, style=style, user=user)
+        snippet.content = contents[get_code_hash(code)]
+        snippets.append(snippet)
+    await add_references(contents.values())
+    await Snippet.bulk_create(snippets)
+    # the list endpoint fetches snippets the same way
+    return await Snippet.all().prefetch_related('language', 'style', 'content').order_by('created_at', 'id')
+
+
+def get_list_route_field():
+    for route in app.routes:
+        if getattr(route, 'path', None) == '/snippets/' and 'GET' in getattr(route, 'methods', ()):
+            return route.response_field
+    raise LookupError('snippet list route not found')
+
+
+async def before(snippets: List[Snippet]) -> bytes:
+    content = jsonable_encoder([get_snippet_info_to_display(snippet, SNIPPET_FIELDS) for snippet in snippets])
+    content = await serialize_response(field=get_list_route_field(), response_content=content, exclude_unset=True)
+    return ORJSONResponse(content).body
+
+
+async def after(snippets: List[Snippet]) -> bytes:
+    return snippet_json_response([get_snippet_info_to_display(snippet, SNIPPET_FIELDS) for snippet in snippets]).body
+
+
+async def measure(path: Callable, snippets: List[Snippet], repeat: int) -> float:
+    """Returns the best time per row in microseconds among `repeat` runs."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await path(snippets)
+        best = min(best, time.perf_counter() - start)
+    return best / len(snippets) * 1_000_000
+
+
+async def main(rows: List[int], repeat: int) -> None:
+    await Tortoise.init(
+        db_url='sqlite://:memory:', modules={'pastebin': ['pastebin.users.models', 'pastebin.snippets.models']}
+    )
+    try:
+        # aiosqlite threads keep the process alive if connections are not closed, even on errors
+        snippets = await create_dataset(max(rows))
+        print(f'{"rows":>6} {"before µs/row":>14} {"after µs/row":>13} {"speedup":>8}')
+        for count in rows:
+            page = snippets[:count]
+            assert await before(page) == await after(page)
+            before_time = await measure(before, page, repeat)
+            after_time = await measure(after, page, repeat)
+            print(f'{count:>6} {before_time:>14.2f} {after_time:>13.2f} {before_time / after_time:>7.1f}x')
+    finally:
+        await Tortoise.close_connections()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1, 10, 100, 1000], help='page sizes to measure')
+    parser.add_argument('--repeat', type=int, default=20, help='runs per page size, the best one is kept')
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
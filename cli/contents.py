@@ -0,0 +1,78 @@
+"""Move of snippet codes from the legacy code column of the snippet table to deduplicated snippet contents."""
+from typing import Set
+
+from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.transactions import in_transaction
+
+from pastebin.snippets.contents import add_references, create_contents, get_code_hash
+from pastebin.snippets.models import SnippetContent
+from .transfer import Progress
+
+COLUMNS_QUERIES = {
+    'sqlite': "SELECT name AS column_name FROM pragma_table_info('snippet')",
+    'mysql': "SELECT column_name AS column_name FROM information_schema.columns"
+             " WHERE table_schema = DATABASE() AND table_name = 'snippet'",
+    'postgres': "SELECT column_name FROM information_schema.columns"
+                " WHERE table_schema = current_schema() AND table_name = 'snippet'"
+}
+
+# nullable until all the codes are moved
+ADD_CONTENT_COLUMN_QUERIES = {
+    'sqlite': 'ALTER TABLE "snippet" ADD COLUMN "content_id" VARCHAR(64)'
+              ' REFERENCES "snippet_content" ("hash") ON DELETE RESTRICT',
+    'mysql': 'ALTER TABLE `snippet` ADD COLUMN `content_id` VARCHAR(64), ADD CONSTRAINT `fk_snippet_snippet_content`'
+             ' FOREIGN KEY (`content_id`) REFERENCES `snippet_content` (`hash`) ON DELETE RESTRICT',
+    'postgres': 'ALTER TABLE "snippet" ADD COLUMN "content_id" VARCHAR(64)'
+                ' REFERENCES "snippet_content" ("hash") ON DELETE RESTRICT'
+}
+
+QUOTES = {'sqlite': '"', 'mysql': '`', 'postgres': '"'}
+PLACEHOLDERS = {'sqlite': ('?', '?'), 'mysql': ('%s', '%s'), 'postgres': ('$1', '$2')}
+
+
+async def get_snippet_columns(connection: BaseDBAsyncClient) -> Set[str]:
+    _, rows = await connection.execute_query(COLUMNS_QUERIES[connection.capabilities.dialect])
+    return {row['column_name'] for row in rows}
+
+
+async def move_codes(batch_size: int, progress: Progress, connection: BaseDBAsyncClient = None) -> int:
+    """
+    Creates the snippet_content table and the content_id column if needed, then moves codes `batch_size` snippets
+    per transaction and finally drops the code column. It can be run again if interrupted.
+    Returns the number of moved codes.
+    """
+    connection = Tortoise.get_connection('default') if connection is None else connection
+    dialect = connection.capabilities.dialect
+    columns = await get_snippet_columns(connection)
+    if 'code' not in columns:
+        return 0
+
+    # only creates missing tables
+    await Tortoise.generate_schemas(safe=True)
+    if 'content_id' not in columns:
+        await connection.execute_script(ADD_CONTENT_COLUMN_QUERIES[dialect])
+
+    q = QUOTES[dialect]
+    select_query = f'SELECT {q}id{q}, {q}code{q} FROM {q}snippet{q} WHERE {q}content_id{q} IS NULL LIMIT {batch_size}'
+    update_query = 'UPDATE {q}snippet{q} SET {q}content_id{q} = {} WHERE {q}id{q} = {}'.format(
+        *PLACEHOLDERS[dialect], q=q
+    )
+    # codes may have been compressed in the code column, contents use the same format
+    code_field = SnippetContent._meta.fields_map['code']
+    moved = 0
+    while True:
+        _, rows = await connection.execute_query(select_query)
+        if not rows:
+            break
+        codes = [str(code_field.to_python_value(row['code'])) for row in rows]
+        hashes = [get_code_hash(code) for code in codes]
+        contents = await create_contents(codes)
+        async with in_transaction('default') as transaction:
+            await add_references(contents[hash_] for hash_ in hashes)
+            await transaction.execute_many(update_query, [[hash_, row['id']] for hash_, row in zip(hashes, rows)])
+        moved += len(rows)
+        progress.add(len(rows))
+
+    await connection.execute_script(f'ALTER TABLE {q}snippet{q} DROP COLUMN {q}code{q}')
+    return moved
@@ -1,13 +1,24 @@
+import time
+from pathlib import Path
+from typing import Iterable, Optional, Tuple, Type, Union
+
 import anyio
 import click
 from pygments.lexers import get_all_lexers
 from pygments.styles import get_all_styles
 from tortoise import Tortoise
 from tortoise.exceptions import IntegrityError
+from tortoise.transactions import in_transaction
 
-from pastebin.config import TORTOISE_ORM
+from pastebin.config import TORTOISE_ORM, settings
+from pastebin.snippets.contents import sweep_contents
+from pastebin.snippets.indexes import create_name_indexes, deduplicate_names
 from pastebin.snippets.models import Language, Style
 from pastebin.users.models import User
+from .contents import move_codes
+from .search import rebuild_search_index
+from .transfer import Checkpoint, Progress, export_snippets, import_snippets
+from .uuids import convert_uuids
 
 
 @click.group()
@@ -15,40 +26,65 @@ def cli():
     """Pastebin CLI manager"""
 
 
-@cli.command('add-lang-to-db')
-def add_languages_to_db():
-    """Add pygments languages in the database."""
+async def upsert_names(model_class: Type[Union[Language, Style]], names: Iterable[str]) -> Tuple[int, int]:
+    """
+    Inserts rows whose name is missing in a single transaction, existing rows are left as is.
+    Names are compared case-insensitively. Returns the number of inserted and already existing rows.
+    """
+    async with in_transaction('default'):
+        existing_names = {name.casefold() for name in await model_class.all().values_list('name', flat=True)}
+        missing = {}
+        for name in names:
+            if name.casefold() not in existing_names:
+                missing.setdefault(name.casefold(), name)
+        await model_class.bulk_create([model_class(name=name) for name in missing.values()])
+    return len(missing), len(existing_names)
 
-    async def insert_language(language: str) -> None:
-        await Language.create(name=language)
 
-    async def add_languages() -> None:
+def seed_table(model_class: Type[Union[Language, Style]], names: Iterable[str], label: str) -> None:
+    async def seed() -> Tuple[int, int]:
         await Tortoise.init(config=TORTOISE_ORM)
-        async with anyio.create_task_group() as tg:
-            for item in get_all_lexers():
-                tg.start_soon(insert_language, item[0])
-        await Tortoise.close_connections()
+        try:
+            return await upsert_names(model_class, names)
+        finally:
+            await Tortoise.close_connections()
 
-    anyio.run(add_languages)
-    click.secho('languages inserted!', fg='green')
+    start = time.perf_counter()
+    inserted, existing = anyio.run(seed)
+    elapsed = time.perf_counter() - start
+    click.secho(f'{inserted} {label} inserted, {existing} already present ({elapsed:.2f}s)', fg='green')
+
+
+@cli.command('add-lang-to-db')
+def add_languages_to_db():
+    """Add pygments languages in the database. Languages already present are left untouched."""
+    seed_table(Language, (item[0] for item in get_all_lexers()), 'languages')
 
 
 @cli.command('add-styles-to-db')
 def add_styles_to_db():
-    """Add pygments styles in the database."""
+    """Add pygments styles in the database. Styles already present are left untouched."""
+    seed_table(Style, get_all_styles(), 'styles')
 
-    async def insert_style(style: str) -> None:
-        await Style.create(name=style)
 
-    async def add_styles() -> None:
+@cli.command('create-indexes')
+def create_indexes():
+    """
+    Creates case-insensitive unique indexes on language and style names, merging duplicate names first.
+    The migration does it for SQLite, use this command for MySQL and PostgreSQL databases.
+    """
+
+    async def create() -> int:
         await Tortoise.init(config=TORTOISE_ORM)
-        async with anyio.create_task_group() as tg:
-            for style in get_all_styles():
-                tg.start_soon(insert_style, style)
-        await Tortoise.close_connections()
+        try:
+            removed = await deduplicate_names(Language) + await deduplicate_names(Style)
+            await create_name_indexes()
+            return removed
+        finally:
+            await Tortoise.close_connections()
 
-    anyio.run(add_styles)
-    click.secho('styles inserted!', fg='green')
+    removed = anyio.run(create)
+    click.secho(f'indexes created! ({removed} duplicate names merged)', fg='green')
 
 
 @cli.command('add-admin-user')
@@ -73,3 +109,141 @@ def add_admin_user(firstname, lastname, email, password, pseudo):
 
     anyio.run(create_user, firstname, lastname, email, password, pseudo)
     click.secho(f'admin user {pseudo} created!', fg='green')
+
+
+def report_progress(message: str) -> None:
+    click.echo(message, err=True)
+
+
+@cli.command('export')
+@click.argument('file', type=click.File('wb'))
+@click.option('-c', '--chunk-size', type=click.IntRange(min=1), default=1000, show_default=True,
+              help='number of snippets fetched per query')
+def export(file, chunk_size):
+    """Exports snippets as json lines in FILE ("-" for the standard output)."""
+
+    async def export_to_file(progress: Progress) -> None:
+        await Tortoise.init(config=TORTOISE_ORM)
+        try:
+            await export_snippets(file, chunk_size, progress)
+        finally:
+            await Tortoise.close_connections()
+
+    progress = Progress(report_progress)
+    anyio.run(export_to_file, progress)
+    click.secho(f'exported {progress}', fg='green', err=True)
+
+
+@cli.command('import')
+@click.argument('file', type=click.File('rb'))
+@click.option('-b', '--batch-size', type=click.IntRange(min=1), default=500, show_default=True,
+              help='number of snippets inserted per transaction')
+@click.option('-w', '--workers', type=click.IntRange(min=1), default=4, show_default=True,
+              help='number of batches inserted concurrently')
+@click.option('-C', '--checkpoint', type=click.Path(dir_okay=False, path_type=Path),
+              help='file recording imported batches, an interrupted import run again with it resumes where it stopped')
+def import_(file, batch_size, workers, checkpoint: Optional[Path]):
+    """
+    Imports snippets from json lines in FILE ("-" for the standard input), as produced by the export command.
+    Users, languages and styles are matched by name and must exist in the database.
+    """
+
+    async def import_from_file(progress: Progress) -> None:
+        await Tortoise.init(config=TORTOISE_ORM)
+        try:
+            errors = await import_snippets(iter(file), batch_size, workers, batch_checkpoint, progress)
+        finally:
+            await Tortoise.close_connections()
+        for error in errors:
+            click.secho(error, fg='yellow', err=True)
+
+    try:
+        batch_checkpoint = Checkpoint(checkpoint, batch_size)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--checkpoint')
+
+    progress = Progress(report_progress)
+    anyio.run(import_from_file, progress)
+    click.secho(f'imported {progress}', fg='green', err=True)
+
+
+@cli.command('convert-uuids')
+@click.option('-b', '--batch-size', type=click.IntRange(min=1), default=1000, show_default=True,
+              help='number of keys converted per transaction')
+def convert_uuids_(batch_size):
+    """
+    Converts primary and foreign keys to 16 bytes values on MySQL and SQLite databases, to run before enabling the
+    BINARY_UUID setting. It can be run again if interrupted. PostgreSQL databases already use a native uuid type.
+    """
+
+    async def convert(progress: Progress) -> None:
+        await Tortoise.init(config=TORTOISE_ORM)
+        try:
+            await convert_uuids(batch_size, progress)
+        finally:
+            await Tortoise.close_connections()
+
+    progress = Progress(report_progress)
+    anyio.run(convert, progress)
+    click.secho(f'converted {progress}', fg='green', err=True)
+
+
+@cli.command('move-codes')
+@click.option('-b', '--batch-size', type=click.IntRange(min=1), default=500, show_default=True,
+              help='number of snippets moved per transaction')
+def move_codes_(batch_size):
+    """
+    Moves the codes of snippets created before their deduplication to the snippet_content table, compressing them
+    above the CODE_COMPRESSION_THRESHOLD setting, and drops the code column of the snippet table.
+    """
+
+    async def move(progress: Progress) -> None:
+        await Tortoise.init(config=TORTOISE_ORM)
+        try:
+            await move_codes(batch_size, progress)
+        finally:
+            await Tortoise.close_connections()
+
+    progress = Progress(report_progress)
+    anyio.run(move, progress)
+    click.secho(f'moved {progress}', fg='green', err=True)
+
+
+@cli.command('sweep-contents')
+@click.option('-g', '--grace', type=click.IntRange(min=0), default=settings.content_sweep_grace_seconds,
+              show_default=True, help='age in seconds under which unreferenced contents are kept')
+@click.option('-b', '--batch-size', type=click.IntRange(min=1), default=500, show_default=True,
+              help='number of contents checked per query')
+def sweep_contents_(grace, batch_size):
+    """Deletes snippet contents no longer referenced by any snippet."""
+
+    async def sweep() -> int:
+        await Tortoise.init(config=TORTOISE_ORM)
+        try:
+            return await sweep_contents(grace, batch_size)
+        finally:
+            await Tortoise.close_connections()
+
+    deleted = anyio.run(sweep)
+    click.secho(f'{deleted} contents deleted', fg='green')
+
+
+@cli.command('rebuild-search-index')
+@click.option('-b', '--batch-size', type=click.IntRange(min=1), default=500, show_default=True,
+              help='number of snippets indexed per query')
+def rebuild_search_index_(batch_size):
+    """
+    Creates the full-text search index of snippets, or recreates it from scratch. The migration creates it for
+    SQLite, use this command for MySQL and PostgreSQL databases and for snippets created before the index.
+    """
+
+    async def rebuild(progress: Progress) -> None:
+        await Tortoise.init(config=TORTOISE_ORM)
+        try:
+            await rebuild_search_index(batch_size, progress)
+        finally:
+            await Tortoise.close_connections()
+
+    progress = Progress(report_progress)
+    anyio.run(rebuild, progress)
+    click.secho(f'indexed {progress}', fg='green', err=True)
@@ -0,0 +1,30 @@
+"""Rebuild of the full-text search index of snippets."""
+from typing import List, Tuple
+
+from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+from pastebin.snippets.export import iter_snippet_rows
+from pastebin.snippets.search import create_search_table, drop_search_table, insert_documents
+from .transfer import Progress
+
+SEARCH_FIELDS = {'id': 'id', 'title': 'title', 'content_id': 'content_id', 'code': 'content__code'}
+
+
+async def rebuild_search_index(batch_size: int, progress: Progress, connection: BaseDBAsyncClient = None) -> None:
+    """
+    Recreates the snippet_search table and indexes all the snippets, `batch_size` per query. Snippets written
+    meanwhile may be missed, the command is better run while the API does not accept writes.
+    """
+    connection = Tortoise.get_connection('default') if connection is None else connection
+    await drop_search_table(connection)
+    await create_search_table(connection)
+    rows: List[Tuple[str, str, str, str]] = []
+    async for row in iter_snippet_rows({}, batch_size, SEARCH_FIELDS):
+        rows.append((str(row['id']), row['title'], row['content_id'], row['code']))
+        if len(rows) == batch_size:
+            await insert_documents(connection, rows)
+            progress.add(len(rows))
+            rows = []
+    await insert_documents(connection, rows)
+    progress.add(len(rows))
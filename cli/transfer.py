@@ -0,0 +1,173 @@
+"""Export and import of snippets as JSON lines, used to move data between databases."""
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, IO, Iterator, List, Optional, Set, Tuple
+
+import anyio
+import orjson
+from anyio.streams.memory import MemoryObjectReceiveStream
+from tortoise.transactions import in_transaction
+
+from pastebin.snippets import catalogue
+from pastebin.snippets.contents import add_references, create_contents, get_code_hash
+from pastebin.snippets.export import iter_snippet_rows
+from pastebin.snippets.models import Snippet
+from pastebin.snippets.search import index_snippets
+from pastebin.users.models import User
+
+# related objects are exported by name since their ids differ from a database to another
+TRANSFER_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'code': 'content__code',
+    'print_line_number': 'print_line_number',
+    'language': 'language__name',
+    'style': 'style__name',
+    'user': 'user__pseudo',
+    'created_at': 'created_at'
+}
+
+
+class Progress:
+    """Reports the number of processed rows and the throughput at most every `interval` seconds."""
+
+    def __init__(self, report: Callable[[str], None], interval: float = 1.0):
+        self.report = report
+        self.interval = interval
+        self.rows = 0
+        self.start = time.perf_counter()
+        self._last_report = self.start
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def __str__(self) -> str:
+        elapsed = self.elapsed
+        rate = self.rows / elapsed if elapsed else 0.0
+        return f'{self.rows} rows in {elapsed:.1f}s ({rate:.0f} rows/s)'
+
+    def add(self, rows: int) -> None:
+        self.rows += rows
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            self.report(str(self))
+
+
+async def export_snippets(file: IO[bytes], chunk_size: int, progress: Progress) -> None:
+    async for row in iter_snippet_rows({}, chunk_size, TRANSFER_FIELDS):
+        file.write(orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE))
+        progress.add(1)
+
+
+class Checkpoint:
+    """
+    Indexes of the batches already imported, saved in a json file after each batch so that an interrupted import
+    can be resumed. Batches complete out of order because of concurrent workers, hence a set and not a position.
+    """
+
+    def __init__(self, path: Optional[Path], batch_size: int):
+        self.path = path
+        self.batch_size = batch_size
+        self.done: Set[int] = set()
+        if path is not None and path.exists():
+            data = json.loads(path.read_text())
+            if data['batch_size'] != batch_size:
+                raise ValueError(f'checkpoint {path} was created with a batch size of {data["batch_size"]}')
+            self.done = set(data['done'])
+
+    def add(self, index: int) -> None:
+        self.done.add(index)
+        if self.path is not None:
+            tmp_path = self.path.with_suffix('.tmp')
+            tmp_path.write_text(json.dumps({'batch_size': self.batch_size, 'done': sorted(self.done)}))
+            tmp_path.replace(self.path)
+
+
+def iter_batches(lines: Iterator[bytes], batch_size: int) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+    batch: List[Dict[str, Any]] = []
+    index = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        batch.append(orjson.loads(line))
+        if len(batch) == batch_size:
+            yield index, batch
+            index += 1
+            batch = []
+    if batch:
+        yield index, batch
+
+
+async def import_batch(rows: List[Dict[str, Any]]) -> Tuple[int, List[str]]:
+    """
+    Inserts rows in a single transaction. Returns the number of inserted rows and the errors of skipped ones.
+    Rows already in the database are skipped: a batch committed just before the import was stopped is not recorded in
+    the checkpoint and comes again when the import is resumed.
+    """
+    existing_ids = await Snippet.filter(id__in=[row['id'] for row in rows]).values_list('id', flat=True)
+    existing_ids = {str(pk) for pk in existing_ids}
+    rows = [row for row in rows if row['id'] not in existing_ids]
+    pseudos = {row['user'] for row in rows}
+    users = {user.pseudo: user for user in await User.filter(pseudo__in=pseudos)}
+    snippets = []
+    codes = []
+    errors = []
+    for row in rows:
+        language = await catalogue.languages.get(row['language'])
+        style = await catalogue.styles.get(row['style'])
+        user = users.get(row['user'])
+        if language is None or style is None or user is None:
+            errors.append(
+                f'snippet {row["id"]} skipped: unknown language {row["language"]}, style {row["style"]}'
+                f' or user {row["user"]}'
+            )
+            continue
+        snippets.append(Snippet(
+            id=row['id'],
+            title=row['title'],
+            print_line_number=row['print_line_number'],
+            language=language,
+            style=style,
+            user=user,
+            created_at=datetime.fromisoformat(row['created_at'])
+        ))
+        codes.append(row['code'])
+
+    contents = await create_contents(codes)
+    for snippet, code in zip(snippets, codes):
+        snippet.content = contents[get_code_hash(code)]
+    async with in_transaction('default'):
+        await add_references(snippet.content for snippet in snippets)
+        await Snippet.bulk_create(snippets)
+        await index_snippets(snippets)
+    return len(snippets), errors
+
+
+async def import_snippets(
+        lines: Iterator[bytes], batch_size: int, workers: int, checkpoint: Checkpoint, progress: Progress
+) -> List[str]:
+    """Imports batches of rows with concurrent workers. Returns the errors of skipped rows."""
+    errors: List[str] = []
+    send_stream, receive_stream = anyio.create_memory_object_stream(max_buffer_size=workers)
+
+    async def worker(batches: MemoryObjectReceiveStream) -> None:
+        async with batches:
+            async for index, batch in batches:
+                inserted, batch_errors = await import_batch(batch)
+                errors.extend(batch_errors)
+                checkpoint.add(index)
+                progress.add(inserted)
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(workers):
+            tg.start_soon(worker, receive_stream.clone())
+        async with send_stream, receive_stream:
+            for index, batch in iter_batches(lines, batch_size):
+                if index not in checkpoint.done:
+                    await send_stream.send((index, batch))
+
+    return errors
@@ -0,0 +1,83 @@
+"""
+Conversion of primary and foreign keys from 36 characters strings to 16 bytes, needed before enabling the
+binary_uuid setting on an existing MySQL or SQLite database. PostgreSQL already stores them in a native uuid column.
+"""
+from typing import Tuple
+from uuid import UUID
+
+from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.transactions import in_transaction
+
+from .transfer import Progress
+
+# parent keys come first, but the order does not matter since foreign key checks are disabled during the conversion
+UUID_COLUMNS: Tuple[Tuple[str, str], ...] = (
+    ('user', 'id'),
+    ('language', 'id'),
+    ('style', 'id'),
+    ('snippet', 'id'),
+    ('snippet', 'user_id'),
+    ('snippet', 'language_id'),
+    ('snippet', 'style_id'),
+)
+
+
+async def convert_column(table: str, column: str, batch_size: int, progress: Progress) -> int:
+    """
+    Converts values of a column still stored as strings, `batch_size` rows per transaction so that the table is never
+    locked for long. Converted values are 16 bytes long, so an interrupted conversion can be run again.
+    Returns the number of converted values.
+    """
+    dialect = Tortoise.get_connection('default').capabilities.dialect
+    quote, placeholder = ('`', '%s') if dialect == 'mysql' else ('"', '?')
+    table, column = f'{quote}{table}{quote}', f'{quote}{column}{quote}'
+    select_query = f'SELECT DISTINCT {column} AS value FROM {table} WHERE LENGTH({column}) = 36 LIMIT {batch_size}'
+    update_query = f'UPDATE {table} SET {column} = {placeholder} WHERE {column} = {placeholder}'
+    converted = 0
+    while True:
+        async with in_transaction('default') as connection:
+            if dialect == 'mysql':
+                # the setting belongs to the session and each transaction may use another connection of the pool
+                await connection.execute_script('SET FOREIGN_KEY_CHECKS=0')
+            _, rows = await connection.execute_query(select_query)
+            values = [row['value'] for row in rows]
+            if not values:
+                return converted
+            # MySQL returns the binary strings as bytes
+            await connection.execute_many(update_query, [
+                [UUID(value.decode() if isinstance(value, bytes) else value).bytes, value] for value in values
+            ])
+        converted += len(values)
+        progress.add(len(values))
+
+
+async def convert_uuids(batch_size: int, progress: Progress, connection: BaseDBAsyncClient = None) -> int:
+    """Converts all uuid columns in place. Returns the number of converted values, always 0 on PostgreSQL."""
+    connection = Tortoise.get_connection('default') if connection is None else connection
+    dialect = connection.capabilities.dialect
+    if dialect == 'postgres':
+        return 0
+
+    if dialect == 'mysql':
+        # a utf8 CHAR column cannot hold arbitrary bytes, binary strings of the same length are used during the batches
+        await connection.execute_script('SET FOREIGN_KEY_CHECKS=0; ' + ' '.join(
+            f'ALTER TABLE `{table}` MODIFY `{column}` VARBINARY(36) NOT NULL;' for table, column in UUID_COLUMNS
+        ))
+    else:
+        # SQLite cannot change a column type, but its columns accept blobs whatever their declared type
+        await connection.execute_script('PRAGMA foreign_keys=OFF')
+
+    try:
+        converted = 0
+        for table, column in UUID_COLUMNS:
+            converted += await convert_column(table, column, batch_size, progress)
+    finally:
+        if dialect == 'sqlite':
+            await connection.execute_script('PRAGMA foreign_keys=ON')
+
+    if dialect == 'mysql':
+        await connection.execute_script('SET FOREIGN_KEY_CHECKS=0; ' + ' '.join(
+            f'ALTER TABLE `{table}` MODIFY `{column}` BINARY(16) NOT NULL;' for table, column in UUID_COLUMNS
+        ) + ' SET FOREIGN_KEY_CHECKS=1;')
+    return converted
@@ -0,0 +1,26 @@
+-- upgrade --
+UPDATE "snippet" SET "language_id" = (
+    SELECT MIN("l"."id") FROM "language" AS "l"
+    WHERE UPPER(CAST("l"."name" AS VARCHAR)) = (
+        SELECT UPPER(CAST("name" AS VARCHAR)) FROM "language" WHERE "id" = "snippet"."language_id"
+    )
+);
+DELETE FROM "language" WHERE "id" NOT IN (SELECT MIN("id") FROM "language" GROUP BY UPPER(CAST("name" AS VARCHAR)));
+UPDATE "snippet" SET "style_id" = (
+    SELECT MIN("s"."id") FROM "style" AS "s"
+    WHERE UPPER(CAST("s"."name" AS VARCHAR)) = (
+        SELECT UPPER(CAST("name" AS VARCHAR)) FROM "style" WHERE "id" = "snippet"."style_id"
+    )
+);
+DELETE FROM "style" WHERE "id" NOT IN (SELECT MIN("id") FROM "style" GROUP BY UPPER(CAST("name" AS VARCHAR)));
+CREATE UNIQUE INDEX IF NOT EXISTS "uidx_language_name" ON "language" (UPPER(CAST("name" AS VARCHAR)));
+CREATE UNIQUE INDEX IF NOT EXISTS "uidx_style_name" ON "style" (UPPER(CAST("name" AS VARCHAR)));
+CREATE INDEX IF NOT EXISTS "idx_user_created_5e2aef" ON "user" ("created_at", "id");
+CREATE INDEX IF NOT EXISTS "idx_snippet_user_id_c3c58f" ON "snippet" ("user_id", "created_at", "id");
+CREATE INDEX IF NOT EXISTS "idx_snippet_created_329d33" ON "snippet" ("created_at", "id");
+-- downgrade --
+DROP INDEX IF EXISTS "uidx_language_name";
+DROP INDEX IF EXISTS "uidx_style_name";
+DROP INDEX IF EXISTS "idx_user_created_5e2aef";
+DROP INDEX IF EXISTS "idx_snippet_user_id_c3c58f";
+DROP INDEX IF EXISTS "idx_snippet_created_329d33";
@@ -0,0 +1,4 @@
+-- upgrade --
+CREATE VIRTUAL TABLE IF NOT EXISTS "snippet_search" USING fts5("snippet_id" UNINDEXED, "title", "code");
+-- downgrade --
+DROP TABLE IF EXISTS "snippet_search";
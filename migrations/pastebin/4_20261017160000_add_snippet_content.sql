@@ -0,0 +1,31 @@
+-- upgrade --
+CREATE TABLE IF NOT EXISTS "snippet_content" (
+    "hash" VARCHAR(64) NOT NULL  PRIMARY KEY,
+    "code" BLOB NOT NULL,
+    "refcount" INT NOT NULL  DEFAULT 0,
+    "created_at" TIMESTAMP NOT NULL  DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS "idx_snippet_con_refcoun_009ae9" ON "snippet_content" ("refcount", "created_at");
+-- SQLite cannot drop the NOT NULL constraint of the code column, the table is rebuilt with a nullable one.
+-- Codes of existing snippets are moved to snippet_content by "pastebin move-codes", which then drops the column.
+CREATE TABLE "snippet_new" (
+    "id" CHAR(36) NOT NULL  PRIMARY KEY,
+    "created_at" TIMESTAMP NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "updated_at" TIMESTAMP NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "title" VARCHAR(200) NOT NULL,
+    "code" TEXT,
+    "print_line_number" INT NOT NULL  DEFAULT 0,
+    "content_id" VARCHAR(64) REFERENCES "snippet_content" ("hash") ON DELETE RESTRICT,
+    "language_id" CHAR(36) NOT NULL REFERENCES "language" ("id") ON DELETE CASCADE,
+    "style_id" CHAR(36) NOT NULL REFERENCES "style" ("id") ON DELETE CASCADE,
+    "user_id" CHAR(36) NOT NULL REFERENCES "user" ("id") ON DELETE CASCADE
+);
+INSERT INTO "snippet_new" ("id", "created_at", "updated_at", "title", "code", "print_line_number", "language_id", "style_id", "user_id")
+SELECT "id", "created_at", "updated_at", "title", "code", "print_line_number", "language_id", "style_id", "user_id" FROM "snippet";
+DROP TABLE "snippet";
+ALTER TABLE "snippet_new" RENAME TO "snippet";
+CREATE INDEX IF NOT EXISTS "idx_snippet_user_id_c3c58f" ON "snippet" ("user_id", "created_at", "id");
+CREATE INDEX IF NOT EXISTS "idx_snippet_created_329d33" ON "snippet" ("created_at", "id");
+-- downgrade --
+-- codes already moved to snippet_content may be compressed, they cannot be restored in SQL
+DROP INDEX IF EXISTS "idx_snippet_con_refcoun_009ae9";
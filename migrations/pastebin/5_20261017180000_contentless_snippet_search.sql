@@ -0,0 +1,15 @@
+-- upgrade --
+-- the index no longer keeps a copy of the codes, run "pastebin rebuild-search-index" to index existing snippets
+DROP TABLE IF EXISTS "snippet_search";
+CREATE TABLE IF NOT EXISTS "snippet_search_document" (
+    "id" INTEGER NOT NULL PRIMARY KEY,
+    "snippet_id" VARCHAR(36) NOT NULL UNIQUE,
+    "title" VARCHAR(200) NOT NULL,
+    "content_id" VARCHAR(64) NOT NULL,
+    "code_size" INT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS "snippet_search" USING fts5("title", "code", content='');
+-- downgrade --
+DROP TABLE IF EXISTS "snippet_search";
+DROP TABLE IF EXISTS "snippet_search_document";
+CREATE VIRTUAL TABLE IF NOT EXISTS "snippet_search" USING fts5("snippet_id" UNINDEXED, "title", "code");
@@ -1,9 +1,14 @@
 """This module contains abstract base classes for the project."""
 from tortoise import Model, fields
 
+from .config import settings
+from .fields import BinaryUUIDField
+
+uuid_field_class = BinaryUUIDField if settings.binary_uuid else fields.UUIDField
+
 
 class AbstractModel(Model):
-    id = fields.UUIDField(pk=True)
+    id = uuid_field_class(pk=True)
     created_at = fields.DatetimeField(auto_now_add=True)
     updated_at = fields.DatetimeField(auto_now=True)
 
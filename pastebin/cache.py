@@ -0,0 +1,158 @@
+"""This module contains in-memory caches used by the project."""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Set, Tuple
+
+
+class LRUCache:
+    """
+    Least recently used cache of bytes values bounded by the total size of its values.
+    Each entry can be associated to a tag so that all entries related to the same object can be dropped at once.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: 'OrderedDict[Hashable, Tuple[bytes, Any]]' = OrderedDict()
+        self._tags: Dict[Any, Set[Hashable]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable, count_miss: bool = True) -> Optional[bytes]:
+        """Returns the value of key, count_miss is False for a lookup falling back on another key when it misses."""
+        entry = self._entries.get(key)
+        if entry is None:
+            if count_miss:
+                self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def set(self, key: Hashable, value: bytes, tag: Any = None) -> None:
+        self.delete(key)
+        # a value bigger than the whole budget would evict everything and still not fit
+        if len(value) > self.max_bytes:
+            return
+
+        while self._entries and self.size + len(value) > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self.delete(oldest_key)
+            self.evictions += 1
+
+        self._entries[key] = (value, tag)
+        self.size += len(value)
+        if tag is not None:
+            self._tags.setdefault(tag, set()).add(key)
+
+    def delete(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+
+        value, tag = entry
+        self.size -= len(value)
+        if tag is not None:
+            keys = self._tags[tag]
+            keys.discard(key)
+            if not keys:
+                del self._tags[tag]
+
+    def invalidate_tag(self, tag: Any) -> None:
+        for key in list(self._tags.get(tag, ())):
+            self.delete(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._tags.clear()
+        self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes
+        }
+
+
+class PrincipalCache:
+    """
+    Cache of authenticated users keyed by access token.
+    An entry lives at most `ttl` seconds and never beyond the token expiration. All the entries of a user can be
+    dropped at once when its pseudo or its rights change.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: Dict[str, Tuple[Any, float]] = {}
+        self._tokens: Dict[Any, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, token: str) -> Any:
+        entry = self._entries.get(token)
+        if entry is None or entry[1] <= time.time():
+            if entry is not None:
+                self.delete(token)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return entry[0]
+
+    def set(self, token: str, user: Any, token_expiration: float) -> None:
+        if self.ttl <= 0:
+            return
+
+        self.delete(token)
+        if len(self._entries) >= self.max_entries:
+            self._purge()
+        self._entries[token] = (user, min(time.time() + self.ttl, token_expiration))
+        self._tokens.setdefault(user.pk, set()).add(token)
+
+    def delete(self, token: str) -> None:
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+
+        user_id = entry[0].pk
+        tokens = self._tokens[user_id]
+        tokens.discard(token)
+        if not tokens:
+            del self._tokens[user_id]
+
+    def _purge(self) -> None:
+        now = time.time()
+        for token in [token for token, (_, expires_at) in self._entries.items() if expires_at <= now]:
+            self.delete(token)
+        # dicts keep insertion order so the first entries are the oldest ones
+        while len(self._entries) >= self.max_entries:
+            self.delete(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate_user(self, user_id: Any) -> None:
+        for token in list(self._tokens.get(user_id, ())):
+            self.delete(token)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._tokens.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'entries': len(self._entries)}
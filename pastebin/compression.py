@@ -0,0 +1,160 @@
+"""Negotiated compression of responses with gzip, or brotli when it is installed."""
+import zlib
+from typing import Callable, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import settings
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# by order of preference when the client accepts several of them with the same quality
+ENCODINGS: Tuple[str, ...] = ('gzip',) if brotli is None else ('br', 'gzip')
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Returns the best encoding accepted by the client given an Accept-Encoding header, None for no compression."""
+    qualities = {}
+    for item in accept_encoding.split(','):
+        name, _, parameters = item.partition(';')
+        quality = 1.0
+        for parameter in parameters.split(';'):
+            key, _, value = parameter.partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip().lower()] = quality
+
+    best_encoding, best_quality = None, 0.0
+    for encoding in ENCODINGS:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best_encoding, best_quality = encoding, quality
+    return best_encoding
+
+
+def encode_etag(etag: str, encoding: str) -> str:
+    """
+    Returns the ETag of the representation compressed with the given encoding, it must differ from the plain one.
+    Unquoted ETags, like the ones of static files, are left alone since their handlers compare them as is.
+    """
+    if len(etag) < 2 or not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def decode_etag(etag: str) -> str:
+    """Returns the ETag of the plain representation given the one of a compressed representation."""
+    # brotli may be installed on another worker than the one answering the conditional request
+    for encoding in ('br', 'gzip'):
+        suffix = f'-{encoding}"'
+        if etag.endswith(suffix):
+            return f'{etag[:-len(suffix)]}"'
+    return etag
+
+
+def get_compressor(encoding: str) -> Tuple[Callable[[bytes], bytes], Callable[[], bytes]]:
+    """Returns the compress and flush functions of a new compression stream."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=settings.compression_brotli_quality)
+        return compressor.process, compressor.finish
+    # wbits=31 produces a gzip container instead of a raw zlib stream
+    compressor = zlib.compressobj(settings.compression_gzip_level, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    compress_chunk, flush = get_compressor(encoding)
+    return compress_chunk(data) + flush()
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses of at least `minimum_size` bytes with the best encoding accepted by the client. Responses
+    already having a Content-Encoding header, like precompressed cache entries, are sent as is.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] == 'http':
+            encoding = choose_encoding(Headers(scope=scope).get('accept-encoding', ''))
+            if encoding is not None:
+                await CompressionResponder(self.app, self.minimum_size, encoding)(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class CompressionResponder:
+    def __init__(self, app: ASGIApp, minimum_size: int, encoding: str):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encoding = encoding
+        self.send: Send = unattached_send
+        self.initial_message: Message = {}
+        self.started = False
+        self.passthrough = False
+        self.compress: Callable[[bytes], bytes] = lambda data: data
+        self.flush: Callable[[], bytes] = lambda: b''
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message) -> None:
+        if message['type'] == 'http.response.start':
+            # headers are sent with the first body chunk, once we know whether it is compressed
+            self.initial_message = message
+            self.passthrough = 'content-encoding' in Headers(raw=message['headers'])
+            return
+
+        if message['type'] != 'http.response.body' or self.passthrough:
+            if not self.started:
+                self.started = True
+                await self.send(self.initial_message)
+            await self.send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if not self.started:
+            self.started = True
+            if len(body) < self.minimum_size and not more_body:
+                self.passthrough = True
+                await self.send(self.initial_message)
+                await self.send(message)
+                return
+
+            self.compress, self.flush = get_compressor(self.encoding)
+            body = self.compress(body)
+            if not more_body:
+                body += self.flush()
+            headers = MutableHeaders(raw=self.initial_message['headers'])
+            headers['Content-Encoding'] = self.encoding
+            if 'etag' in headers:
+                headers['ETag'] = encode_etag(headers['etag'], self.encoding)
+            headers.add_vary_header('Accept-Encoding')
+            if more_body:
+                del headers['Content-Length']
+            else:
+                headers['Content-Length'] = str(len(body))
+            await self.send(self.initial_message)
+            await self.send({'type': 'http.response.body', 'body': body, 'more_body': more_body})
+            return
+
+        body = self.compress(body)
+        if not more_body:
+            body += self.flush()
+        await self.send({'type': 'http.response.body', 'body': body, 'more_body': more_body})
+
+
+async def unattached_send(message: Message) -> None:
+    raise RuntimeError('send awaitable not set')  # pragma: no cover
@@ -1,9 +1,10 @@
 import secrets
 from pathlib import Path
-from typing import Union
+from typing import Any, Dict, List, Union
 
 from fastapi.templating import Jinja2Templates
-from pydantic import BaseSettings, AnyUrl, PostgresDsn
+from pydantic import BaseSettings, AnyUrl, Field, PostgresDsn
+from tortoise.backends.base.config_generator import expand_db_url
 
 
 class MysqlDsn(AnyUrl):
@@ -33,12 +34,93 @@ class Settings(BaseSettings):
     secret_key: str = secrets.token_urlsafe(32)
     jwt_algorithm: str = 'HS256'
     jwt_token_expire_seconds: int = 30 * 60
+    catalogue_refresh_seconds: int = 60
+    highlight_cache_max_bytes: int = 64 * 1024 * 1024
+    highlight_workers: int = 2
+    highlight_max_pending: int = 64
+    highlight_timeout_seconds: float = 5
+    highlight_max_code_size: int = 1024 * 1024
+    bcrypt_workers: int = 4
+    # a cached user is still checked by primary key on each request, changes made by other workers apply at once
+    principal_cache_seconds: int = 60
+    principal_cache_max_entries: int = 10_000
+    export_chunk_size: int = 500
+    snippet_batch_max_size: int = 1000
+    # primary and foreign keys are stored in 16 bytes, use the convert-uuids command to migrate existing data
+    binary_uuid: bool = False
+    # snippet codes of at least this size in bytes are compressed in the database
+    code_compression_threshold: int = 1024
+    code_compression_level: int = 6
+    # unreferenced snippet contents younger than this are kept, snippets may be about to reference them
+    content_sweep_grace_seconds: int = 3600
+    # only the beginning of longer codes is indexed for search, postgres rejects tsvectors bigger than 1MB
+    search_max_code_size: int = 100_000
+    # responses smaller than this are not compressed
+    compression_minimum_size: int = 500
+    compression_gzip_level: int = 6
+    # used when the optional brotli package is installed
+    compression_brotli_quality: int = 4
+    # connection pools of postgres and mysql, sqlite uses a single connection
+    db_pool_min_size: int = 1
+    db_pool_max_size: int = 10
+    # seconds to wait for a new connection
+    db_connect_timeout: float = 10
+    # mysql connections older than this are recycled, -1 keeps them forever
+    db_pool_recycle_seconds: int = 3600
+    # postgres connections idle for this long are closed, 0 keeps them forever
+    db_pool_max_inactive_seconds: float = 300
+    # postgres connections are replaced after this number of queries
+    db_pool_max_queries: int = 50_000
+    # prepared statements cached per postgres connection, 0 is needed behind pgbouncer in transaction mode
+    db_statement_cache_size: int = 100
+    # read-only queries of GET requests are sent to these replicas of db_url, given as a json list
+    replica_db_urls: List[Union[SqliteDsn, MysqlDsn, PostgresDsn]] = []
+    # round-robin, or least-busy which picks the replica having the fewest connections in use and waiters
+    replica_selection: str = Field('round-robin', regex='^(round-robin|least-busy)$')
+    # clients read from the primary for this long after a write, so that replication lag does not hide their changes
+    replica_read_your_writes_seconds: int = 10
+    # statistics of caches, pools and the replica router are copied into the metrics at most this often
+    metrics_sync_seconds: float = 5
 
 
 settings = Settings()
 
+
+def get_connection_config(db_url: str) -> Dict[str, Any]:
+    """
+    Returns the tortoise configuration of a connection with the pool settings understood by its backend. Parameters
+    given in the query string of the url take precedence.
+    """
+    config = expand_db_url(db_url)
+    scheme = db_url.split(':', 1)[0]
+    pool_params: Dict[str, Any] = {}
+    if scheme == 'postgres':
+        pool_params = {
+            'minsize': settings.db_pool_min_size,
+            'maxsize': settings.db_pool_max_size,
+            'timeout': settings.db_connect_timeout,
+            'max_inactive_connection_lifetime': settings.db_pool_max_inactive_seconds,
+            'max_queries': settings.db_pool_max_queries,
+            'statement_cache_size': settings.db_statement_cache_size
+        }
+    elif scheme == 'mysql':
+        pool_params = {
+            'minsize': settings.db_pool_min_size,
+            'maxsize': settings.db_pool_max_size,
+            'connect_timeout': settings.db_connect_timeout,
+            'pool_recycle': settings.db_pool_recycle_seconds
+        }
+    config['credentials'] = {**pool_params, **config['credentials']}
+    return config
+
+
+REPLICA_CONNECTIONS = [f'replica_{index}' for index in range(len(settings.replica_db_urls))]
+
 TORTOISE_ORM = {
-    'connections': {'default': settings.db_url},
+    'connections': {
+        'default': get_connection_config(settings.db_url),
+        **{name: get_connection_config(url) for name, url in zip(REPLICA_CONNECTIONS, settings.replica_db_urls)}
+    },
     'apps': {
         'pastebin': {
             'models': ['aerich.models', 'pastebin.users.models', 'pastebin.snippets.models'],
@@ -0,0 +1,161 @@
+"""
+Statistics of the database connection pools and routing of reads to replicas.
+Tortoise creates the asyncpg and aiomysql pools itself, so they are wrapped once connections are initialized. The
+wrapper records how many coroutines wait for a connection and how long they waited, which is where pool exhaustion
+shows up first.
+"""
+import time
+from typing import Any, Dict, Optional, Sequence, Union
+
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+from .config import REPLICA_CONNECTIONS, settings
+
+SAFE_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+# set on responses to writes, clients sending it back read from the primary
+READ_PRIMARY_COOKIE = 'read_primary'
+ROUND_ROBIN = 'round-robin'
+LEAST_BUSY = 'least-busy'
+
+
+class MonitoredPool:
+    """Proxy of an asyncpg or aiomysql pool measuring connection acquisitions."""
+
+    def __init__(self, pool: Any):
+        self.pool = pool
+        self.waiting = 0
+        self.acquisitions = 0
+        self.total_acquire_seconds = 0.0
+        self.max_acquire_seconds = 0.0
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.pool, name)
+
+    async def acquire(self) -> Any:
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            connection = await self.pool.acquire()
+        finally:
+            self.waiting -= 1
+        elapsed = time.perf_counter() - start
+        self.acquisitions += 1
+        self.total_acquire_seconds += elapsed
+        self.max_acquire_seconds = max(self.max_acquire_seconds, elapsed)
+        return connection
+
+    def _sizes(self) -> Dict[str, int]:
+        # asyncpg and aiomysql (or asyncmy) expose their sizes differently
+        if hasattr(self.pool, 'get_idle_size'):
+            return {
+                'size': self.pool.get_size(),
+                'idle': self.pool.get_idle_size(),
+                'max_size': self.pool.get_max_size()
+            }
+        return {'size': self.pool.size, 'idle': self.pool.freesize, 'max_size': self.pool.maxsize}
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        sizes = self._sizes()
+        return {
+            **sizes,
+            'in_use': sizes['size'] - sizes['idle'],
+            'waiting': self.waiting,
+            'acquisitions': self.acquisitions,
+            'total_acquire_seconds': self.total_acquire_seconds,
+            'max_acquire_seconds': self.max_acquire_seconds
+        }
+
+
+def monitor_pools() -> None:
+    """Wraps the pools of the initialized connections, sqlite connections have no pool and are left as is."""
+    for connection in Tortoise._connections.values():
+        pool = getattr(connection, '_pool', None)
+        if pool is not None and not isinstance(pool, MonitoredPool):
+            connection._pool = MonitoredPool(pool)
+
+
+def pool_stats() -> Dict[str, Dict[str, Union[int, float]]]:
+    """Returns the statistics of monitored pools by connection name."""
+    return {
+        name: connection._pool.stats()
+        for name, connection in Tortoise._connections.items()
+        if isinstance(getattr(connection, '_pool', None), MonitoredPool)
+    }
+
+
+def _get_load(connection: BaseDBAsyncClient) -> int:
+    pool = getattr(connection, '_pool', None)
+    if isinstance(pool, MonitoredPool):
+        stats = pool.stats()
+        return int(stats['in_use'] + stats['waiting'])
+    return 0
+
+
+class ReplicaRouter:
+    """
+    Chooses the connection of read-only querysets. Reads of GET requests go to replicas, other requests read from the
+    primary as they are about to write, as well as clients having written less than `replica_read_your_writes_seconds`
+    ago since replicas may lag behind.
+    With the least-busy selection, replicas having the same load are still picked in turn.
+    """
+
+    def __init__(self, names: Sequence[str], selection: str = ROUND_ROBIN):
+        self.names = list(names)
+        self.selection = selection
+        self.reads: Dict[str, int] = {}
+        self._next = 0
+
+    def _choose_replica(self) -> str:
+        start = self._next % len(self.names)
+        candidates = self.names[start:] + self.names[:start]
+        if self.selection == LEAST_BUSY:
+            name = min(candidates, key=lambda candidate: _get_load(Tortoise.get_connection(candidate)))
+        else:
+            name = candidates[0]
+        self._next = self.names.index(name) + 1
+        return name
+
+    def db_for_read(self, request: Optional[Request] = None) -> BaseDBAsyncClient:
+        if (
+                not self.names or request is None or request.method not in SAFE_METHODS
+                or READ_PRIMARY_COOKIE in request.cookies
+        ):
+            name = 'default'
+        else:
+            name = self._choose_replica()
+        self.reads[name] = self.reads.get(name, 0) + 1
+        return Tortoise.get_connection(name)
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.reads)
+
+
+class ReadYourWritesMiddleware:
+    """
+    Sets the cookie sending reads to the primary on successful responses to requests which may have written, as long
+    as the router has replicas.
+    """
+
+    def __init__(self, app: ASGIApp, router: ReplicaRouter, seconds: int):
+        self.app = app
+        self.router = router
+        self.cookie = f'{READ_PRIMARY_COOKIE}=1; Max-Age={seconds}; Path=/; HttpOnly; SameSite=Lax'
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or scope['method'] in SAFE_METHODS or not self.router.names:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message: Message) -> None:
+            if message['type'] == 'http.response.start' and message['status'] < 400:
+                MutableHeaders(scope=message).append('Set-Cookie', self.cookie)
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+
+replica_router = ReplicaRouter(REPLICA_CONNECTIONS, settings.replica_selection)
@@ -1,23 +1,32 @@
 import uuid
-from typing import List, Tuple
+from typing import List, Optional, Tuple, Type
 
-from fastapi import HTTPException, Path, Query, Depends, Header
+from fastapi import HTTPException, Path, Query, Depends, Header, Request
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
 from starlette_i18n import set_locale
+from tortoise import Model
 from starlette_i18n.locale import gettext_translations
 
+from .cache import PrincipalCache
 from .config import settings
+from .database import replica_router
+from .exceptions import NotModified
+from .helpers import Cursor, get_validator_headers, is_not_modified
 from .snippets.models import Snippet
+from .snippets.schemas import DEFAULT_SNIPPET_LIST_FIELDS, SNIPPET_FIELDS
 from .users.models import User
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='token')
+# users authenticated by a token, this avoids to decode the token and look up the user by pseudo on every request
+principal_cache = PrincipalCache(ttl=settings.principal_cache_seconds, max_entries=settings.principal_cache_max_entries)
 
 
 async def get_db_user(
+        request: Request,
         user_id: uuid.UUID = Path(..., description='user id', example='7fef63f3-c616-4a3b-bc4a-11917a46c5aa')
 ) -> User:
-    user = await User.filter(pk=str(user_id)).get_or_none()
+    user = await User.filter(pk=user_id).using_db(replica_router.db_for_read(request)).get_or_none()
     if user is None:
         raise HTTPException(status_code=404, detail=f'no user with id {user_id} found')
 
@@ -25,6 +34,14 @@ async def get_db_user(
 
 
 async def parse_authenticated_user(token: str) -> User:
+    cached_user = principal_cache.get(token)
+    if cached_user is not None:
+        # other workers do not invalidate this cache, a user changed or deleted there has another version or none
+        version = await User.filter(pk=cached_user.pk).first().values_list('updated_at', flat=True)
+        if version == cached_user.updated_at:
+            return cached_user
+        principal_cache.invalidate_user(cached_user.pk)
+
     auth_exception = HTTPException(401, detail='Could not validate credentials', headers={'WWW-Authenticate': 'Bearer'})
     try:
         data = jwt.decode(token, settings.secret_key, algorithms=[settings.jwt_algorithm])
@@ -39,6 +56,7 @@ async def parse_authenticated_user(token: str) -> User:
     if auth_user is None:
         raise auth_exception
 
+    principal_cache.set(token, auth_user, data.get('exp', float('inf')))
     return auth_user
 
 
@@ -50,33 +68,135 @@ async def get_authenticated_user(token: str = Depends(oauth2_scheme), user: User
     return user
 
 
-async def get_db_snippet(
-        snippet_id: uuid.UUID = Path(..., description='snippet id', example='7fef63f3-c616-4a3b-bc4a-11917a46c5aa')
-) -> Snippet:
-    snippet = await Snippet.filter(pk=str(snippet_id)).get_or_none()
-    if snippet is None:
-        raise HTTPException(status_code=404, detail=f'no snippet with id {snippet_id} found')
+snippet_id_path = Path(..., description='snippet id', example='7fef63f3-c616-4a3b-bc4a-11917a46c5aa')
 
-    await snippet.fetch_related('language', 'style', 'user')
-    return snippet
 
+class SnippetGetter:
+    """
+    Dependency fetching the snippet of the path with the given related objects ("language", "style", "user") in a
+    single joined query. Each route asks only for the related objects it needs.
+    """
 
-async def get_authenticated_snippet(token: str = Depends(oauth2_scheme), snippet: Snippet = Depends(get_db_snippet)):
-    authenticated_user = await parse_authenticated_user(token)
-    if authenticated_user != snippet.user and not authenticated_user.is_admin:
-        raise HTTPException(403, detail='Access denied for the resource')
+    def __init__(self, *related: str):
+        self.related = related
+
+    async def get_snippet(self, request: Request, snippet_id: uuid.UUID) -> Snippet:
+        queryset = Snippet.filter(pk=snippet_id).using_db(replica_router.db_for_read(request))
+        snippet = await queryset.select_related(*self.related).get_or_none()
+        if snippet is None:
+            raise HTTPException(status_code=404, detail=f'no snippet with id {snippet_id} found')
+
+        return snippet
 
-    return snippet
+    async def __call__(self, request: Request, snippet_id: uuid.UUID = snippet_id_path) -> Snippet:
+        return await self.get_snippet(request, snippet_id)
+
+
+class AuthenticatedSnippetGetter(SnippetGetter):
+    """Same as SnippetGetter but only the snippet owner or an admin user can access the snippet."""
+
+    async def __call__(  # type: ignore
+            self, request: Request, token: str = Depends(oauth2_scheme), snippet_id: uuid.UUID = snippet_id_path
+    ) -> Snippet:
+        snippet = await self.get_snippet(request, snippet_id)
+        authenticated_user = await parse_authenticated_user(token)
+        # comparing foreign key values spares the loading of the owner
+        if str(authenticated_user.pk) != str(snippet.user_id) and not authenticated_user.is_admin:  # type: ignore
+            raise HTTPException(403, detail='Access denied for the resource')
+
+        return snippet
+
+
+class ConditionalGet:
+    """
+    Dependency answering conditional GET requests with a 304 status code using only the updated_at column of the
+    resource, before the resource and its related objects are loaded.
+    """
+
+    def __init__(self, model_class: Type[Model], path_param: str, variant: str = ''):
+        self.model_class = model_class
+        self.path_param = path_param
+        self.variant = variant
+
+    async def __call__(self, request: Request) -> None:
+        if 'if-none-match' not in request.headers and 'if-modified-since' not in request.headers:
+            return
+
+        try:
+            pk = uuid.UUID(request.path_params[self.path_param])
+        except ValueError:
+            # the path validation will return the correct error
+            return
+
+        queryset = self.model_class.filter(pk=pk).using_db(replica_router.db_for_read(request))
+        updated_at = await queryset.first().values_list('updated_at', flat=True)
+        if updated_at is None:
+            return
+
+        headers = get_validator_headers(pk, updated_at, self.variant)  # type: ignore
+        if is_not_modified(request, headers):
+            raise NotModified(headers)
 
 
 class Pagination:
     def __init__(
             self,
             page: int = Query(1, description='number of the page to fetch', ge=1),
-            page_size: int = Query(50, description='number of items per page', ge=1, le=100)
+            page_size: int = Query(50, description='number of items per page', ge=1, le=100),
+            cursor: Optional[str] = Query(
+                None,
+                description=(
+                    'opaque cursor returned in pagination headers. Pass an empty value to start iterating with cursors'
+                    ' instead of page numbers, the page parameter is then ignored'
+                )
+            )
     ):
         self.page = page
         self.page_size = page_size
+        self.cursor: Optional[Cursor] = None
+        if cursor is not None:
+            try:
+                self.cursor = Cursor.decode(cursor)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+
+class SnippetFields:
+    """Fields of the snippets returned by list endpoints, with the columns and related objects to fetch for them."""
+    # id and created_at are always fetched since cursor pagination needs them
+    COLUMNS = {
+        'title': 'title',
+        'code': 'content_id',
+        'print_line_number': 'print_line_number',
+        'language': 'language_id',
+        'style': 'style_id'
+    }
+    RELATIONS = {'code': 'content', 'language': 'language', 'style': 'style'}
+
+    def __init__(
+            self,
+            fields: Optional[str] = Query(
+                None,
+                description=(
+                    f'comma separated list of fields to return among {", ".join(SNIPPET_FIELDS)}. Defaults to all'
+                    ' fields except code'
+                ),
+                example='id,title,language'
+            )
+    ):
+        if fields is None:
+            requested = set(DEFAULT_SNIPPET_LIST_FIELDS)
+        else:
+            requested = {field.strip() for field in fields.split(',') if field.strip()}
+            if not requested:
+                raise HTTPException(status_code=400, detail='at least one snippet field is required')
+            unknown = requested.difference(SNIPPET_FIELDS)
+            if unknown:
+                raise HTTPException(status_code=400, detail=f'unknown snippet fields: {", ".join(sorted(unknown))}')
+        # fields keep the order of the schema whatever the order of the query
+        self.fields = [field for field in SNIPPET_FIELDS if field in requested]
+        self.columns = ['id', 'created_at'] + [self.COLUMNS[field] for field in self.fields if field in self.COLUMNS]
+        self.relations = [self.RELATIONS[field] for field in self.fields if field in self.RELATIONS]
 
 
 def parse_accept_language(value: str) -> List[Tuple[str, str]]:
@@ -1,30 +1,48 @@
-from typing import List, Dict
+from typing import Any, List, Dict
 
-from fastapi.responses import ORJSONResponse
+from fastapi.responses import ORJSONResponse, Response
 
 
 class SnippetError(Exception):
-    def __init__(self, errors: List[Dict[str, str]]):
+    """
+    Each error is a dict with the model ("language" or "style") and the value not found. An optional "loc" key gives
+    the location prefix of the value in the request, it defaults to ["body"].
+    """
+
+    def __init__(self, errors: List[Dict[str, Any]]):
         self.errors = errors
 
 
-async def handle_snippet_error(_, exc: SnippetError) -> ORJSONResponse:
-    errors = []
-    for error in exc.errors:
+class NotModified(Exception):
+    def __init__(self, headers: Dict[str, str]):
+        self.headers = headers
+
+
+def get_snippet_error_details(errors: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    details = []
+    for error in errors:
         model = error['model']
         value = error['value']
-        errors.append({
-            'loc': ['body', error['model']],
+        details.append({
+            'loc': [*error.get('loc', ['body']), error['model']],
             'msg': (
                 f'No {model} {value} found.'
                 f' Please look at /{model}s for the list of available {model}s.'
             ),
             'type': 'value_error'
         })
+    return details
+
+
+async def handle_snippet_error(_, exc: SnippetError) -> ORJSONResponse:
+    return ORJSONResponse(status_code=422, content={'detail': get_snippet_error_details(exc.errors)})
+
 
-    return ORJSONResponse(status_code=422, content={'detail': errors})
+async def handle_not_modified(_, exc: NotModified) -> Response:
+    return Response(status_code=304, headers=exc.headers)
 
 
 exception_handlers = {
-    SnippetError: handle_snippet_error
+    SnippetError: handle_snippet_error,
+    NotModified: handle_not_modified
 }
@@ -0,0 +1,138 @@
+"""This module contains custom model fields for the project."""
+import zlib
+from typing import Any, Optional, Type, Union
+from uuid import UUID
+
+from tortoise import Model, fields
+
+
+class UUIDBytes(bytes):
+    """
+    Bytes of a uuid. Tortoise inlines filter values in queries with str(), so it is rendered as a hexadecimal literal
+    understood by MySQL and SQLite, while drivers still receive bytes for parameterized queries.
+    """
+
+    def __str__(self) -> str:
+        return f"X'{self.hex()}'"
+
+
+try:
+    from pymysql import converters
+except ImportError:  # pragma: no cover
+    pass
+else:
+    # pymysql looks for encoders by exact type, aiomysql connections copy `conversions` when they are created
+    converters.encoders[UUIDBytes] = converters.escape_bytes
+    converters.conversions[UUIDBytes] = converters.escape_bytes
+
+
+class BinaryUUIDField(fields.UUIDField):
+    """
+    UUID field stored in 16 bytes instead of a 36 characters string on MySQL and SQLite.
+    PostgreSQL already has a native uuid type, the field behaves like UUIDField there.
+    """
+
+    SQL_TYPE = 'BINARY(16)'
+
+    class _db_postgres:
+        SQL_TYPE = 'UUID'
+
+    def to_db_value(self, value: Any, instance: Union[Type[Model], Model]) -> Optional[Union[str, UUIDBytes]]:
+        if value is None:
+            return None
+        if not isinstance(value, UUID):
+            value = UUID(str(value))
+        # the instance is not always given, e.g. for values of QuerySet.update
+        if self.model._meta.db.capabilities.dialect == 'postgres':
+            return str(value)
+        return UUIDBytes(value.bytes)
+
+    def to_python_value(self, value: Any) -> Optional[UUID]:
+        if value is None or isinstance(value, UUID):
+            return value
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return UUID(bytes=bytes(value))
+        return UUID(value)
+
+
+# 0xff never appears in utf-8 encoded text, so uncompressed values need no marker and existing rows stay readable
+COMPRESSED_MARKER = b'\xff'
+ZLIB_CODEC = b'z'
+
+
+class CompressedText:
+    """Compressed value read from a CompressedTextField, only decompressed when converted to str."""
+
+    __slots__ = ('data',)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def __str__(self) -> str:
+        codec, payload = self.data[1:2], self.data[2:]
+        if codec != ZLIB_CODEC:
+            raise ValueError(f'unknown compression codec {codec!r}')
+        return zlib.decompress(payload).decode()
+
+
+class CompressedTextField(fields.TextField):
+    """
+    Text field compressing values of at least `threshold` bytes when it makes them smaller. Values are stored in a
+    binary column, either as utf-8 text or as the compressed marker, a codec byte and the compressed text.
+    Values read from the database are CompressedText objects, the model attribute declared with LazyText decompresses
+    them on first access.
+    """
+
+    SQL_TYPE = 'BLOB'
+
+    class _db_mysql:
+        SQL_TYPE = 'LONGBLOB'
+
+    class _db_postgres:
+        SQL_TYPE = 'BYTEA'
+
+    def __init__(self, threshold: int, level: int = 6, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.threshold = threshold
+        self.level = level
+
+    def to_db_value(self, value: Any, instance: Union[Type[Model], Model]) -> Optional[bytes]:
+        if value is None:
+            return None
+        if isinstance(value, CompressedText):
+            return value.data
+        data = str(value).encode()
+        if len(data) >= self.threshold:
+            compressed = COMPRESSED_MARKER + ZLIB_CODEC + zlib.compress(data, self.level)
+            if len(compressed) < len(data):
+                return compressed
+        return data
+
+    def to_python_value(self, value: Any) -> Optional[Union[str, CompressedText]]:
+        if value is None or isinstance(value, (str, CompressedText)):
+            return value
+        value = bytes(value)
+        if value.startswith(COMPRESSED_MARKER):
+            return CompressedText(value)
+        return value.decode()
+
+
+class LazyText:
+    """
+    Model attribute of a CompressedTextField, Tortoise removes field attributes from model classes so it must be set
+    after the class creation. Values are decompressed on first access and kept for the following ones.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __get__(self, instance: Optional[Model], owner: Type[Model]) -> Any:
+        if instance is None:
+            return self
+        value = instance.__dict__.get(self.name)
+        if isinstance(value, CompressedText):
+            value = instance.__dict__[self.name] = str(value)
+        return value
+
+    def __set__(self, instance: Model, value: Any) -> None:
+        instance.__dict__[self.name] = value
@@ -1,12 +1,120 @@
-from datetime import datetime, timedelta
-from typing import Dict, List, Any, Sequence, Type, Union
+import base64
+import binascii
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, List, Any, Optional, Sequence, Type, Union
 
 from fastapi import Response, Request
 from jose import jwt
 from starlette_i18n import load_gettext_translations
 from tortoise import Model
+from tortoise.query_utils import Q
 
+from .compression import decode_etag
 from .config import settings
+from .database import replica_router
+
+
+class Cursor:
+    """
+    Position of a keyset pagination, i.e the (created_at, id) couple of a boundary row and the direction in which to
+    read items relative to it. An empty cursor (no boundary row) represents the first page.
+    """
+    NEXT = 'next'
+    PREVIOUS = 'previous'
+
+    def __init__(self, direction: str = NEXT, created_at: datetime = None, id: uuid.UUID = None):
+        self.direction = direction
+        self.created_at = created_at
+        self.id = id
+
+    @property
+    def is_start(self) -> bool:
+        return self.created_at is None
+
+    def encode(self) -> str:
+        data = {'d': self.direction, 'c': self.created_at.isoformat(), 'i': str(self.id)}
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+    @classmethod
+    def decode(cls, value: str) -> 'Cursor':
+        """Raises ValueError if the given value is not a cursor previously returned by the API."""
+        if not value:
+            return cls()
+        try:
+            data = json.loads(base64.urlsafe_b64decode(value.encode()))
+            direction = data['d']
+            created_at = datetime.fromisoformat(data['c'])
+            id_ = uuid.UUID(data['i'])
+        except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError):
+            raise ValueError(f'{value} is not a valid cursor')
+        if direction not in (cls.NEXT, cls.PREVIOUS):
+            raise ValueError(f'{value} is not a valid cursor')
+        return cls(direction, created_at, id_)
+
+    @classmethod
+    def from_model(cls, model: Model, direction: str) -> 'Cursor':
+        return cls(direction, model.created_at, model.id)  # type: ignore
+
+
+def after_keyset(created_at: datetime, pk: Any) -> Q:
+    """Filter selecting rows after the given (created_at, id) position."""
+    return Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=str(pk))
+
+
+def before_keyset(created_at: datetime, pk: Any) -> Q:
+    """Filter selecting rows before the given (created_at, id) position."""
+    return Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=str(pk))
+
+
+async def _prepare_cursor_response(
+        request: Request,
+        response: Response,
+        model_class: Type[Model],
+        cursor: Cursor,
+        page_size: int,
+        filters: Dict[str, Any],
+        to_prefetch: Sequence[str],
+        only: Optional[Sequence[str]]
+) -> List[Model]:
+    # we fetch one more row than needed to know if there are items after the current page
+    # without having to count them
+    queryset = model_class.filter(**filters).using_db(replica_router.db_for_read(request))
+    if only:
+        queryset = queryset.only(*only)
+    if cursor.is_start:
+        queryset = queryset.order_by('created_at', 'id')
+    elif cursor.direction == Cursor.NEXT:
+        queryset = queryset.filter(after_keyset(cursor.created_at, cursor.id)).order_by('created_at', 'id')
+    else:
+        queryset = queryset.filter(before_keyset(cursor.created_at, cursor.id)).order_by('-created_at', '-id')
+    models = await queryset.limit(page_size + 1).prefetch_related(*to_prefetch)
+
+    has_more = len(models) > page_size
+    models = models[:page_size]
+    if cursor.direction == Cursor.PREVIOUS:
+        models.reverse()
+        has_previous, has_next = has_more, True
+    else:
+        has_previous, has_next = not cursor.is_start, has_more
+
+    url = request.url.remove_query_params('page')
+    previous_page = 'X-Previous-Page'
+    next_page = 'X-Next-Page'
+    if has_previous and models:
+        previous_cursor = Cursor.from_model(models[0], Cursor.PREVIOUS).encode()
+        response.headers[previous_page] = str(url.include_query_params(cursor=previous_cursor, page_size=page_size))
+    else:
+        response.headers[previous_page] = ''
+    if has_next and models:
+        next_cursor = Cursor.from_model(models[-1], Cursor.NEXT).encode()
+        response.headers[next_page] = str(url.include_query_params(cursor=next_cursor, page_size=page_size))
+    else:
+        response.headers[next_page] = ''
+
+    return models
 
 
 async def prepare_response(
@@ -16,12 +124,29 @@ async def prepare_response(
         page: int,
         page_size: int,
         filters: Dict[str, Any] = None,
-        to_prefetch: Sequence[str] = None
+        to_prefetch: Sequence[str] = None,
+        cursor: Optional[Cursor] = None,
+        only: Optional[Sequence[str]] = None
 ) -> List[Model]:
+    """
+    Fetches a page of items and sets the pagination headers on the response.
+    When a cursor is given, the page is computed with a keyset on (created_at, id) instead of an offset so that the
+    cost of fetching a page does not depend on its depth. In this case the page argument is ignored.
+    When `only` is given, only these columns are fetched, cursor pagination needs created_at and id among them.
+    Items are read from a replica when there are some.
+    """
     filters = {} if filters is None else filters
     to_prefetch = [] if to_prefetch is None else to_prefetch
+    if cursor is not None:
+        return await _prepare_cursor_response(
+            request, response, model_class, cursor, page_size, filters, to_prefetch, only
+        )
+
     offset = (page * page_size) - page_size
-    models = await model_class.filter(**filters).offset(offset).limit(page_size).prefetch_related(*to_prefetch)
+    queryset = model_class.filter(**filters).using_db(replica_router.db_for_read(request))
+    if only:
+        queryset = queryset.only(*only)
+    models = await queryset.offset(offset).limit(page_size).prefetch_related(*to_prefetch)
 
     previous_page = 'X-Previous-Page'
     next_page = 'X-Next-Page'
@@ -37,6 +162,49 @@ async def prepare_response(
     return models
 
 
+def get_validator_headers(pk: Any, updated_at: datetime, variant: str = '') -> Dict[str, str]:
+    """
+    Returns ETag and Last-Modified headers of a resource. The variant distinguishes different representations of
+    the same resource, e.g. json and html.
+    """
+    suffix = f'-{variant}' if variant else ''
+    return {
+        'ETag': f'"{pk}-{int(updated_at.timestamp() * 1_000_000)}{suffix}"',
+        'Last-Modified': format_datetime(updated_at.astimezone(timezone.utc), usegmt=True)
+    }
+
+
+def is_not_modified(request: Request, headers: Dict[str, str]) -> bool:
+    """
+    Evaluates If-None-Match and If-Modified-Since headers of a GET request against the resource validators.
+    When the client holds a compressed representation, its ETag replaces the one of headers.
+    """
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        # weak comparison is the one to use for GET requests
+        etags = [etag.strip() for etag in if_none_match.split(',')]
+        if '*' in etags:
+            return True
+        for etag in (etag[2:] if etag.startswith('W/') else etag for etag in etags):
+            if decode_etag(etag) == headers['ETag']:
+                headers['ETag'] = etag
+                return True
+        return False
+
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since is not None:
+        try:
+            modified_since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        # dates with a -0000 zone are parsed as naive datetimes, HTTP dates are always in UTC
+        if modified_since.tzinfo is None:
+            modified_since = modified_since.replace(tzinfo=timezone.utc)
+        return parsedate_to_datetime(headers['Last-Modified']) <= modified_since
+
+    return False
+
+
 def create_access_token(data: Dict[str, Union[str, datetime]]) -> str:
     to_encode = data.copy()
     expire_time = datetime.utcnow() + timedelta(seconds=settings.jwt_token_expire_seconds)
@@ -5,14 +5,20 @@ from fastapi import FastAPI, Request, Response, Depends, HTTPException
 from fastapi.responses import ORJSONResponse, HTMLResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
+from prometheus_client import CONTENT_TYPE_LATEST
 from starlette_i18n import get_locale
 from tortoise import Tortoise
 
-from .config import TORTOISE_ORM, PAGINATION_HEADERS, templates
+from .compression import CompressionMiddleware
+from .config import TORTOISE_ORM, PAGINATION_HEADERS, settings, templates
+from .database import ReadYourWritesMiddleware, monitor_pools, replica_router
 from .dependencies import Pagination, set_language
 from .exceptions import exception_handlers
 from .helpers import prepare_response, create_access_token, SetupTranslations
+from .metrics import MetricsMiddleware, close_metrics, monitor_queries, render_metrics
 from .schemas import LanguageSchema, StyleSchema, Token, HttpError
+from .snippets.catalogue import load_catalogues
+from .snippets.highlighting import highlight_engine
 from .snippets.models import Language, Style
 from .snippets.views import router as snippet_router
 from .users.models import User
@@ -24,6 +30,9 @@ from .users.views import router as user_router
 # relying of tortoise fastapi helper.
 async def init_tortoise():
     await Tortoise.init(config=TORTOISE_ORM)
+    monitor_pools()
+    monitor_queries()
+    await load_catalogues()
 
 
 async def close_tortoise():
@@ -43,9 +52,15 @@ app = FastAPI(
     redoc_url=None,
     default_response_class=ORJSONResponse,
     exception_handlers=exception_handlers,
-    on_startup=[init_tortoise, SetupTranslations(locales_dir=f'{locales_dir}')],
-    on_shutdown=[close_tortoise]
+    on_startup=[init_tortoise, SetupTranslations(locales_dir=f'{locales_dir}'), highlight_engine.start],
+    on_shutdown=[close_tortoise, highlight_engine.shutdown, close_metrics]
 )
+app.add_middleware(CompressionMiddleware, minimum_size=settings.compression_minimum_size)
+app.add_middleware(
+    ReadYourWritesMiddleware, router=replica_router, seconds=settings.replica_read_your_writes_seconds
+)
+# added last to measure the whole stack, compression included
+app.add_middleware(MetricsMiddleware)
 app.include_router(user_router)
 app.include_router(snippet_router)
 
@@ -60,7 +75,9 @@ app.mount('/static', StaticFiles(directory=f'{static_dir}'), name='static')
     responses={200: PAGINATION_HEADERS}
 )
 async def get_languages(request: Request, response: Response, pagination: Pagination = Depends()):
-    return await prepare_response(request, response, Language, pagination.page, pagination.page_size)
+    return await prepare_response(
+        request, response, Language, pagination.page, pagination.page_size, cursor=pagination.cursor
+    )
 
 
 @app.get(
@@ -70,7 +87,9 @@ async def get_languages(request: Request, response: Response, pagination: Pagina
     responses={200: PAGINATION_HEADERS}
 )
 async def get_styles(request: Request, response: Response, pagination: Pagination = Depends()):
-    return await prepare_response(request, response, Style, pagination.page, pagination.page_size)
+    return await prepare_response(
+        request, response, Style, pagination.page, pagination.page_size, cursor=pagination.cursor
+    )
 
 
 @app.post(
@@ -102,7 +121,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     if user is None:
         raise auth_exception
 
-    if not user.check_password(form_data.password):
+    if not await user.acheck_password(form_data.password):
         raise auth_exception
 
     token = create_access_token({'sub': form_data.username})
@@ -120,3 +139,8 @@ async def about(request: Request):
     context = {'request': request, 'locale': get_locale()}
     templates.env.install_gettext_translations(get_locale().translations)  # type: ignore
     return templates.TemplateResponse('i18n.jinja2', context)
+
+
+@app.get('/metrics', include_in_schema=False)
+async def metrics():
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,304 @@
+"""
+Prometheus metrics exposed on /metrics.
+Requests are measured by a middleware, per route template so that ids in paths do not create new series, and the
+database queries run while handling a request are attributed to its route. Components already keeping statistics
+(caches, bcrypt and highlighting pools, connection pools, replica router) are copied into metrics at most every
+`metrics_sync_seconds` and before each scrape, so that measuring costs nothing on their hot paths.
+With several workers, set the PROMETHEUS_MULTIPROC_DIR environment variable to an empty directory shared by the
+workers: each of them writes its metrics there and the scraped worker aggregates them.
+"""
+import functools
+import os
+import sys
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily, Metric
+from starlette.routing import Mount
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from tortoise import Tortoise
+
+from .config import settings
+from .database import pool_stats, replica_router
+from .dependencies import principal_cache
+from .snippets import catalogue
+from .snippets.highlighting import highlight_engine
+from .snippets.views import highlight_cache
+from .users.hashing import hashing_pool
+
+# label of requests matching no route and of queries run outside of requests
+UNMATCHED = 'unmatched'
+NO_ROUTE = 'none'
+QUERY_METHODS = ('execute_insert', 'execute_many', 'execute_query', 'execute_query_dict', 'execute_script')
+
+REQUESTS = Counter('pastebin_http_requests_total', 'Requests handled', ['method', 'route', 'status'])
+REQUEST_DURATION = Histogram(
+    'pastebin_http_request_duration_seconds', 'Time to handle requests, including the response body',
+    ['method', 'route']
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    'pastebin_http_requests_in_progress', 'Requests being handled', ['method'], multiprocess_mode='livesum'
+)
+DB_QUERIES = Counter('pastebin_db_queries_total', 'Database queries by route of the request running them', ['route'])
+DB_QUERY_DURATION = Histogram(
+    'pastebin_db_query_duration_seconds', 'Time of database queries by route of the request running them', ['route'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+BCRYPT_JOBS = Counter('pastebin_bcrypt_jobs_total', 'Passwords hashed or verified')
+BCRYPT_SECONDS = Counter('pastebin_bcrypt_seconds_total', 'Time spent computing bcrypt hashes')
+BCRYPT_WAIT_SECONDS = Counter('pastebin_bcrypt_wait_seconds_total', 'Time bcrypt jobs waited for a thread')
+BCRYPT_QUEUED = Gauge('pastebin_bcrypt_queued', 'bcrypt jobs waiting for a thread', multiprocess_mode='livesum')
+HIGHLIGHT_JOBS = Counter('pastebin_highlight_jobs_total', 'Codes highlighted by Pygments')
+HIGHLIGHT_SECONDS = Counter('pastebin_highlight_seconds_total', 'Time spent by Pygments highlighting codes')
+HIGHLIGHT_DEGRADED = Counter(
+    'pastebin_highlight_degraded_total', 'Codes served without highlighting: too big, saturated pool or timeout'
+)
+HIGHLIGHT_PENDING = Gauge(
+    'pastebin_highlight_pending', 'Highlighting jobs submitted to the pool', multiprocess_mode='livesum'
+)
+CACHE_HITS = Counter('pastebin_cache_hits_total', 'Cache lookups finding an entry', ['cache'])
+CACHE_MISSES = Counter('pastebin_cache_misses_total', 'Cache lookups finding no entry', ['cache'])
+CACHE_EVICTIONS = Counter('pastebin_cache_evictions_total', 'Entries dropped to make room for new ones', ['cache'])
+CACHE_ENTRIES = Gauge('pastebin_cache_entries', 'Entries of the caches', ['cache'], multiprocess_mode='livesum')
+CACHE_BYTES = Gauge(
+    'pastebin_cache_bytes', 'Size of the values of caches bounded in bytes', ['cache'], multiprocess_mode='livesum'
+)
+DB_POOL_CONNECTIONS = Gauge(
+    'pastebin_db_pool_connections', 'Connections of the pools', ['connection', 'state'], multiprocess_mode='livesum'
+)
+DB_POOL_WAITING = Gauge(
+    'pastebin_db_pool_waiting', 'Coroutines waiting for a connection', ['connection'], multiprocess_mode='livesum'
+)
+DB_POOL_ACQUISITIONS = Counter('pastebin_db_pool_acquisitions_total', 'Connections acquired', ['connection'])
+DB_POOL_ACQUIRE_SECONDS = Counter(
+    'pastebin_db_pool_acquire_seconds_total', 'Time spent waiting for connections', ['connection']
+)
+DB_READS = Counter('pastebin_db_reads_total', 'Read-only querysets routed to each connection', ['connection'])
+
+
+class RequestMetrics:
+    """Measures of the request being handled, shared with the code it runs through a context variable."""
+
+    __slots__ = ('query_seconds',)
+
+    def __init__(self):
+        self.query_seconds: List[float] = []
+
+
+_request_metrics: ContextVar[Optional[RequestMetrics]] = ContextVar('request_metrics', default=None)
+# some queries are implemented with other ones, only the outermost is measured
+_in_query: ContextVar[bool] = ContextVar('in_query', default=False)
+
+
+def record_query(seconds: float) -> None:
+    request_metrics = _request_metrics.get()
+    if request_metrics is None:
+        DB_QUERIES.labels(NO_ROUTE).inc()
+        DB_QUERY_DURATION.labels(NO_ROUTE).observe(seconds)
+    else:
+        request_metrics.query_seconds.append(seconds)
+
+
+def _timed_query(method: Callable) -> Callable:
+    @functools.wraps(method)
+    async def timed_method(self, *args, **kwargs):
+        if _in_query.get():
+            return await method(self, *args, **kwargs)
+
+        token = _in_query.set(True)
+        start = time.perf_counter()
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            _in_query.reset(token)
+            record_query(time.perf_counter() - start)
+
+    timed_method.timed = True  # type: ignore
+    return timed_method
+
+
+def monitor_queries() -> None:
+    """
+    Measures the queries of the initialized connections. Transactions use their own client class, defined in the
+    module of the connection class, so the query methods of both classes are wrapped.
+    """
+    for connection in Tortoise._connections.values():
+        connection_class = type(connection)
+        transaction_class = getattr(sys.modules[connection_class.__module__], 'TransactionWrapper', None)
+        for cls in (connection_class, transaction_class):
+            if cls is None:
+                continue
+            for name in QUERY_METHODS:
+                method = cls.__dict__.get(name)
+                if method is not None and not getattr(method, 'timed', False):
+                    setattr(cls, name, _timed_query(method))
+
+
+def get_route_paths(routes: Iterable[Any]) -> Dict[Any, str]:
+    """Returns the path templates of routes by the endpoint starlette stores in the scope of matched requests."""
+    return {route.app if isinstance(route, Mount) else route.endpoint: route.path for route in routes}
+
+
+class StatsExporter:
+    """
+    Copies statistics of the components into metrics. Component counters only grow, the difference with the last
+    copied value is added to the metric so that metrics of all the workers can be summed.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next_sync = 0.0
+        self._totals: Dict[Tuple[Any, Tuple[str, ...]], float] = {}
+
+    def _count(self, counter: Counter, total: float, *labels: str) -> None:
+        key = (counter, labels)
+        delta = total - self._totals.get(key, 0)
+        self._totals[key] = total
+        # the series is created even without delta, so that it is scraped from the start
+        metric = counter.labels(*labels) if labels else counter
+        # a component replaced or reset starts again from zero
+        if delta > 0:
+            metric.inc(delta)
+
+    def sync(self) -> None:
+        self._next_sync = time.monotonic() + self.interval
+        stats = hashing_pool.stats()
+        self._count(BCRYPT_JOBS, stats['jobs'])
+        self._count(BCRYPT_SECONDS, stats['total_run_seconds'])
+        self._count(BCRYPT_WAIT_SECONDS, stats['total_wait_seconds'])
+        BCRYPT_QUEUED.set(stats['queued'])
+
+        stats = highlight_engine.stats()
+        self._count(HIGHLIGHT_JOBS, stats['jobs'])
+        self._count(HIGHLIGHT_SECONDS, stats['total_seconds'])
+        self._count(HIGHLIGHT_DEGRADED, stats['degraded'])
+        HIGHLIGHT_PENDING.set(stats['pending'])
+
+        caches = (
+            ('highlight', highlight_cache), ('principal', principal_cache),
+            ('language', catalogue.languages), ('style', catalogue.styles)
+        )
+        for name, cache in caches:
+            stats = cache.stats()
+            self._count(CACHE_HITS, stats['hits'], name)
+            self._count(CACHE_MISSES, stats['misses'], name)
+            # catalogues hold whole tables, they never evict
+            if 'evictions' in stats:
+                self._count(CACHE_EVICTIONS, stats['evictions'], name)
+            if 'bytes' in stats:
+                CACHE_BYTES.labels(name).set(stats['bytes'])
+            CACHE_ENTRIES.labels(name).set(stats['entries'])
+
+        for name, stats in pool_stats().items():
+            DB_POOL_CONNECTIONS.labels(name, 'in_use').set(stats['in_use'])
+            DB_POOL_CONNECTIONS.labels(name, 'idle').set(stats['idle'])
+            DB_POOL_WAITING.labels(name).set(stats['waiting'])
+            self._count(DB_POOL_ACQUISITIONS, stats['acquisitions'], name)
+            self._count(DB_POOL_ACQUIRE_SECONDS, stats['total_acquire_seconds'], name)
+
+        for name, reads in replica_router.stats().items():
+            self._count(DB_READS, reads, name)
+
+    def maybe_sync(self) -> None:
+        if time.monotonic() >= self._next_sync:
+            self.sync()
+
+
+stats_exporter = StatsExporter(interval=settings.metrics_sync_seconds)
+
+
+class MetricsMiddleware:
+    """Counts and times requests by route, and attributes to the route the database queries they run."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._route_paths: Optional[Dict[Any, str]] = None
+
+    def _get_route(self, scope: Scope) -> str:
+        if self._route_paths is None:
+            self._route_paths = get_route_paths(scope['app'].routes)
+        return self._route_paths.get(scope.get('endpoint'), UNMATCHED)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        request_metrics = RequestMetrics()
+        token = _request_metrics.set(request_metrics)
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            in_progress.dec()
+            _request_metrics.reset(token)
+            # the router stores the matched endpoint in the scope
+            route = self._get_route(scope)
+            REQUESTS.labels(method, route, str(status)).inc()
+            REQUEST_DURATION.labels(method, route).observe(duration)
+            if request_metrics.query_seconds:
+                DB_QUERIES.labels(route).inc(len(request_metrics.query_seconds))
+                query_duration = DB_QUERY_DURATION.labels(route)
+                for seconds in request_metrics.query_seconds:
+                    query_duration.observe(seconds)
+            stats_exporter.maybe_sync()
+
+
+class HitRatioCollector:
+    """Adds the hit ratio of each cache, computed from the hits and misses of all the workers."""
+
+    def __init__(self, collector: Any):
+        self.collector = collector
+
+    def collect(self) -> Iterable[Metric]:
+        totals: Dict[str, Dict[str, float]] = {'pastebin_cache_hits': {}, 'pastebin_cache_misses': {}}
+        for metric in self.collector.collect():
+            yield metric
+            if metric.name in totals:
+                for sample in metric.samples:
+                    if sample.name.endswith('_total'):
+                        cache = sample.labels['cache']
+                        totals[metric.name][cache] = totals[metric.name].get(cache, 0) + sample.value
+
+        hit_ratio = GaugeMetricFamily('pastebin_cache_hit_ratio', 'Hits over lookups of the caches', labels=['cache'])
+        hits, misses = totals['pastebin_cache_hits'], totals['pastebin_cache_misses']
+        for cache in sorted(hits.keys() | misses.keys()):
+            lookups = hits.get(cache, 0) + misses.get(cache, 0)
+            if lookups:
+                hit_ratio.add_metric([cache], hits.get(cache, 0) / lookups)
+        yield hit_ratio
+
+
+def is_multiprocess() -> bool:
+    return 'PROMETHEUS_MULTIPROC_DIR' in os.environ
+
+
+def render_metrics() -> bytes:
+    """Returns the metrics of all the workers in the Prometheus text format."""
+    stats_exporter.sync()
+    if is_multiprocess():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(HitRatioCollector(registry))
+
+
+def close_metrics() -> None:
+    """Drops the gauges of the current worker from the aggregated ones."""
+    if is_multiprocess():
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,66 @@
+"""In-memory catalogues of languages and styles to avoid database lookups on every snippet write."""
+import time
+from typing import Dict, Generic, Optional, Type, TypeVar
+
+from tortoise import Model
+
+from pastebin.config import settings
+from .models import Language, Style
+
+M = TypeVar('M', bound=Model)
+
+
+class Catalogue(Generic[M]):
+    """
+    Case-folded name -> row mapping of a table which rarely changes.
+    Since rows may be added, merged or deleted by another process (e.g. the CLI), the whole mapping expires
+    `settings.catalogue_refresh_seconds` after it was loaded, and is otherwise kept until it is explicitly invalidated.
+    Among rows having the same name, the one with the smallest id is kept, like `deduplicate_names` does.
+    A lookup loading the mapping counts as a miss, the other ones as hits.
+    """
+
+    def __init__(self, model_class: Type[M]):
+        self.model_class = model_class
+        self._items: Optional[Dict[str, M]] = None
+        self._loaded_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._items is not None
+
+    async def load(self) -> None:
+        items: Dict[str, M] = {}
+        for item in sorted(await self.model_class.all(), key=lambda row: str(row.pk)):
+            items.setdefault(item.name.casefold(), item)  # type: ignore
+        self._items = items
+        self._loaded_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        self._items = None
+
+    async def get(self, name: str) -> Optional[M]:
+        if self._items is None or time.monotonic() - self._loaded_at >= settings.catalogue_refresh_seconds:
+            self.misses += 1
+            await self.load()
+        else:
+            self.hits += 1
+        return self._items.get(name.casefold())  # type: ignore
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'entries': 0 if self._items is None else len(self._items)}
+
+
+languages: Catalogue[Language] = Catalogue(Language)
+styles: Catalogue[Style] = Catalogue(Style)
+
+
+async def load_catalogues() -> None:
+    await languages.load()
+    await styles.load()
+
+
+def invalidate_catalogues() -> None:
+    languages.invalidate()
+    styles.invalidate()
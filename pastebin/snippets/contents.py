@@ -0,0 +1,114 @@
+"""
+Snippet codes are stored once in SnippetContent rows keyed by their sha256 hash, so that posting an existing code is
+a lookup instead of another write. Contents count the snippets referencing them and the sweeper deletes the ones no
+longer referenced.
+Contents are inserted before, and outside of, the transaction saving their snippets, so that a concurrent insertion
+of the same code cannot make it fail. Until a snippet references it, a new content is protected from the sweeper by
+a grace period. An existing content without references is not, so the transaction adding references inserts again the
+contents swept in between, and its update of the counts keeps the other ones locked until the commit.
+"""
+import datetime
+import hashlib
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Mapping
+
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import F
+from tortoise.functions import Count
+
+from .models import Snippet, SnippetContent
+
+
+def get_code_hash(code: str) -> str:
+    return hashlib.sha256(code.encode()).hexdigest()
+
+
+async def create_contents(codes: Iterable[str]) -> Dict[str, SnippetContent]:
+    """Returns the content of each code keyed by hash, missing ones are inserted without references."""
+    codes_by_hash = {get_code_hash(code): code for code in codes}
+    contents = {
+        content.hash: content for content in await SnippetContent.filter(hash__in=list(codes_by_hash)).only('hash')
+    }
+    missing = [SnippetContent(hash=hash_, code=code) for hash_, code in codes_by_hash.items() if hash_ not in contents]
+    try:
+        await SnippetContent.bulk_create(missing)
+    except IntegrityError:
+        # some codes were inserted meanwhile by a concurrent request
+        for content in missing:
+            try:
+                await content.save()
+            except IntegrityError:
+                pass
+
+    for content in missing:
+        contents[content.hash] = content
+    for hash_, content in contents.items():
+        # existing contents were fetched without their code, it is the same anyway
+        content.code = codes_by_hash[hash_]
+    return contents
+
+
+async def update_refcounts(counts: Mapping[str, int]) -> int:
+    """
+    Adds counts, negative ones to remove references, grouping contents by count to save queries. Returns the number
+    of updated contents.
+    """
+    hashes_by_count: Dict[int, List[str]] = {}
+    for hash_, count in counts.items():
+        if count:
+            hashes_by_count.setdefault(count, []).append(hash_)
+    updated = 0
+    for count, hashes in hashes_by_count.items():
+        updated += await SnippetContent.filter(hash__in=hashes).update(refcount=F('refcount') + count)
+    return updated
+
+
+async def add_references(contents: Iterable[SnippetContent]) -> None:
+    """
+    Adds a reference per item, to run in the transaction saving the snippets pointing at the contents. Contents
+    deleted by the sweeper since they were fetched by create_contents are inserted again with their references.
+    """
+    contents = list(contents)
+    contents_by_hash = {content.hash: content for content in contents}
+    counts = Counter(content.hash for content in contents)
+    if await update_refcounts(counts) == len(counts):
+        return
+
+    existing = set(await SnippetContent.filter(hash__in=list(counts)).values_list('hash', flat=True))
+    for hash_, count in counts.items():
+        if hash_ not in existing:
+            await SnippetContent.create(hash=hash_, code=contents_by_hash[hash_].code, refcount=count)
+
+
+async def remove_references(hashes: Iterable[str]) -> None:
+    """Removes a reference per item, to run in the transaction deleting or updating the snippets."""
+    await update_refcounts({hash_: -count for hash_, count in Counter(hashes).items()})
+
+
+async def remove_user_references(user_id: Any) -> None:
+    """Removes the references of all the snippets of a user, to run in the transaction deleting the user."""
+    rows = await (
+        Snippet.filter(user_id=user_id).annotate(count=Count('id')).group_by('content_id')
+        .values_list('content_id', 'count')
+    )
+    await update_refcounts({hash_: -count for hash_, count in rows})
+
+
+async def sweep_contents(grace_seconds: float, batch_size: int) -> int:
+    """
+    Deletes contents without references created more than `grace_seconds` ago, `batch_size` at a time. Counts are
+    not trusted blindly, contents still referenced are kept. Returns the number of deleted contents.
+    """
+    created_before = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=grace_seconds)
+    queryset = SnippetContent.filter(refcount__lte=0, created_at__lt=created_before).order_by('hash').limit(batch_size)
+    deleted = 0
+    hashes = await queryset.values_list('hash', flat=True)
+    while hashes:
+        referenced = set(await Snippet.filter(content_id__in=hashes).distinct().values_list('content_id', flat=True))
+        orphans = [hash_ for hash_ in hashes if hash_ not in referenced]
+        if orphans:
+            deleted += await SnippetContent.filter(hash__in=orphans, refcount__lte=0).delete()
+        if len(hashes) < batch_size:
+            break
+        hashes = await queryset.filter(hash__gt=hashes[-1]).values_list('hash', flat=True)
+    return deleted
@@ -0,0 +1,61 @@
+"""Streaming export of snippets."""
+from typing import Any, AsyncIterator, Dict, Mapping
+
+import orjson
+
+from pastebin.compression import get_compressor
+from pastebin.fields import CompressedText
+from pastebin.helpers import after_keyset
+from .models import Snippet
+
+# output key -> field path understood by QuerySet.values
+EXPORT_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'code': 'content__code',
+    'print_line_number': 'print_line_number',
+    'language': 'language__name',
+    'style': 'style__name',
+    'user_id': 'user_id',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at'
+}
+
+
+async def iter_snippet_rows(
+        filters: Dict[str, Any], chunk_size: int, fields: Mapping[str, str] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yields snippets as dicts, reading them in chunks ordered by (created_at, id) so that each query only fetches
+    `chunk_size` rows whatever the size of the table. Rows are not converted to models, compressed codes are
+    decompressed since values() returns them as is.
+    """
+    fields = EXPORT_FIELDS if fields is None else fields
+    # the keyset columns are needed to fetch the next chunk
+    values = {'_created_at': 'created_at', '_id': 'id', **fields}
+    queryset = Snippet.filter(**filters).order_by('created_at', 'id').limit(chunk_size)
+    rows = await queryset.values(**values)
+    while rows:
+        for row in rows:
+            created_at, pk = row.pop('_created_at'), row.pop('_id')
+            for key, value in row.items():
+                if isinstance(value, CompressedText):
+                    row[key] = str(value)
+            yield row
+        if len(rows) < chunk_size:
+            break
+        rows = await queryset.filter(after_keyset(created_at, pk)).values(**values)
+
+
+async def iter_ndjson(rows: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    async for row in rows:
+        yield orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE)
+
+
+async def iter_compressed(chunks: AsyncIterator[bytes], encoding: str) -> AsyncIterator[bytes]:
+    compress, flush = get_compressor(encoding)
+    async for chunk in chunks:
+        data = compress(chunk)
+        if data:
+            yield data
+    yield flush()
@@ -0,0 +1,139 @@
+"""Pygments highlighting run outside of the event loop."""
+import asyncio
+import html
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Tuple, Union
+
+from pygments import highlight
+from pygments.formatters.html import HtmlFormatter
+from pygments.lexers import get_lexer_by_name
+
+from pastebin.config import settings
+
+
+def highlight_code(code: str, language: str, title: str, style: str, print_line_number: bool) -> str:
+    lexer = get_lexer_by_name(language)
+    formatter = HtmlFormatter(title=title, style=style, linenos=print_line_number)
+    return highlight(code, lexer, formatter)
+
+
+def timed_highlight_code(*args) -> Tuple[str, float]:
+    """Returns the highlighted code and the time spent by Pygments, measured in the process running it."""
+    start = time.perf_counter()
+    highlighted = highlight_code(*args)
+    return highlighted, time.perf_counter() - start
+
+
+def plain_code(code: str) -> str:
+    """Html fallback used when a snippet cannot be highlighted."""
+    return f'<div class="highlight"><pre>{html.escape(code)}</pre></div>'
+
+
+class HighlightEngine:
+    """
+    Highlights code in a pool of processes so that big snippets do not block the event loop.
+    The number of jobs submitted to the pool is bounded, and a job which does not complete in time is abandoned by the
+    caller. In both cases, as well as when the code is too big or the job fails, `highlight` returns None and it is up
+    to the caller to degrade. A pool broken by the death of a worker is replaced on the next call. If `max_workers` is
+    0, code is highlighted in the current process.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, timeout: float, max_code_size: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.max_code_size = max_code_size
+        self.pending = 0
+        self.jobs = 0
+        self.total_seconds = 0.0
+        self.degraded = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self) -> None:
+        if self.max_workers and self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        # concurrent calls may all see the same broken pool, only the first one drops it
+        if self._executor is executor:
+            executor.shutdown(wait=False)
+            self._executor = None
+
+    def _job_done(self, future: asyncio.Future) -> None:
+        self.pending -= 1
+        # retrieves the exception of abandoned jobs to avoid "exception never retrieved" warnings
+        if not future.cancelled():
+            future.exception()
+
+    def _job_result(self, result: Tuple[str, float]) -> str:
+        highlighted, seconds = result
+        self.jobs += 1
+        self.total_seconds += seconds
+        return highlighted
+
+    async def highlight(
+            self, code: str, language: str, title: str, style: str, print_line_number: bool
+    ) -> Optional[str]:
+        if len(code) > self.max_code_size:
+            self.degraded += 1
+            return None
+
+        if not self.max_workers:
+            return self._job_result(timed_highlight_code(code, language, title, style, print_line_number))
+
+        if self.pending >= self.max_pending:
+            self.degraded += 1
+            return None
+
+        self.start()
+        executor: ProcessPoolExecutor = self._executor  # type: ignore
+        try:
+            concurrent_future = executor.submit(timed_highlight_code, code, language, title, style, print_line_number)
+        except BrokenProcessPool:
+            self._discard(executor)
+            self.degraded += 1
+            return None
+
+        future = asyncio.wrap_future(concurrent_future)
+        # the counter is decremented when the job really ends, not when the caller gives up waiting for it
+        self.pending += 1
+        future.add_done_callback(self._job_done)
+        try:
+            return self._job_result(await asyncio.wait_for(asyncio.shield(future), self.timeout))
+        except asyncio.TimeoutError:
+            # only works if the job has not started yet
+            concurrent_future.cancel()
+            self.degraded += 1
+            return None
+        except BrokenProcessPool:
+            self._discard(executor)
+            self.degraded += 1
+            return None
+        except Exception:
+            # a job failing on its input must not fail the request
+            self.degraded += 1
+            return None
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        return {
+            'max_pending': self.max_pending,
+            'pending': self.pending,
+            'jobs': self.jobs,
+            'total_seconds': self.total_seconds,
+            'degraded': self.degraded
+        }
+
+
+highlight_engine = HighlightEngine(
+    max_workers=settings.highlight_workers,
+    max_pending=settings.highlight_max_pending,
+    timeout=settings.highlight_timeout_seconds,
+    max_code_size=settings.highlight_max_code_size
+)
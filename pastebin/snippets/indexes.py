@@ -0,0 +1,62 @@
+"""
+Case-insensitive unique indexes on language and style names.
+Tortoise cannot declare expression indexes in Meta.indexes, so they are created here for each supported dialect. The
+indexed expression is the one Tortoise generates for name__iexact lookups, otherwise databases would not use them.
+"""
+from typing import Dict, Optional, Type, Union
+
+from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.transactions import in_transaction
+
+from .models import Language, Snippet, Style
+
+NAME_INDEXES: Dict[str, str] = {
+    'sqlite': 'CREATE UNIQUE INDEX IF NOT EXISTS "uidx_{table}_name" ON "{table}" (UPPER(CAST("name" AS VARCHAR)))',
+    'postgres': 'CREATE UNIQUE INDEX IF NOT EXISTS "uidx_{table}_name" ON "{table}" (UPPER(CAST("name" AS VARCHAR)))',
+    # functional key parts need MySQL 8.0.13 or later, and there is no IF NOT EXISTS clause
+    'mysql': 'CREATE UNIQUE INDEX `uidx_{table}_name` ON `{table}` ((UPPER(CAST(`name` AS CHAR))))'
+}
+
+
+async def _index_exists(connection: BaseDBAsyncClient, table: str, index: str) -> bool:
+    _, rows = await connection.execute_query(
+        'SELECT COUNT(*) AS count FROM information_schema.statistics'
+        ' WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s',
+        [table, index]
+    )
+    return rows[0]['count'] > 0
+
+
+async def deduplicate_names(model_class: Type[Union[Language, Style]]) -> int:
+    """
+    Merges rows having the same name regardless of the case, keeping the one with the smallest id, so that the unique
+    index can be created. Snippets pointing to removed rows are moved to the kept one. Returns the number of removed
+    rows.
+    """
+    kept: Dict[str, str] = {}
+    duplicates: Dict[str, str] = {}
+    for pk, name in sorted(await model_class.all().values_list('id', 'name'), key=lambda row: str(row[0])):
+        key = name.upper()
+        if key in kept:
+            duplicates[str(pk)] = kept[key]
+        else:
+            kept[key] = str(pk)
+
+    if duplicates:
+        foreign_key = f'{model_class._meta.db_table}_id'
+        async with in_transaction('default'):
+            for duplicate, original in duplicates.items():
+                await Snippet.filter(**{foreign_key: duplicate}).update(**{foreign_key: original})
+            await model_class.filter(id__in=list(duplicates)).delete()
+    return len(duplicates)
+
+
+async def create_name_indexes(connection: Optional[BaseDBAsyncClient] = None) -> None:
+    connection = Tortoise.get_connection('default') if connection is None else connection
+    dialect = connection.capabilities.dialect
+    for model_class in (Language, Style):
+        table = model_class._meta.db_table
+        if dialect == 'mysql' and await _index_exists(connection, table, f'uidx_{table}_name'):
+            continue
+        await connection.execute_script(NAME_INDEXES[dialect].format(table=table))
@@ -1,9 +1,11 @@
 import typing
 
-from tortoise import fields
+from tortoise import Model, fields
 from tortoise.validators import MinLengthValidator
 
 from pastebin.abc import AbstractModel
+from pastebin.config import settings
+from pastebin.fields import CompressedTextField, LazyText
 
 if typing.TYPE_CHECKING:
     from pastebin.users.models import User
@@ -17,10 +19,41 @@ class Style(AbstractModel):
     name = fields.CharField(max_length=100, null=False)
 
 
+class SnippetContent(Model):
+    """Code shared by all the snippets having exactly the same one, see the contents module."""
+    hash = fields.CharField(max_length=64, pk=True)
+    code = CompressedTextField(
+        threshold=settings.code_compression_threshold, level=settings.code_compression_level, null=False,
+        validators=[MinLengthValidator(1)]
+    )
+    refcount = fields.IntField(null=False, default=0)
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = 'snippet_content'
+        # orphans looked up by the sweeper
+        indexes = (('refcount', 'created_at'),)
+
+
+# decompresses the code only when a snippet needs it
+SnippetContent.code = LazyText('code')
+
+
 class Snippet(AbstractModel):
     title = fields.CharField(max_length=200, null=False, validators=[MinLengthValidator(1)])
-    code = fields.TextField(null=False, validators=[MinLengthValidator(1)])
+    content: fields.ForeignKeyRelation[SnippetContent] = fields.ForeignKeyField(
+        'pastebin.SnippetContent', related_name='snippets', on_delete=fields.RESTRICT
+    )
     print_line_number = fields.BooleanField(null=False, default=False)
     language: fields.ForeignKeyRelation[Language] = fields.ForeignKeyField('pastebin.Language')
     style: fields.ForeignKeyRelation[Style] = fields.ForeignKeyField('pastebin.Style')
     user: fields.ForeignKeyRelation['User'] = fields.ForeignKeyField('pastebin.User', related_name='snippets')
+
+    class Meta:
+        # keysets used by cursor pagination, globally and per user
+        indexes = (('user_id', 'created_at', 'id'), ('created_at', 'id'))
+
+    @property
+    def code(self) -> str:
+        # the content must be fetched with the snippet
+        return self.content.code
@@ -1,9 +1,9 @@
 import datetime
 import uuid
 from functools import partial
-from typing import Optional
+from typing import List, Optional, Union
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, StrictInt
 
 title_field = partial(Field, description='snippet description', example='my super snippet', min_length=1)
 code_field = partial(Field, description='snippet code', example="print('Hello world')", min_length=1)
@@ -31,3 +31,31 @@ class SnippetUpdate(SnippetCreate):
     code: Optional[str] = code_field(default=None)
     language: Optional[str] = language_field(default=None)
     style: Optional[str] = style_field(default=None)
+
+
+class SnippetListItem(BaseModel):
+    """Snippet of a list, only the fields requested are returned."""
+    id: Optional[uuid.UUID] = Field(None, description='snippet id')
+    title: Optional[str] = title_field(default=None)
+    code: Optional[str] = code_field(default=None)
+    print_line_number: Optional[bool] = Field(None, description='whether or not line numbers are printed in html')
+    language: Optional[str] = language_field(default=None)
+    style: Optional[str] = style_field(default=None)
+    created_at: Optional[datetime.datetime] = Field(None, description='snippet creation date')
+
+
+SNIPPET_FIELDS = tuple(SnippetListItem.__fields__)
+# codes can be big, they are only listed when requested
+DEFAULT_SNIPPET_LIST_FIELDS = tuple(field for field in SNIPPET_FIELDS if field != 'code')
+
+
+class ErrorDetail(BaseModel):
+    # StrictInt keeps indexes as integers, typing caches Union[int, str] as Union[str, int] which converts them
+    loc: List[Union[StrictInt, str]]
+    msg: str
+    type: str
+
+
+class SnippetBatchResult(BaseModel):
+    snippet: Optional[SnippetOutput] = Field(None, description='the created snippet')
+    detail: Optional[List[ErrorDetail]] = Field(None, description='the reasons why the snippet was not created')
@@ -0,0 +1,250 @@
+"""
+Full-text search over snippet titles and codes.
+Codes are stored compressed in snippet_content where the database cannot index them, so the application writes
+search documents in the snippet_search table whenever snippets change, in the transaction changing them. Each dialect
+uses its own index: an FTS5 table on SQLite, a GIN indexed tsvector on PostgreSQL and a FULLTEXT index on MySQL.
+Results are ordered by a score where lower is better, and paginated with a (score, snippet_id) keyset.
+The FTS5 table is contentless so that it keeps no copy of the codes. Its rows are numbered by snippet_search_document,
+which also records the indexed values since removing a row from a contentless table takes them again. MySQL keeps a
+copy of the indexed beginning of codes, bounded by the search_max_code_size setting.
+"""
+import base64
+import binascii
+import json
+import re
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.transactions import get_connection
+
+from pastebin.config import settings
+from .models import Snippet, SnippetContent
+
+SEARCH_TABLES = {
+    # snippet ids are stored as text on every dialect, search rows do not depend on the BINARY_UUID setting
+    'sqlite': 'CREATE TABLE IF NOT EXISTS "snippet_search_document" ('
+              '"id" INTEGER NOT NULL PRIMARY KEY, "snippet_id" VARCHAR(36) NOT NULL UNIQUE,'
+              ' "title" VARCHAR(200) NOT NULL, "content_id" VARCHAR(64) NOT NULL, "code_size" INT NOT NULL);'
+              ' CREATE VIRTUAL TABLE IF NOT EXISTS "snippet_search" USING fts5("title", "code", content=\'\')',
+    'postgres': 'CREATE TABLE IF NOT EXISTS "snippet_search" ('
+                '"snippet_id" VARCHAR(36) NOT NULL PRIMARY KEY, "document" TSVECTOR NOT NULL);'
+                ' CREATE INDEX IF NOT EXISTS "idx_snippet_search_document" ON "snippet_search" USING GIN ("document")',
+    'mysql': 'CREATE TABLE IF NOT EXISTS `snippet_search` ('
+             '`snippet_id` VARCHAR(36) NOT NULL PRIMARY KEY, `title` VARCHAR(200) NOT NULL, `code` MEDIUMTEXT NOT NULL,'
+             ' FULLTEXT KEY `ftx_snippet_search` (`title`, `code`)) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4'
+}
+
+SEARCH_TABLE_NAMES = ('snippet_search', 'snippet_search_document')
+
+INSERT_QUERIES = {
+    # rows of the contentless table are inserted once their documents are numbered
+    'sqlite': 'INSERT INTO "snippet_search_document" ("snippet_id", "title", "content_id", "code_size")'
+              ' VALUES (?, ?, ?, ?)',
+    # titles weigh more than codes in the rank
+    'postgres': 'INSERT INTO "snippet_search" ("snippet_id", "document") VALUES ($1,'
+                " setweight(to_tsvector('simple', $2::text), 'A') || setweight(to_tsvector('simple', $3::text), 'B'))"
+                ' ON CONFLICT ("snippet_id") DO UPDATE SET "document" = EXCLUDED."document"',
+    'mysql': 'REPLACE INTO `snippet_search` (`snippet_id`, `title`, `code`) VALUES (%s, %s, %s)'
+}
+
+# "delete" removes the given values of a row from a contentless table
+SQLITE_FTS_QUERIES = {
+    'insert': 'INSERT INTO "snippet_search" ("rowid", "title", "code") VALUES (?, ?, ?)',
+    'delete': 'INSERT INTO "snippet_search" ("snippet_search", "rowid", "title", "code") VALUES (\'delete\', ?, ?, ?)'
+}
+
+# matching snippets with their score, the query text is given once, or twice for MySQL
+MATCH_QUERIES = {
+    'sqlite': 'SELECT "d"."snippet_id", bm25("snippet_search", 10.0, 1.0) AS "score" FROM "snippet_search"'
+              ' JOIN "snippet_search_document" AS "d" ON "d"."id" = "snippet_search"."rowid"'
+              ' WHERE "snippet_search" MATCH ?',
+    'postgres': "SELECT \"snippet_id\", -ts_rank(\"document\", plainto_tsquery('simple', $1))::float8 AS \"score\""
+                " FROM \"snippet_search\" WHERE \"document\" @@ plainto_tsquery('simple', $1)",
+    'mysql': 'SELECT `snippet_id`, -MATCH(`title`, `code`) AGAINST (%s IN BOOLEAN MODE) AS `score`'
+             ' FROM `snippet_search` WHERE MATCH(`title`, `code`) AGAINST (%s IN BOOLEAN MODE)'
+}
+
+QUOTES = {'sqlite': '"', 'mysql': '`', 'postgres': '"'}
+
+
+def _placeholders(dialect: str, count: int, start: int = 1) -> List[str]:
+    if dialect == 'postgres':
+        return [f'${index}' for index in range(start, start + count)]
+    return ['?' if dialect == 'sqlite' else '%s'] * count
+
+
+def get_search_terms(text: str) -> List[str]:
+    """Words of a search, the operators of each dialect are dropped so that any text is a valid search."""
+    return re.findall(r'\w+', text)
+
+
+def get_indexed_code(code: str) -> str:
+    """Beginning of a code indexed for search, at most search_max_code_size characters without a truncated word."""
+    limit = settings.search_max_code_size
+    if len(code) <= limit:
+        return code
+    return re.sub(r'\w+\Z', '', code[:limit + 1])[:limit]
+
+
+def _get_match_params(dialect: str, terms: List[str]) -> List[str]:
+    # all terms are required on every dialect
+    if dialect == 'sqlite':
+        return [' '.join(f'"{term}"' for term in terms)]
+    if dialect == 'mysql':
+        text = ' '.join(f'+{term}' for term in terms)
+        return [text, text]
+    return [' '.join(terms)]
+
+
+class SearchCursor:
+    """Position in search results, i.e. the score and id of the last returned snippet."""
+
+    def __init__(self, score: float, snippet_id: str):
+        self.score = score
+        self.snippet_id = snippet_id
+
+    def encode(self) -> str:
+        data = {'s': self.score, 'i': self.snippet_id}
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+    @classmethod
+    def decode(cls, value: str) -> 'SearchCursor':
+        """Raises ValueError if the given value is not a cursor previously returned by the API."""
+        try:
+            data = json.loads(base64.urlsafe_b64decode(value.encode()))
+            score = float(data['s'])
+            snippet_id = str(uuid.UUID(data['i']))
+        except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError):
+            raise ValueError(f'{value} is not a valid cursor')
+        return cls(score, snippet_id)
+
+
+async def create_search_table(connection: Optional[BaseDBAsyncClient] = None) -> None:
+    connection = get_connection('default') if connection is None else connection
+    await connection.execute_script(SEARCH_TABLES[connection.capabilities.dialect])
+
+
+async def drop_search_table(connection: BaseDBAsyncClient) -> None:
+    q = QUOTES[connection.capabilities.dialect]
+    for table in SEARCH_TABLE_NAMES:
+        await connection.execute_script(f'DROP TABLE IF EXISTS {q}{table}{q}')
+
+
+async def _get_codes(connection: BaseDBAsyncClient, hashes: List[str]) -> Dict[str, str]:
+    placeholders = ', '.join(_placeholders('sqlite', len(hashes)))
+    _, rows = await connection.execute_query(
+        f'SELECT "hash", "code" FROM "snippet_content" WHERE "hash" IN ({placeholders})', hashes
+    )
+    # contents may be compressed, values are read as the ORM does
+    code_field = SnippetContent._meta.fields_map['code']
+    return {row['hash']: str(code_field.to_python_value(row['code'])) for row in rows}
+
+
+async def _delete_sqlite_documents(connection: BaseDBAsyncClient, snippet_ids: List[str]) -> None:
+    placeholders = ', '.join(_placeholders('sqlite', len(snippet_ids)))
+    _, documents = await connection.execute_query(
+        'SELECT "id", "title", "content_id", "code_size" FROM "snippet_search_document"'
+        f' WHERE "snippet_id" IN ({placeholders})', snippet_ids
+    )
+    if not documents:
+        return
+
+    # referenced contents are not swept, a missing one only leaves unreachable terms in the index
+    codes = await _get_codes(connection, list({document['content_id'] for document in documents}))
+    await connection.execute_many(SQLITE_FTS_QUERIES['delete'], [
+        [document['id'], document['title'], codes[document['content_id']][:document['code_size']]]
+        for document in documents if document['content_id'] in codes
+    ])
+    await connection.execute_query(
+        f'DELETE FROM "snippet_search_document" WHERE "snippet_id" IN ({placeholders})', snippet_ids
+    )
+
+
+async def delete_documents(connection: BaseDBAsyncClient, snippet_ids: List[str]) -> None:
+    if not snippet_ids:
+        return
+    dialect = connection.capabilities.dialect
+    if dialect == 'sqlite':
+        await _delete_sqlite_documents(connection, snippet_ids)
+        return
+    q = QUOTES[dialect]
+    placeholders = ', '.join(_placeholders(dialect, len(snippet_ids)))
+    await connection.execute_query(
+        f'DELETE FROM {q}snippet_search{q} WHERE {q}snippet_id{q} IN ({placeholders})', snippet_ids
+    )
+
+
+async def _insert_sqlite_documents(connection: BaseDBAsyncClient, rows: List[Tuple[str, str, str, str]]) -> None:
+    await connection.execute_many(
+        INSERT_QUERIES['sqlite'],
+        [[snippet_id, title, content_id, len(code)] for snippet_id, title, content_id, code in rows]
+    )
+    snippet_ids = [row[0] for row in rows]
+    placeholders = ', '.join(_placeholders('sqlite', len(snippet_ids)))
+    _, documents = await connection.execute_query(
+        f'SELECT "id", "snippet_id" FROM "snippet_search_document" WHERE "snippet_id" IN ({placeholders})', snippet_ids
+    )
+    document_ids = {document['snippet_id']: document['id'] for document in documents}
+    await connection.execute_many(
+        SQLITE_FTS_QUERIES['insert'], [[document_ids[snippet_id], title, code] for snippet_id, title, _, code in rows]
+    )
+
+
+async def insert_documents(connection: BaseDBAsyncClient, rows: List[Tuple[str, str, str, str]]) -> None:
+    """Writes the documents of (snippet_id, title, content_id, code) rows, replacing existing ones."""
+    if not rows:
+        return
+    rows = [(snippet_id, title, content_id, get_indexed_code(code)) for snippet_id, title, content_id, code in rows]
+    dialect = connection.capabilities.dialect
+    if dialect == 'sqlite':
+        # there is no unique constraint to upsert on in fts5 tables
+        await delete_documents(connection, [row[0] for row in rows])
+        await _insert_sqlite_documents(connection, rows)
+        return
+    await connection.execute_many(
+        INSERT_QUERIES[dialect], [[snippet_id, title, code] for snippet_id, title, _, code in rows]
+    )
+
+
+async def index_snippets(snippets: Iterable[Snippet]) -> None:
+    """Writes the search documents of snippets whose content is loaded, to run in the transaction saving them."""
+    rows = [(str(snippet.id), snippet.title, snippet.content_id, snippet.code) for snippet in snippets]  # type: ignore
+    await insert_documents(get_connection('default'), rows)
+
+
+async def unindex_snippets(snippet_ids: Iterable[Any]) -> None:
+    """Deletes the search documents of snippets, to run in the transaction deleting them."""
+    await delete_documents(get_connection('default'), [str(snippet_id) for snippet_id in snippet_ids])
+
+
+async def unindex_user_snippets(user_id: Any, batch_size: int = 500) -> None:
+    """Deletes the search documents of all the snippets of a user, to run in the transaction deleting the user."""
+    snippet_ids = await Snippet.filter(user_id=user_id).values_list('id', flat=True)
+    for start in range(0, len(snippet_ids), batch_size):
+        await unindex_snippets(snippet_ids[start:start + batch_size])
+
+
+async def search_snippet_ids(
+        connection: BaseDBAsyncClient, text: str, page_size: int, cursor: Optional[SearchCursor] = None
+) -> List[Tuple[str, float]]:
+    """Returns the ids and scores of the best matching snippets after the cursor, best ones first."""
+    terms = get_search_terms(text)
+    if not terms:
+        return []
+
+    dialect = connection.capabilities.dialect
+    q = QUOTES[dialect]
+    params: List[Any] = _get_match_params(dialect, terms)
+    keyset = ''
+    if cursor is not None:
+        score, snippet_id = _placeholders(dialect, 2, start=len(params) + 1)
+        keyset = f' WHERE ({q}score{q}, {q}snippet_id{q}) > ({score}, {snippet_id})'
+        params.extend([cursor.score, cursor.snippet_id])
+    query = (
+        f'SELECT {q}snippet_id{q}, {q}score{q} FROM ({MATCH_QUERIES[dialect]}) AS {q}matches{q}{keyset}'
+        f' ORDER BY {q}score{q}, {q}snippet_id{q} LIMIT {int(page_size)}'
+    )
+    _, rows = await connection.execute_query(query, params)
+    return [(row['snippet_id'], float(row['score'])) for row in rows]
+
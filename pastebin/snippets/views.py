@@ -1,72 +1,168 @@
-from typing import List, Dict, Any, cast
+import datetime
+import uuid
+from operator import attrgetter
+from typing import List, Dict, Any, Iterable, Mapping, Optional, cast
 
-from fastapi import Depends, APIRouter, Request
-from fastapi.encoders import jsonable_encoder
-from fastapi.responses import Response, HTMLResponse
-from pygments import highlight
-from pygments.formatters.html import HtmlFormatter
-from pygments.lexers import get_lexer_by_name
+import orjson
 
-from pastebin.config import PAGINATION_HEADERS
+from fastapi import Depends, APIRouter, HTTPException, Request, Query, Body
+from fastapi.responses import Response, HTMLResponse, StreamingResponse
+from tortoise.transactions import in_transaction
+
+from pastebin.cache import LRUCache
+from pastebin.compression import choose_encoding, compress, encode_etag
+from pastebin.config import PAGINATION_HEADERS, settings
 from pastebin.config import templates
+from pastebin.database import replica_router
 from pastebin.dependencies import (
-    get_db_user, get_db_snippet, get_authenticated_user, get_authenticated_snippet, Pagination
+    get_db_user, get_authenticated_user, SnippetGetter, AuthenticatedSnippetGetter, ConditionalGet, Pagination,
+    SnippetFields
 )
-from pastebin.exceptions import SnippetError
+from pastebin.exceptions import SnippetError, get_snippet_error_details
 from pastebin.schemas import HttpError
 from pastebin.users.models import User
 from pastebin.users.views import router as user_router
-from .models import Language, Style, Snippet
-from .schemas import SnippetCreate, SnippetOutput, SnippetUpdate
-from ..helpers import prepare_response
+from . import catalogue
+from .contents import add_references, create_contents, get_code_hash, remove_references
+from .export import iter_snippet_rows, iter_ndjson, iter_compressed
+from .highlighting import highlight_engine, plain_code
+from .models import Snippet, SnippetContent
+from .search import SearchCursor, index_snippets, search_snippet_ids, unindex_snippets
+from .schemas import SNIPPET_FIELDS, SnippetCreate, SnippetOutput, SnippetUpdate, SnippetBatchResult, SnippetListItem
+from ..helpers import prepare_response, get_validator_headers
 
 router = APIRouter(prefix='/snippets', tags=['snippets'])
+# snippet dependencies, each route only loads the related objects it uses
+get_displayed_snippet = SnippetGetter('language', 'style', 'content')
+get_editable_snippet = AuthenticatedSnippetGetter('language', 'style', 'content')
+get_deletable_snippet = AuthenticatedSnippetGetter()
+# rendered html pages of highlighted snippets
+highlight_cache = LRUCache(max_bytes=settings.highlight_cache_max_bytes)
 
 
-def get_snippet_info_to_display(snippet: Snippet) -> Dict[str, Any]:
-    return {
-        'id': snippet.id,
-        'title': snippet.title,
-        'code': snippet.code,
-        'print_line_number': snippet.print_line_number,
-        'language': snippet.language.name,
-        'style': snippet.style.name,
-        'created_at': snippet.created_at
-    }
+SNIPPET_FIELD_GETTERS = {
+    'id': attrgetter('id'),
+    'title': attrgetter('title'),
+    'code': attrgetter('code'),
+    'print_line_number': attrgetter('print_line_number'),
+    'language': attrgetter('language.name'),
+    'style': attrgetter('style.name'),
+    'created_at': attrgetter('created_at')
+}
 
 
-@user_router.post('/{user_id}/snippets', tags=['snippets'], status_code=201, response_model=SnippetOutput)
-async def create_snippet(snippet: SnippetCreate, user: User = Depends(get_authenticated_user)):
-    errors: List[Dict[str, str]] = []
-    language = await Language.filter(name__iexact=snippet.language).get_or_none()
+def get_snippet_info_to_display(snippet: Snippet, fields: Iterable[str] = SNIPPET_FIELDS) -> Dict[str, Any]:
+    return {field: SNIPPET_FIELD_GETTERS[field](snippet) for field in fields}
+
+
+def snippet_json_response(content: Any, status_code: int = 200, headers: Mapping[str, str] = None) -> Response:
+    """
+    Encodes snippet infos in a single orjson pass. FastAPI neither re-encodes nor validates a returned Response, the
+    response_model of the routes only documents them. orjson handles the uuids and datetimes built by
+    get_snippet_info_to_display the same way jsonable_encoder does.
+    """
+    return Response(orjson.dumps(content), status_code=status_code, headers=headers, media_type='application/json')
+
+
+async def get_locked_content_id(snippet_id: Any) -> Optional[str]:
+    """
+    Returns the content of a snippet locking its row until the end of the transaction, or None if it was deleted.
+    Tortoise drops the lock of values queries, hence a partial model.
+    """
+    snippet = await Snippet.filter(pk=snippet_id).select_for_update().only('id', 'content_id').get_or_none()
+    return None if snippet is None else snippet.content_id  # type: ignore
+
+
+async def get_snippet_model(snippet: SnippetCreate, user: User, loc: List[Any] = None) -> Snippet:
+    """
+    Returns an unsaved snippet without its content, raises SnippetError if its language or style is unknown.
+    """
+    loc = ['body'] if loc is None else loc
+    errors: List[Dict[str, Any]] = []
+    language = await catalogue.languages.get(snippet.language)
     if language is None:
-        errors.append({'model': 'language', 'value': snippet.language})
+        errors.append({'model': 'language', 'value': snippet.language, 'loc': loc})
 
-    style = await Style.filter(name__iexact=snippet.style).get_or_none()
+    style = await catalogue.styles.get(snippet.style)
     if style is None:
-        errors.append({'model': 'style', 'value': snippet.style})
+        errors.append({'model': 'style', 'value': snippet.style, 'loc': loc})
 
     if errors:
         raise SnippetError(errors=errors)
 
-    db_snippet = await Snippet.create(
+    return Snippet(
         title=snippet.title,
-        code=snippet.code,
         print_line_number=snippet.print_line_number,
         language=language,
         style=style,
         user=user
     )
-    return jsonable_encoder(get_snippet_info_to_display(db_snippet))
 
 
-def get_serialized_snippets(snippets: List[Snippet]) -> List[Dict[str, Any]]:
-    return jsonable_encoder([get_snippet_info_to_display(snippet) for snippet in snippets])
+@user_router.post('/{user_id}/snippets', tags=['snippets'], status_code=201, response_model=SnippetOutput)
+async def create_snippet(snippet: SnippetCreate, user: User = Depends(get_authenticated_user)):
+    db_snippet = await get_snippet_model(snippet, user)
+    db_snippet.content = (await create_contents([snippet.code]))[get_code_hash(snippet.code)]
+    async with in_transaction('default'):
+        await add_references([db_snippet.content])
+        await db_snippet.save()
+        await index_snippets([db_snippet])
+    return snippet_json_response(get_snippet_info_to_display(db_snippet), status_code=201)
+
+
+@user_router.post(
+    '/{user_id}/snippets/batch',
+    tags=['snippets'],
+    status_code=201,
+    response_model=List[SnippetBatchResult],
+    responses={
+        207: {
+            'description': 'Some snippets were not created',
+            'model': List[SnippetBatchResult]
+        }
+    }
+)
+async def create_snippets(
+        snippets: List[SnippetCreate] = Body(..., min_items=1, max_items=settings.snippet_batch_max_size),
+        user: User = Depends(get_authenticated_user)
+):
+    """
+    Creates several snippets at once. Valid snippets are inserted in a single transaction, invalid ones are reported
+    in the result having the same index as the snippet in the payload. The status code is 207 if at least one snippet
+    was not created.
+    """
+    results: List[Dict[str, Any]] = []
+    db_snippets = []
+    codes = []
+    for index, snippet in enumerate(snippets):
+        try:
+            db_snippet = await get_snippet_model(snippet, user, loc=['body', index])
+        except SnippetError as e:
+            results.append({'snippet': None, 'detail': get_snippet_error_details(e.errors)})
+        else:
+            db_snippets.append(db_snippet)
+            codes.append(snippet.code)
+            results.append({'snippet': db_snippet, 'detail': None})
+
+    if db_snippets:
+        contents = await create_contents(codes)
+        for db_snippet, code in zip(db_snippets, codes):
+            db_snippet.content = contents[get_code_hash(code)]
+        async with in_transaction('default'):
+            await add_references(db_snippet.content for db_snippet in db_snippets)
+            await Snippet.bulk_create(db_snippets)
+            await index_snippets(db_snippets)
+
+    for result in results:
+        if result['snippet'] is not None:
+            result['snippet'] = get_snippet_info_to_display(result['snippet'])
+    return snippet_json_response(results, status_code=207 if len(db_snippets) < len(snippets) else 201)
 
 
 @user_router.get(
     '/{user_id}/snippets',
-    response_model=List[SnippetOutput],
+    response_model=List[SnippetListItem],
+    response_model_exclude_unset=True,
     tags=['snippets'],
     responses={200: PAGINATION_HEADERS}
 )
@@ -74,58 +170,208 @@ async def get_user_snippets(
         request: Request,
         response: Response,
         user: User = Depends(get_db_user),
-        pagination: Pagination = Depends()
+        pagination: Pagination = Depends(),
+        snippet_fields: SnippetFields = Depends()
 ):
+    """Lists snippets of a user, the fields parameter selects the returned fields. Codes are not returned by default."""
     filters = {'user_id': user.id}
-    to_prefetch = ['language', 'style']
     snippets = await prepare_response(
-        request, response, Snippet, pagination.page, pagination.page_size, filters, to_prefetch
+        request, response, Snippet, pagination.page, pagination.page_size, filters, snippet_fields.relations,
+        pagination.cursor, snippet_fields.columns
+    )
+    # pagination headers are set on the injected response which is not used when returning another one
+    return snippet_json_response(
+        [get_snippet_info_to_display(snippet, snippet_fields.fields) for snippet in cast(List[Snippet], snippets)],
+        headers=response.headers
     )
-    return get_serialized_snippets(cast(List[Snippet], snippets))
 
 
-@router.get('/', response_model=List[SnippetOutput], responses={200: PAGINATION_HEADERS})
-async def get_snippets(request: Request, response: Response, pagination: Pagination = Depends()):
-    to_prefetch = ['language', 'style']
+@router.get(
+    '/',
+    response_model=List[SnippetListItem],
+    response_model_exclude_unset=True,
+    responses={200: PAGINATION_HEADERS}
+)
+async def get_snippets(
+        request: Request,
+        response: Response,
+        pagination: Pagination = Depends(),
+        snippet_fields: SnippetFields = Depends()
+):
+    """Lists all snippets, the fields parameter selects the returned fields. Codes are not returned by default."""
     snippets = await prepare_response(
-        request, response, Snippet, pagination.page, pagination.page_size, to_prefetch=to_prefetch
+        request, response, Snippet, pagination.page, pagination.page_size, to_prefetch=snippet_fields.relations,
+        cursor=pagination.cursor, only=snippet_fields.columns
+    )
+    # pagination headers are set on the injected response which is not used when returning another one
+    return snippet_json_response(
+        [get_snippet_info_to_display(snippet, snippet_fields.fields) for snippet in cast(List[Snippet], snippets)],
+        headers=response.headers
+    )
+
+
+@router.get(
+    '/export',
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            'description': 'Snippets as newline delimited json, compressed if the client accepts it',
+            'content': {'application/x-ndjson': {}}
+        }
+    }
+)
+async def export_snippets(
+        request: Request,
+        user_id: Optional[uuid.UUID] = Query(None, description='only export snippets of this user'),
+        language: Optional[str] = Query(None, description='only export snippets of this language'),
+        since: Optional[datetime.datetime] = Query(None, description='only export snippets updated since this date')
+):
+    """
+    Streams all the snippets matching the filters, ordered by creation date. Use the since filter with the date of
+    a previous export for incremental synchronizations.
+    """
+    filters: Dict[str, Any] = {}
+    if user_id is not None:
+        filters['user_id'] = user_id
+    if language is not None:
+        db_language = await catalogue.languages.get(language)
+        if db_language is None:
+            raise SnippetError(errors=[{'model': 'language', 'value': language, 'loc': ['query']}])
+        filters['language_id'] = db_language.id
+    if since is not None:
+        filters['updated_at__gte'] = since
+
+    content = iter_ndjson(iter_snippet_rows(filters, settings.export_chunk_size))
+    headers = {}
+    encoding = choose_encoding(request.headers.get('accept-encoding', ''))
+    if encoding is not None:
+        content = iter_compressed(content, encoding)
+        headers['Content-Encoding'] = encoding
+    # the representation depends on Accept-Encoding, compressed or not
+    headers['Vary'] = 'Accept-Encoding'
+    return StreamingResponse(content, media_type='application/x-ndjson', headers=headers)
+
+
+@router.get(
+    '/search',
+    response_model=List[SnippetListItem],
+    response_model_exclude_unset=True,
+    responses={200: {'headers': {'X-Next-Page': PAGINATION_HEADERS['headers']['X-Next-Page']}}}
+)
+async def search_snippets(
+        request: Request,
+        q: str = Query(..., description='words to find in snippet titles and codes', min_length=1, max_length=200),
+        page_size: int = Query(50, description='number of items per page', ge=1, le=100),
+        cursor: Optional[str] = Query(None, description='opaque cursor returned in the X-Next-Page header'),
+        snippet_fields: SnippetFields = Depends()
+):
+    """
+    Lists the snippets whose title or code contain all the words of the search, best matches first. Matches in
+    titles rank higher. The fields parameter selects the returned fields, codes are not returned by default.
+    """
+    try:
+        search_cursor = None if cursor is None else SearchCursor.decode(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    connection = replica_router.db_for_read(request)
+    # one more match than needed tells if there is a next page
+    matches = await search_snippet_ids(connection, q, page_size + 1, search_cursor)
+    headers = {'X-Next-Page': ''}
+    if len(matches) > page_size:
+        matches = matches[:page_size]
+        next_cursor = SearchCursor(matches[-1][1], matches[-1][0]).encode()
+        headers['X-Next-Page'] = str(request.url.include_query_params(cursor=next_cursor, page_size=page_size))
+
+    snippets: Dict[str, Snippet] = {}
+    if matches:
+        queryset = Snippet.filter(id__in=[uuid.UUID(snippet_id) for snippet_id, _ in matches]).using_db(connection)
+        for snippet in await queryset.only(*snippet_fields.columns).prefetch_related(*snippet_fields.relations):
+            snippets[str(snippet.id)] = snippet
+    return snippet_json_response(
+        [
+            get_snippet_info_to_display(snippets[snippet_id], snippet_fields.fields)
+            for snippet_id, _ in matches if snippet_id in snippets
+        ],
+        headers=headers
     )
-    return get_serialized_snippets(cast(List[Snippet], snippets))
 
 
 @router.get(
     '/{snippet_id}',
     response_model=SnippetOutput,
+    dependencies=[Depends(ConditionalGet(Snippet, 'snippet_id'))],
     responses={
+        304: {
+            'description': 'Snippet not modified'
+        },
         404: {
             'description': 'Snippet not found',
             'model': HttpError
         }
     }
 )
-async def get_snippet(snippet: Snippet = Depends(get_db_snippet)):
-    return jsonable_encoder(get_snippet_info_to_display(snippet))
+async def get_snippet(snippet: Snippet = Depends(get_displayed_snippet)):
+    return snippet_json_response(
+        get_snippet_info_to_display(snippet), headers=get_validator_headers(snippet.id, snippet.updated_at)
+    )
 
 
 @router.get(
     '/{snippet_id}/highlight',
     response_class=HTMLResponse,
+    dependencies=[Depends(ConditionalGet(Snippet, 'snippet_id', variant='html'))],
     responses={
+        304: {
+            'description': 'Snippet not modified'
+        },
         404: {
             'description': 'Snippet not found',
             'model': HttpError
         }
     }
 )
-async def get_highlighted_snippet(request: Request, snippet: Snippet = Depends(get_db_snippet)):
-    lexer = get_lexer_by_name(snippet.language.name)
-    formatter = HtmlFormatter(title=snippet.title, style=snippet.style.name, linenos=snippet.print_line_number)
-    context = {
-        'request': request,
-        'title': snippet.title,
-        'highlighted': highlight(snippet.code, lexer, formatter)
-    }
-    return templates.TemplateResponse('highlight.jinja2', context)
+async def get_highlighted_snippet(request: Request, snippet: Snippet = Depends(get_displayed_snippet)):
+    # the base url is part of the key because the page contains absolute urls to static files
+    cache_key = (snippet.id, snippet.updated_at, snippet.style.name, snippet.print_line_number, str(request.base_url))
+    headers = get_validator_headers(snippet.id, snippet.updated_at, variant='html')
+    # compressed pages are cached too, so that they are not compressed again on each request
+    encoding = choose_encoding(request.headers.get('accept-encoding', ''))
+    if encoding is not None:
+        encoded_key = (*cache_key, encoding)
+        encoded_headers = {
+            **headers,
+            'ETag': encode_etag(headers['ETag'], encoding),
+            'Content-Encoding': encoding,
+            'Vary': 'Accept-Encoding'
+        }
+        # a miss falls back on the plain page, only the second lookup counts
+        content = highlight_cache.get(encoded_key, count_miss=False)
+        if content is not None:
+            return HTMLResponse(content, headers=encoded_headers)
+
+    content = highlight_cache.get(cache_key)
+    if content is None:
+        highlighted = await highlight_engine.highlight(
+            snippet.code, snippet.language.name, snippet.title, snippet.style.name, snippet.print_line_number
+        )
+        context = {
+            'request': request,
+            'title': snippet.title,
+            # the highlighting engine is saturated or the snippet is too big, we degrade to raw code
+            'highlighted': plain_code(snippet.code) if highlighted is None else highlighted
+        }
+        content = templates.get_template('highlight.jinja2').render(context).encode()
+        # a degraded page must not hide the highlighted one once the engine is available again
+        if highlighted is None:
+            return HTMLResponse(content)
+        highlight_cache.set(cache_key, content, tag=snippet.id)
+
+    if encoding is not None and len(content) >= settings.compression_minimum_size:
+        content = compress(content, encoding)
+        highlight_cache.set(encoded_key, content, tag=snippet.id)
+        return HTMLResponse(content, headers=encoded_headers)
+    return HTMLResponse(content, headers=headers)
 
 
 @router.patch(
@@ -138,22 +384,22 @@ async def get_highlighted_snippet(request: Request, snippet: Snippet = Depends(g
         }
     }
 )
-async def update_snippet(snippet: SnippetUpdate, db_snippet: Snippet = Depends(get_authenticated_snippet)):
+async def update_snippet(snippet: SnippetUpdate, db_snippet: Snippet = Depends(get_editable_snippet)):
     """
     Updates snippet information either partially or completely.
     The update can only be done by the snippet owner or an admin user.
     """
-    errors: List[Dict[str, str]] = []
+    errors: List[Dict[str, Any]] = []
     snippet_dict = snippet.dict(exclude_unset=True)
     if snippet.language is not None:
-        language = await Language.filter(name__iexact=snippet.language).get_or_none()
+        language = await catalogue.languages.get(snippet.language)
         if language is None:
             errors.append({'model': 'language', 'value': snippet.language})
         else:
             snippet_dict['language'] = language
 
     if snippet.style is not None:
-        style = await Style.filter(name__iexact=snippet.style).get_or_none()
+        style = await catalogue.styles.get(snippet.style)
         if style is None:
             errors.append({'model': 'style', 'value': snippet.style})
         else:
@@ -162,12 +408,31 @@ async def update_snippet(snippet: SnippetUpdate, db_snippet: Snippet = Depends(g
     if errors:
         raise SnippetError(errors=errors)
 
+    # the search document only depends on the title and the code
+    reindex = 'title' in snippet_dict or 'code' in snippet_dict
+    code = snippet_dict.pop('code', None)
+    if code is not None:
+        db_snippet.content = (await create_contents([code]))[get_code_hash(code)]
     for key, value in snippet_dict.items():
         setattr(db_snippet, key, value)
-    await db_snippet.save()
-    await db_snippet.fetch_related('language', 'style')
+    async with in_transaction('default'):
+        # the content read by the dependency may have been changed since by a concurrent request, the row lock makes
+        # the current one reliable until the commit
+        current_hash = await get_locked_content_id(db_snippet.pk)
+        if current_hash is None:
+            raise HTTPException(status_code=404, detail=f'no snippet with id {db_snippet.id} found')
+        if code is None:
+            if db_snippet.content.hash != current_hash:
+                db_snippet.content = await SnippetContent.get(hash=current_hash)
+        elif db_snippet.content.hash != current_hash:
+            await add_references([db_snippet.content])
+            await remove_references([current_hash])
+        await db_snippet.save()
+        if reindex:
+            await index_snippets([db_snippet])
+    highlight_cache.invalidate_tag(db_snippet.id)
 
-    return jsonable_encoder(get_snippet_info_to_display(db_snippet))
+    return snippet_json_response(get_snippet_info_to_display(db_snippet))
 
 
 @router.delete(
@@ -182,8 +447,15 @@ async def update_snippet(snippet: SnippetUpdate, db_snippet: Snippet = Depends(g
         }
     }
 )
-async def delete_snippet(snippet: Snippet = Depends(get_authenticated_snippet)):
+async def delete_snippet(snippet: Snippet = Depends(get_deletable_snippet)):
     """
     Deletes a snippet. The deletion can only be done by the snippet owner or an admin user.
     """
-    await snippet.delete()
+    highlight_cache.invalidate_tag(snippet.id)
+    async with in_transaction('default'):
+        # a concurrent deletion of the same snippet must not remove its reference twice
+        content_id = await get_locked_content_id(snippet.pk)
+        if content_id is not None:
+            await remove_references([content_id])
+            await unindex_snippets([snippet.id])
+            await snippet.delete()
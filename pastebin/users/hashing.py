@@ -0,0 +1,87 @@
+"""Password hashing run in a dedicated thread pool."""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, TypeVar, Union
+
+import bcrypt
+
+from pastebin.config import settings
+
+T = TypeVar('T')
+
+
+def hash_password(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf8'), bcrypt.gensalt()).decode('utf8')
+
+
+def verify_password(password: str, password_hash: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf8'), password_hash.encode('utf8'))
+
+
+class HashingPool:
+    """
+    Runs bcrypt computations in a size-limited thread pool. bcrypt releases the GIL, so the event loop stays
+    responsive while hashes are computed, and the pool size bounds the CPU used for it.
+    The number of waiting jobs and the time they spent waiting for a thread are recorded to help sizing the pool, as
+    well as the time spent computing hashes.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self.queued = 0
+        self.running = 0
+        self.jobs = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+        # counters are updated from the event loop and from the pool threads
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bcrypt')
+
+    def _wrap(self, func: Callable[..., T], submitted_at: float) -> Callable[..., T]:
+        def run(*args) -> T:
+            wait = time.perf_counter() - submitted_at
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self.jobs += 1
+                self.total_wait_seconds += wait
+                self.max_wait_seconds = max(self.max_wait_seconds, wait)
+            start = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                duration = time.perf_counter() - start
+                with self._lock:
+                    self.running -= 1
+                    self.total_run_seconds += duration
+
+        return run
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        with self._lock:
+            self.queued += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._wrap(func, time.perf_counter()), *args)
+
+    async def hash_password(self, password: str) -> str:
+        return await self.run(hash_password, password)
+
+    async def verify_password(self, password: str, password_hash: str) -> bool:
+        return await self.run(verify_password, password, password_hash)
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        return {
+            'max_workers': self.max_workers,
+            'queued': self.queued,
+            'running': self.running,
+            'jobs': self.jobs,
+            'total_wait_seconds': self.total_wait_seconds,
+            'max_wait_seconds': self.max_wait_seconds,
+            'total_run_seconds': self.total_run_seconds
+        }
+
+
+hashing_pool = HashingPool(max_workers=settings.bcrypt_workers)
@@ -1,12 +1,12 @@
 import typing
 
-import bcrypt
 import pydantic
 from tortoise import fields
 from tortoise.exceptions import ValidationError
 from tortoise.validators import MinLengthValidator
 
 from pastebin.abc import AbstractModel
+from .hashing import hashing_pool, hash_password, verify_password
 
 if typing.TYPE_CHECKING:
     from pastebin.snippets.models import Snippet
@@ -30,14 +30,24 @@ class User(AbstractModel):
     snippets: fields.ReverseRelation['Snippet']
 
     def set_password(self, password: str) -> None:
-        _hash = bcrypt.hashpw(password.encode('utf8'), bcrypt.gensalt())
-        self.password_hash = _hash.decode('utf8')
+        self.password_hash = hash_password(password)
 
     def check_password(self, password: str) -> bool:
         if self.password_hash is not None:
-            expected_hash = self.password_hash.encode('utf8')
-            return bcrypt.checkpw(password.encode('utf8'), expected_hash)
+            return verify_password(password, self.password_hash)
+        return False
+
+    async def aset_password(self, password: str) -> None:
+        """Same as set_password but computes the hash without blocking the event loop."""
+        self.password_hash = await hashing_pool.hash_password(password)
+
+    async def acheck_password(self, password: str) -> bool:
+        """Same as check_password but verifies the hash without blocking the event loop."""
+        if self.password_hash is not None:
+            return await hashing_pool.verify_password(password, self.password_hash)
         return False
 
     class Meta:
         table = 'user'
+        # keyset used by cursor pagination
+        indexes = (('created_at', 'id'),)
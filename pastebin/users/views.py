@@ -1,11 +1,14 @@
 from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from tortoise.transactions import in_transaction
 
 from pastebin.config import PAGINATION_HEADERS
-from pastebin.dependencies import get_db_user, get_authenticated_user, Pagination
-from pastebin.helpers import prepare_response
+from pastebin.dependencies import get_db_user, get_authenticated_user, principal_cache, ConditionalGet, Pagination
+from pastebin.helpers import prepare_response, get_validator_headers
 from pastebin.schemas import HttpError
+from pastebin.snippets.contents import remove_user_references
+from pastebin.snippets.search import unindex_user_snippets
 from .models import User
 from .schemas import UserCreate, UserUpdate, UserOutput
 
@@ -41,7 +44,7 @@ async def create_user(user_input: UserCreate = Depends(check_create_user_integri
     user_dict = user_input.dict()
     password = user_dict.pop('password')
     user = User(**user_dict)
-    user.set_password(password)
+    await user.aset_password(password)
     await user.save()
     return user
 
@@ -53,21 +56,28 @@ async def create_user(user_input: UserCreate = Depends(check_create_user_integri
     responses={200: PAGINATION_HEADERS}
 )
 async def get_users(request: Request, response: Response, pagination: Pagination = Depends()):
-    return await prepare_response(request, response, User, pagination.page, pagination.page_size)
+    return await prepare_response(
+        request, response, User, pagination.page, pagination.page_size, cursor=pagination.cursor
+    )
 
 
 @router.get(
     '/{user_id}',
     response_model=UserOutput,
     description='Gets a user given its id',
+    dependencies=[Depends(ConditionalGet(User, 'user_id'))],
     responses={
+        304: {
+            'description': 'User not modified'
+        },
         404: {
             'description': 'User not found',
             'model': HttpError
         }
     }
 )
-async def get_user(user: User = Depends(get_db_user)):
+async def get_user(response: Response, user: User = Depends(get_db_user)):
+    response.headers.update(get_validator_headers(user.id, user.updated_at))
     return user
 
 
@@ -103,12 +113,13 @@ async def update_user(
     """
     user_dict = user.dict(exclude_unset=True)
     if 'password' in user_dict:
-        db_user.set_password(user_dict.pop('password'))
+        await db_user.aset_password(user_dict.pop('password'))
 
     for key, value in user_dict.items():
         setattr(db_user, key, value)
 
     await db_user.save()
+    principal_cache.invalidate_user(db_user.id)
     return db_user
 
 
@@ -128,4 +139,9 @@ async def delete_user(user: User = Depends(get_authenticated_user)):
     """
     Deletes a user. The deletion can only be done by the concerned user or an admin user.
     """
-    await user.delete()
+    async with in_transaction('default'):
+        # snippets are deleted by the database along with the user
+        await remove_user_references(user.id)
+        await unindex_user_snippets(user.id)
+        await user.delete()
+    principal_cache.invalidate_user(user.id)
@@ -5,7 +5,11 @@ import httpx
 import pytest
 from tortoise import Tortoise
 
+from pastebin.dependencies import principal_cache
 from pastebin.main import app
+from pastebin.snippets.catalogue import invalidate_catalogues
+from pastebin.snippets.indexes import create_name_indexes
+from pastebin.snippets.search import create_search_table
 from pastebin.snippets.models import Language, Style
 from pastebin.users.models import User
 from tests.helpers import create_snippet
@@ -64,7 +68,11 @@ async def client(default_user_id) -> httpx.AsyncClient:
         modules={'pastebin': ['pastebin.users.models', 'pastebin.snippets.models']}
     )
     await Tortoise.generate_schemas()
+    await create_name_indexes()
+    await create_search_table()
     await create_models(default_user_id)
+    invalidate_catalogues()
+    principal_cache.clear()
     async with httpx.AsyncClient(app=app, base_url='http://testserver') as test_client:
         yield test_client
     await Tortoise.close_connections()
@@ -3,8 +3,10 @@ from typing import Dict
 import httpx
 import pydantic
 
+from pastebin.snippets.contents import add_references, create_contents, get_code_hash
 from pastebin.snippets.models import Snippet, Language, Style
-from pastebin.snippets.schemas import SnippetOutput
+from pastebin.snippets.search import index_snippets
+from pastebin.snippets.schemas import DEFAULT_SNIPPET_LIST_FIELDS, SnippetOutput
 from pastebin.users.models import User
 from pastebin.users.schemas import UserOutput
 
@@ -25,6 +27,11 @@ def is_valid_snippet(snippet: Dict[str, str]) -> bool:
         return False
 
 
+def is_valid_listed_snippet(snippet: Dict[str, str]) -> bool:
+    """Snippets of lists are returned without their code by default."""
+    return set(snippet) == set(DEFAULT_SNIPPET_LIST_FIELDS) and is_valid_snippet({**snippet, 'code': 'foo'})
+
+
 async def create_snippet(
         user_id: str,
         title: str = 'test',
@@ -36,14 +43,12 @@ async def create_snippet(
     language = await Language.filter(name__iexact=language).get()
     style = await Style.filter(name__iexact=style).get()
     user = await User.filter(pk=user_id).get()
-    return await Snippet.create(
-        title=title,
-        code=code,
-        language=language,
-        style=style,
-        print_line_number=print_line_number,
-        user=user
-    )
+    snippet = Snippet(title=title, language=language, style=style, print_line_number=print_line_number, user=user)
+    snippet.content = (await create_contents([code]))[get_code_hash(code)]
+    await add_references([snippet.content])
+    await snippet.save()
+    await index_snippets([snippet])
+    return snippet
 
 
 def assert_invalid_pagination_type_response(response: httpx.Response) -> None:
@@ -0,0 +1,62 @@
+import pytest
+from tortoise import Tortoise
+
+from pastebin.config import settings
+from pastebin.snippets.catalogue import Catalogue
+from pastebin.snippets.models import Language
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_should_return_rows_regardless_of_name_case(client):
+    catalogue = Catalogue(Language)
+
+    language = await catalogue.get('PYTHON')
+
+    assert language is not None
+    assert 'Python' == language.name
+    assert await catalogue.get('foo') is None
+    assert {'hits': 1, 'misses': 1, 'entries': 2} == catalogue.stats()
+
+
+async def test_should_not_see_new_rows_until_refresh_delay_or_invalidation(client, monkeypatch):
+    monkeypatch.setattr(settings, 'catalogue_refresh_seconds', 3600)
+    catalogue = Catalogue(Language)
+    await catalogue.load()
+    await Language.create(name='Go')
+
+    assert await catalogue.get('go') is None
+
+    catalogue.invalidate()
+    assert not catalogue.is_loaded
+    assert 'Go' == (await catalogue.get('go')).name
+
+
+async def test_should_reload_on_unknown_name_when_refresh_delay_is_elapsed(client, monkeypatch):
+    monkeypatch.setattr(settings, 'catalogue_refresh_seconds', 0)
+    catalogue = Catalogue(Language)
+    await catalogue.load()
+    await Language.create(name='Go')
+
+    assert 'Go' == (await catalogue.get('GO')).name
+
+
+async def test_should_expire_known_names_when_refresh_delay_is_elapsed(client, monkeypatch):
+    monkeypatch.setattr(settings, 'catalogue_refresh_seconds', 0)
+    catalogue = Catalogue(Language)
+    await catalogue.load()
+    await Language.filter(name='Ruby').delete()
+
+    assert await catalogue.get('ruby') is None
+
+
+async def test_should_keep_the_row_with_the_smallest_id_among_duplicate_names(client):
+    # duplicates exist in databases created before the unique indexes
+    await Tortoise.get_connection('default').execute_script('DROP INDEX "uidx_language_name"')
+    await Language.create(name='PYTHON')
+    catalogue = Catalogue(Language)
+
+    language = await catalogue.get('python')
+
+    rows = await Language.filter(name__in=['Python', 'PYTHON'])
+    assert min(str(row.id) for row in rows) == str(language.id)
@@ -0,0 +1,123 @@
+import asyncio
+import datetime
+
+import pytest
+
+from tortoise.transactions import in_transaction
+
+from pastebin.snippets.contents import add_references, create_contents, get_code_hash, sweep_contents
+from pastebin.snippets.models import Snippet, SnippetContent
+from tests.helpers import create_snippet
+
+pytestmark = pytest.mark.anyio
+
+
+async def get_refcount(code: str) -> int:
+    return (await SnippetContent.get(hash=get_code_hash(code))).refcount
+
+
+async def test_snippets_with_the_same_code_share_their_content(client, default_user_id):
+    # the 3 snippets of the fixture have the default code
+    assert 1 == await SnippetContent.all().count()
+    assert 3 == await get_refcount('print("hello")')
+
+    await create_snippet(default_user_id, code='print("hello")')
+
+    assert 1 == await SnippetContent.all().count()
+    assert 4 == await get_refcount('print("hello")')
+
+
+async def test_batch_creation_counts_each_snippet(client, default_user_id, auth_header):
+    payload = [
+        {'title': 'foo', 'code': 'print("batch")', 'language': 'python', 'style': 'monokai'},
+        {'title': 'bar', 'code': 'print("batch")', 'language': 'python', 'style': 'monokai'}
+    ]
+    response = await client.post(f'/users/{default_user_id}/snippets/batch', json=payload, headers=auth_header)
+
+    assert 201 == response.status_code
+    assert ['print("batch")'] * 2 == [result['snippet']['code'] for result in response.json()]
+    assert 2 == await get_refcount('print("batch")')
+
+
+async def test_deleting_snippet_removes_its_reference(client, default_user_id, auth_header):
+    snippet = await Snippet.filter(user_id=default_user_id).first()
+
+    response = await client.delete(f'/snippets/{snippet.id}', headers=auth_header)
+
+    assert 204 == response.status_code
+    assert 2 == await get_refcount('print("hello")')
+
+
+async def test_updating_code_moves_the_reference(client, default_user_id, auth_header):
+    snippet = await Snippet.filter(user_id=default_user_id).first()
+
+    response = await client.patch(f'/snippets/{snippet.id}', json={'code': 'print("bye")'}, headers=auth_header)
+
+    assert 200 == response.status_code
+    assert 'print("bye")' == response.json()['code']
+    assert 2 == await get_refcount('print("hello")')
+    assert 1 == await get_refcount('print("bye")')
+
+
+async def test_concurrent_deletions_remove_the_reference_once(client, default_user_id, auth_header):
+    snippet = await Snippet.filter(user_id=default_user_id).first()
+
+    responses = await asyncio.gather(*(
+        client.delete(f'/snippets/{snippet.id}', headers=auth_header) for _ in range(2)
+    ))
+
+    assert {204} <= {response.status_code for response in responses} <= {204, 404}
+    assert 2 == await get_refcount('print("hello")')
+
+
+async def test_concurrent_code_updates_count_only_the_kept_code(client, default_user_id, auth_header):
+    snippet = await Snippet.filter(user_id=default_user_id).first()
+    codes = ['print("foo")', 'print("bar")']
+
+    responses = await asyncio.gather(*(
+        client.patch(f'/snippets/{snippet.id}', json={'code': code}, headers=auth_header) for code in codes
+    ))
+
+    assert [200, 200] == [response.status_code for response in responses]
+    kept_code = (await Snippet.filter(pk=snippet.id).prefetch_related('content').get()).code
+    assert 2 == await get_refcount('print("hello")')
+    assert {code: int(code == kept_code) for code in codes} == {code: await get_refcount(code) for code in codes}
+
+
+async def test_adding_references_inserts_again_swept_contents(client):
+    contents = await create_contents(['print("hello")', 'print("swept")'])
+    # the sweeper deleted the orphan between its lookup and the transaction referencing it
+    await SnippetContent.filter(hash=get_code_hash('print("swept")')).delete()
+
+    async with in_transaction('default'):
+        await add_references(contents.values())
+
+    assert 4 == await get_refcount('print("hello")')
+    swept = await SnippetContent.get(hash=get_code_hash('print("swept")'))
+    assert (1, 'print("swept")') == (swept.refcount, swept.code)
+
+
+async def test_deleting_user_removes_the_references_of_its_snippets(client, default_user_id, auth_header):
+    response = await client.delete(f'/users/{default_user_id}', headers=auth_header)
+
+    assert 204 == response.status_code
+    assert 1 == await get_refcount('print("hello")')
+
+
+async def test_sweeper_only_deletes_old_unreferenced_contents(client, default_user_id):
+    snippet = await create_snippet(default_user_id, code='print("orphan")')
+    await snippet.delete()
+    await SnippetContent.filter(hash=snippet.content_id).update(refcount=0)
+    # recent orphans may be about to be referenced
+    await SnippetContent.create(hash=get_code_hash('print("new")'), code='print("new")')
+    # wrong counts do not make referenced contents deleted
+    await SnippetContent.filter(hash=get_code_hash('print("hello")')).update(refcount=0)
+    old = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=2)
+    await SnippetContent.exclude(hash=get_code_hash('print("new")')).update(created_at=old)
+
+    deleted = await sweep_contents(grace_seconds=3600, batch_size=1)
+
+    assert 1 == deleted
+    assert {get_code_hash('print("hello")'), get_code_hash('print("new")')} == set(
+        await SnippetContent.all().values_list('hash', flat=True)
+    )
@@ -0,0 +1,65 @@
+import pytest
+
+from pastebin.config import settings
+from pastebin.snippets.models import Snippet
+from tests.helpers import is_valid_snippet, create_user
+
+pytestmark = pytest.mark.anyio
+
+
+def get_payload(title: str, language: str = 'python', style: str = 'monokai') -> dict:
+    return {'title': title, 'code': 'print("hello")', 'language': language, 'style': style}
+
+
+async def test_should_return_401_error_when_user_is_not_authenticated(client, default_user_id):
+    response = await client.post(f'/users/{default_user_id}/snippets/batch', json=[get_payload('foo')])
+
+    assert 401 == response.status_code
+    assert {'detail': 'Not authenticated'} == response.json()
+
+
+async def test_should_return_403_error_when_user_is_not_allowed_to_access_resource(client, auth_header):
+    user_id = await create_user(client)
+    response = await client.post(f'/users/{user_id}/snippets/batch', json=[get_payload('foo')], headers=auth_header)
+
+    assert 403 == response.status_code
+
+
+@pytest.mark.parametrize('size', [0, settings.snippet_batch_max_size + 1])
+async def test_should_return_422_error_when_batch_size_is_not_correct(client, default_user_id, auth_header, size):
+    payload = [get_payload(f'snippet {i}') for i in range(size)]
+    response = await client.post(f'/users/{default_user_id}/snippets/batch', json=payload, headers=auth_header)
+
+    assert 422 == response.status_code
+
+
+async def test_should_create_all_snippets(client, default_user_id, auth_header):
+    payload = [get_payload('foo'), get_payload('bar', language='ruby', style='friendly')]
+    response = await client.post(f'/users/{default_user_id}/snippets/batch', json=payload, headers=auth_header)
+
+    assert 201 == response.status_code
+    data = response.json()
+    assert ['foo', 'bar'] == [item['snippet']['title'] for item in data]
+    assert all(item['detail'] is None and is_valid_snippet(item['snippet']) for item in data)
+    assert 2 == await Snippet.filter(title__in=['foo', 'bar'], user_id=default_user_id).count()
+
+
+async def test_should_report_errors_of_invalid_snippets_and_create_the_others(client, default_user_id, auth_header):
+    payload = [get_payload('foo', language='bar'), get_payload('bar'), get_payload('baz', style='foo')]
+    response = await client.post(f'/users/{default_user_id}/snippets/batch', json=payload, headers=auth_header)
+
+    assert 207 == response.status_code
+    data = response.json()
+    assert data[0] == {
+        'snippet': None,
+        'detail': [
+            {
+                'loc': ['body', 0, 'language'],
+                'msg': 'No language bar found. Please look at /languages for the list of available languages.',
+                'type': 'value_error'
+            }
+        ]
+    }
+    assert is_valid_snippet(data[1]['snippet'])
+    assert ['body', 2, 'style'] == data[2]['detail'][0]['loc']
+    assert ['bar'] == await Snippet.filter(title__in=['foo', 'bar', 'baz']).values_list('title', flat=True)
@@ -0,0 +1,85 @@
+import datetime
+
+import orjson
+import pytest
+
+from pastebin.config import settings
+from pastebin.snippets.models import Snippet
+from tests.helpers import create_snippet
+
+pytestmark = pytest.mark.anyio
+
+
+def parse_ndjson(content: bytes) -> list:
+    return [orjson.loads(line) for line in content.splitlines()]
+
+
+async def test_should_export_all_snippets_in_chunks(client, monkeypatch):
+    monkeypatch.setattr(settings, 'export_chunk_size', 2)
+    response = await client.get('/snippets/export', headers={'Accept-Encoding': 'identity'})
+
+    assert 200 == response.status_code
+    assert 'application/x-ndjson' == response.headers['content-type']
+    rows = parse_ndjson(response.content)
+    assert 3 == len(rows)
+    assert 3 == len({row['id'] for row in rows})
+    assert {
+        'id', 'title', 'code', 'print_line_number', 'language', 'style', 'user_id', 'created_at', 'updated_at'
+    } == set(rows[0])
+    assert [row['created_at'] for row in rows] == sorted(row['created_at'] for row in rows)
+
+
+async def test_should_gzip_export_when_client_accepts_it(client):
+    response = await client.get('/snippets/export', headers={'Accept-Encoding': 'gzip'})
+
+    assert 200 == response.status_code
+    assert 'gzip' == response.headers['content-encoding']
+    assert 'Accept-Encoding' == response.headers['vary']
+    # httpx decodes the content
+    assert 3 == len(parse_ndjson(response.content))
+
+
+async def test_should_not_compress_export_when_client_refuses_gzip(client):
+    response = await client.get('/snippets/export', headers={'Accept-Encoding': 'gzip;q=0'})
+
+    assert 200 == response.status_code
+    assert 'content-encoding' not in response.headers
+    assert 'Accept-Encoding' == response.headers['vary']
+    assert 3 == len(parse_ndjson(response.content))
+
+
+async def test_should_filter_exported_snippets(client, default_user_id):
+    await create_snippet(default_user_id, title='ruby', language='ruby')
+    response = await client.get('/snippets/export', params={'user_id': default_user_id, 'language': 'RUBY'})
+
+    assert 200 == response.status_code
+    rows = parse_ndjson(response.content)
+    assert ['ruby'] == [row['title'] for row in rows]
+    assert 'Ruby' == rows[0]['language']
+
+
+async def test_should_only_export_snippets_updated_since_given_date(client, default_user_id):
+    since = datetime.datetime.now(datetime.timezone.utc)
+    snippet = await Snippet.filter(title='test 1').get()
+    await snippet.save()
+    response = await client.get('/snippets/export', params={'since': since.isoformat()})
+
+    assert 200 == response.status_code
+    assert ['test 1'] == [row['title'] for row in parse_ndjson(response.content)]
+
+
+async def test_should_return_422_error_when_language_is_unknown(client):
+    response = await client.get('/snippets/export', params={'language': 'foo'})
+
+    assert 422 == response.status_code
+    assert ['query', 'language'] == response.json()['detail'][0]['loc']
+
+
+async def test_should_export_compressed_codes_as_text(client, default_user_id):
+    code = 'print("hello")\n' * 100
+    await create_snippet(default_user_id, title='big', code=code)
+
+    response = await client.get('/snippets/export', headers={'Accept-Encoding': 'identity'})
+
+    assert 200 == response.status_code
+    assert [code] == [row['code'] for row in parse_ndjson(response.content) if row['title'] == 'big']
@@ -1,9 +1,15 @@
+import logging
 import uuid
 
 import pytest
+from fastapi.encoders import jsonable_encoder
 
+from pastebin.snippets.highlighting import highlight_engine
+from pastebin.snippets.models import Snippet
+from pastebin.snippets.schemas import SnippetOutput
+from pastebin.snippets.views import get_snippet_info_to_display, highlight_cache
 from tests.helpers import (
-    is_valid_snippet, create_snippet, assert_invalid_pagination_type_response,
+    is_valid_snippet, is_valid_listed_snippet, create_snippet, assert_invalid_pagination_type_response,
     assert_invalid_pagination_value_response
 )
 
@@ -35,7 +41,7 @@ class TestGetUserSnippets:
         assert '' == response.headers['x-previous-page'] == response.headers['x-next-page']
         assert 2 == len(data)
         for item in data:
-            assert is_valid_snippet(item)
+            assert is_valid_listed_snippet(item)
 
     @pytest.mark.parametrize(('previous_url', 'next_url', 'page', 'page_size', 'data_length'), [
         ('', '?page=2&page_size=1', 1, 1, 1),
@@ -60,7 +66,20 @@ class TestGetUserSnippets:
         data = response.json()
         assert data_length == len(data)
         for item in data:
-            assert is_valid_snippet(item)
+            assert is_valid_listed_snippet(item)
+
+    async def test_returns_user_list_of_snippets_with_cursor_pagination(self, client, default_user_id):
+        url = f'/users/{default_user_id}/snippets'
+        response = await client.get(url, params={'cursor': '', 'page_size': 1})
+        ids = []
+        while True:
+            assert 200 == response.status_code
+            ids.extend(item['id'] for item in response.json())
+            if not response.headers['x-next-page']:
+                break
+            response = await client.get(response.headers['x-next-page'])
+
+        assert 2 == len(set(ids))
 
 
 class TestGetSnippets:
@@ -88,7 +107,7 @@ class TestGetSnippets:
         assert '' == response.headers['x-previous-page'] == response.headers['x-next-page']
         assert 3 == len(data)
         for item in data:
-            assert is_valid_snippet(item)
+            assert is_valid_listed_snippet(item)
 
     @pytest.mark.parametrize(('previous_url', 'next_url', 'page', 'page_size', 'data_length'), [
         ('', 'http://testserver/snippets/?page=2&page_size=2', 1, 2, 2),
@@ -106,7 +125,72 @@ class TestGetSnippets:
         data = response.json()
         assert data_length == len(data)
         for item in data:
-            assert is_valid_snippet(item)
+            assert is_valid_listed_snippet(item)
+
+    async def test_returns_400_error_when_cursor_is_invalid(self, client):
+        response = await client.get('/snippets/', params={'cursor': 'foo'})
+
+        assert 400 == response.status_code
+        assert {'detail': 'foo is not a valid cursor'} == response.json()
+
+    async def test_returns_list_of_snippets_with_cursor_pagination(self, client):
+        response = await client.get('/snippets/', params={'cursor': '', 'page_size': 2})
+
+        assert 200 == response.status_code
+        assert '' == response.headers['x-previous-page']
+        first_page = [item['id'] for item in response.json()]
+        assert 2 == len(first_page)
+
+        response = await client.get(response.headers['x-next-page'])
+
+        assert 200 == response.status_code
+        assert '' == response.headers['x-next-page']
+        data = response.json()
+        assert 1 == len(data)
+        assert is_valid_listed_snippet(data[0])
+        assert data[0]['id'] not in first_page
+
+        response = await client.get(response.headers['x-previous-page'])
+
+        assert 200 == response.status_code
+        assert '' == response.headers['x-previous-page']
+        assert first_page == [item['id'] for item in response.json()]
+
+    async def test_returns_only_requested_fields(self, client):
+        response = await client.get('/snippets/', params={'fields': 'title,id', 'cursor': '', 'page_size': 2})
+
+        assert 200 == response.status_code
+        assert [['id', 'title']] * 2 == [list(item) for item in response.json()]
+        assert 'fields=title%2Cid' in response.headers['x-next-page']
+
+    async def test_returns_codes_when_requested(self, client, default_user_id):
+        response = await client.get(f'/users/{default_user_id}/snippets', params={'fields': 'code,language'})
+
+        assert 200 == response.status_code
+        assert [{'code': 'print("hello")', 'language': 'Python'}] * 2 == response.json()
+
+    async def test_only_selects_columns_of_requested_fields(self, client, caplog):
+        with caplog.at_level(logging.DEBUG, logger='tortoise.db_client'):
+            response = await client.get('/snippets/', params={'fields': 'id'})
+
+        assert 200 == response.status_code
+        queries = [record.getMessage() for record in caplog.records if record.name == 'tortoise.db_client']
+        # no query for languages, styles or contents
+        assert 1 == len(queries)
+        assert '"title"' not in queries[0]
+
+    async def test_returns_400_error_when_fields_are_unknown(self, client):
+        response = await client.get('/snippets/', params={'fields': 'id,foo'})
+
+        assert 400 == response.status_code
+        assert {'detail': 'unknown snippet fields: foo'} == response.json()
+
+    @pytest.mark.parametrize('fields', ['', ' , '])
+    async def test_returns_400_error_when_no_field_is_given(self, client, fields):
+        response = await client.get('/snippets/', params={'fields': fields})
+
+        assert 400 == response.status_code
+        assert {'detail': 'at least one snippet field is required'} == response.json()
 
 
 class TestGetSingleSnippet:
@@ -143,6 +227,32 @@ class TestGetSingleSnippet:
         assert is_valid_snippet(data)
         assert str(snippet.id) == data['id']
 
+    async def test_fetches_snippet_and_its_related_objects_in_a_single_query(self, client, default_user_id, caplog):
+        snippet = await create_snippet(default_user_id)
+        with caplog.at_level(logging.DEBUG, logger='tortoise.db_client'):
+            response = await client.get(f'/snippets/{snippet.id}')
+
+        assert 200 == response.status_code
+        queries = [record for record in caplog.records if record.name == 'tortoise.db_client']
+        assert 1 == len(queries)
+        assert 'JOIN' in queries[0].getMessage()
+
+    async def test_returns_same_content_as_response_model_serialization(self, client, default_user_id):
+        snippet = await create_snippet(default_user_id)
+        snippet = await Snippet.get(id=snippet.id).prefetch_related('language', 'style', 'content')
+        response = await client.get(f'/snippets/{snippet.id}')
+
+        assert 200 == response.status_code
+        assert 'application/json' == response.headers['content-type']
+        expected = jsonable_encoder(SnippetOutput(**get_snippet_info_to_display(snippet)))
+        assert expected == response.json()
+
+    async def test_documents_response_model_in_openapi_schema(self, client):
+        response = await client.get('/openapi.json')
+
+        schema = response.json()['paths']['/snippets/{snippet_id}']['get']['responses']['200']
+        assert '#/components/schemas/SnippetOutput' == schema['content']['application/json']['schema']['$ref']
+
 
 class TestGetHighlightedSnippet:
     """Tests GET /snippets/{snippet_id}/highlight"""
@@ -178,3 +288,113 @@ class TestGetHighlightedSnippet:
         assert f'<h2>{snippet.title}</h2>' in response.text
         assert '<div class="highlight">' in response.text
         assert 'hello' in response.text
+
+    async def test_should_serve_highlighted_snippet_from_cache_on_subsequent_calls(self, client, default_user_id):
+        snippet = await create_snippet(default_user_id)
+        first_response = await client.get(f'/snippets/{snippet.id}/highlight')
+        hits = highlight_cache.hits
+        second_response = await client.get(f'/snippets/{snippet.id}/highlight')
+
+        assert 200 == second_response.status_code
+        assert first_response.text == second_response.text
+        assert hits + 1 == highlight_cache.hits
+
+    async def test_should_cache_compressed_highlighted_snippet(self, client, default_user_id):
+        # small pages are not compressed
+        snippet = await create_snippet(default_user_id, code='print("hello")\n' * 50)
+        headers = {'Accept-Encoding': 'gzip'}
+        misses = highlight_cache.misses
+        first_response = await client.get(f'/snippets/{snippet.id}/highlight', headers=headers)
+        hits = highlight_cache.hits
+        second_response = await client.get(f'/snippets/{snippet.id}/highlight', headers=headers)
+
+        assert 'gzip' == first_response.headers['content-encoding'] == second_response.headers['content-encoding']
+        assert 'Accept-Encoding' == second_response.headers['vary']
+        assert first_response.headers['etag'].endswith('-html-gzip"')
+        assert first_response.headers['etag'] == second_response.headers['etag']
+        assert first_response.text == second_response.text
+        assert hits + 1 == highlight_cache.hits
+        # the lookup of the compressed page does not count as a miss of its own
+        assert misses + 1 == highlight_cache.misses
+        assert {'gzip'} == {key[-1] for key in highlight_cache._entries if key[0] == snippet.id and len(key) == 6}
+
+        response = await client.get(f'/snippets/{snippet.id}/highlight', headers={'Accept-Encoding': 'identity'})
+
+        assert 'content-encoding' not in response.headers
+        assert first_response.text == response.text
+        assert first_response.headers['etag'] != response.headers['etag']
+
+    async def test_should_return_raw_code_when_snippet_cannot_be_highlighted(
+            self, client, default_user_id, monkeypatch
+    ):
+        monkeypatch.setattr(highlight_engine, 'max_code_size', 1)
+        snippet = await create_snippet(default_user_id, code='print("<hello>")')
+        response = await client.get(f'/snippets/{snippet.id}/highlight')
+
+        assert 200 == response.status_code
+        assert '<pre>print(&quot;&lt;hello&gt;&quot;)</pre>' in response.text
+        assert 0 == len([key for key in highlight_cache._entries if key[0] == snippet.id])
+
+
+class TestConditionalGetSnippet:
+    """Tests conditional requests on GET /snippets/{snippet_id} and GET /snippets/{snippet_id}/highlight"""
+
+    @pytest.mark.parametrize('path', ['', '/highlight'])
+    async def test_returns_304_when_etag_matches(self, client, default_user_id, path):
+        snippet = await create_snippet(default_user_id)
+        response = await client.get(f'/snippets/{snippet.id}{path}')
+        etag = response.headers['etag']
+
+        response = await client.get(f'/snippets/{snippet.id}{path}', headers={'If-None-Match': etag})
+
+        assert 304 == response.status_code
+        assert etag == response.headers['etag']
+        assert b'' == response.content
+
+    async def test_returns_304_when_etag_of_compressed_page_matches(self, client, default_user_id):
+        snippet = await create_snippet(default_user_id, code='print("hello")\n' * 50)
+        headers = {'Accept-Encoding': 'gzip'}
+        response = await client.get(f'/snippets/{snippet.id}/highlight', headers=headers)
+        etag = response.headers['etag']
+
+        response = await client.get(
+            f'/snippets/{snippet.id}/highlight', headers={**headers, 'If-None-Match': f'W/{etag}'}
+        )
+
+        assert 304 == response.status_code
+        assert etag == response.headers['etag']
+
+    @pytest.mark.parametrize('path', ['', '/highlight'])
+    async def test_returns_304_when_snippet_is_not_modified_since_given_date(self, client, default_user_id, path):
+        snippet = await create_snippet(default_user_id)
+        response = await client.get(f'/snippets/{snippet.id}{path}')
+        last_modified = response.headers['last-modified']
+
+        response = await client.get(f'/snippets/{snippet.id}{path}', headers={'If-Modified-Since': last_modified})
+
+        assert 304 == response.status_code
+
+    async def test_json_and_html_representations_have_different_etags(self, client, default_user_id):
+        snippet = await create_snippet(default_user_id)
+        json_response = await client.get(f'/snippets/{snippet.id}')
+        html_response = await client.get(f'/snippets/{snippet.id}/highlight')
+
+        assert json_response.headers['etag'] != html_response.headers['etag']
+
+    async def test_returns_full_response_when_snippet_changed(self, client, default_user_id, auth_header):
+        snippet = await create_snippet(default_user_id)
+        response = await client.get(f'/snippets/{snippet.id}')
+        etag = response.headers['etag']
+        await client.patch(f'/snippets/{snippet.id}', json={'title': 'new title'}, headers=auth_header)
+
+        response = await client.get(f'/snippets/{snippet.id}', headers={'If-None-Match': etag})
+
+        assert 200 == response.status_code
+        assert etag != response.headers['etag']
+        assert 'new title' == response.json()['title']
+
+    async def test_returns_404_error_when_snippet_id_is_unknown(self, client):
+        snippet_id = uuid.uuid4()
+        response = await client.get(f'/snippets/{snippet_id}', headers={'If-None-Match': '*'})
+
+        assert 404 == response.status_code
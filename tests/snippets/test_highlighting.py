@@ -0,0 +1,69 @@
+import os
+import signal
+
+import pytest
+
+from pastebin.snippets.highlighting import HighlightEngine, plain_code
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture()
+def engine():
+    highlight_engine = HighlightEngine(max_workers=1, max_pending=2, timeout=10, max_code_size=100)
+    yield highlight_engine
+    highlight_engine.shutdown()
+
+
+async def test_should_highlight_code_in_process_pool(engine):
+    highlighted = await engine.highlight('print("hello")', 'python', 'test', 'monokai', False)
+
+    assert '<div class="highlight">' in highlighted
+    assert 'hello' in highlighted
+    assert 0 == engine.pending
+    stats = engine.stats()
+    assert 1 == stats['jobs']
+    assert stats['total_seconds'] > 0
+
+
+async def test_should_highlight_code_in_current_process_when_there_is_no_worker():
+    engine = HighlightEngine(max_workers=0, max_pending=0, timeout=10, max_code_size=100)
+    highlighted = await engine.highlight('print("hello")', 'python', 'test', 'monokai', True)
+
+    assert '<div class="highlight">' in highlighted
+
+
+async def test_should_not_highlight_code_bigger_than_max_code_size(engine):
+    assert await engine.highlight('a' * 101, 'python', 'test', 'monokai', False) is None
+    assert 1 == engine.stats()['degraded']
+
+
+async def test_should_not_highlight_code_when_engine_is_saturated(engine):
+    engine.pending = engine.max_pending
+
+    assert await engine.highlight('print("hello")', 'python', 'test', 'monokai', False) is None
+
+
+async def test_should_give_up_highlighting_when_job_exceeds_timeout(engine):
+    engine.timeout = 0
+
+    assert await engine.highlight('print("hello")', 'python', 'test', 'monokai', False) is None
+
+
+async def test_should_replace_the_pool_when_a_worker_dies(engine):
+    assert await engine.highlight('print("hello")', 'python', 'test', 'monokai', False) is not None
+    for pid in list(engine._executor._processes):
+        os.kill(pid, signal.SIGKILL)
+
+    assert await engine.highlight('print("hello")', 'python', 'test', 'monokai', False) is None
+    assert 1 == engine.stats()['degraded']
+    assert await engine.highlight('print("hello")', 'python', 'test', 'monokai', False) is not None
+
+
+async def test_should_not_fail_when_the_job_fails(engine):
+    assert await engine.highlight('print("hello")', 'unknown-language', 'test', 'monokai', False) is None
+    assert 1 == engine.stats()['degraded']
+
+
+def test_plain_code_escapes_html():
+    assert '<div class="highlight"><pre>&lt;b&gt;</pre></div>' == plain_code('<b>')
@@ -0,0 +1,112 @@
+import pytest
+from tortoise import Tortoise
+
+from pastebin.config import settings
+from pastebin.snippets.models import Snippet
+from tests.helpers import create_snippet, is_valid_listed_snippet
+
+pytestmark = pytest.mark.anyio
+
+
+class TestSearchSnippets:
+    """Tests GET /snippets/search"""
+
+    async def test_returns_422_error_when_query_is_missing(self, client):
+        response = await client.get('/snippets/search')
+
+        assert 422 == response.status_code
+
+    async def test_returns_400_error_when_cursor_is_invalid(self, client):
+        response = await client.get('/snippets/search', params={'q': 'hello', 'cursor': 'foo'})
+
+        assert 400 == response.status_code
+        assert {'detail': 'foo is not a valid cursor'} == response.json()
+
+    async def test_returns_snippets_matching_all_words(self, client, default_user_id):
+        await create_snippet(default_user_id, title='fibonacci', code='def fib(n):\n    return n')
+        await create_snippet(default_user_id, title='factorial', code='def fact(n):\n    return n')
+
+        response = await client.get('/snippets/search', params={'q': 'def fib'})
+
+        assert 200 == response.status_code
+        data = response.json()
+        assert ['fibonacci'] == [snippet['title'] for snippet in data]
+        assert all(is_valid_listed_snippet(snippet) for snippet in data)
+        assert '' == response.headers['X-Next-Page']
+
+    async def test_ranks_title_matches_first(self, client, default_user_id):
+        await create_snippet(default_user_id, title='misc', code='# parser of json\nimport json')
+        await create_snippet(default_user_id, title='json parser', code='import re')
+
+        response = await client.get('/snippets/search', params={'q': 'parser', 'fields': 'title,code'})
+
+        assert ['json parser', 'misc'] == [snippet['title'] for snippet in response.json()]
+        assert 'import re' == response.json()[0]['code']
+
+    async def test_only_indexes_the_beginning_of_long_codes(self, client, default_user_id, monkeypatch):
+        monkeypatch.setattr(settings, 'search_max_code_size', 20)
+        await create_snippet(default_user_id, title='long', code='first second third fourth')
+
+        for query, titles in [('third', ['long']), ('fourth', []), ('fo', [])]:
+            response = await client.get('/snippets/search', params={'q': query})
+
+            assert titles == [snippet['title'] for snippet in response.json()]
+
+    @pytest.mark.parametrize('query', ['"', 'OR -', 'unknown'])
+    async def test_returns_empty_list_when_nothing_matches(self, client, query):
+        response = await client.get('/snippets/search', params={'q': query})
+
+        assert 200 == response.status_code
+        assert [] == response.json()
+
+    async def test_paginates_results_with_cursors(self, client):
+        response = await client.get('/snippets/search', params={'q': 'hello', 'page_size': 2})
+        titles = [snippet['title'] for snippet in response.json()]
+        assert 2 == len(titles)
+
+        response = await client.get(response.headers['X-Next-Page'])
+        titles.extend(snippet['title'] for snippet in response.json())
+
+        assert ['test 1', 'test 2', 'test 3'] == sorted(titles)
+        assert '' == response.headers['X-Next-Page']
+
+    async def test_index_follows_snippet_updates_and_deletions(self, client, default_user_id, auth_header):
+        snippets = await Snippet.filter(user_id=default_user_id).order_by('title')
+        response = await client.patch(f'/snippets/{snippets[0].id}', json={'title': 'renamed'}, headers=auth_header)
+        assert 200 == response.status_code
+        response = await client.delete(f'/snippets/{snippets[1].id}', headers=auth_header)
+        assert 204 == response.status_code
+
+        response = await client.get('/snippets/search', params={'q': 'test'})
+        assert ['test 3'] == [snippet['title'] for snippet in response.json()]
+        response = await client.get('/snippets/search', params={'q': 'renamed hello'})
+        assert ['renamed'] == [snippet['title'] for snippet in response.json()]
+
+    async def test_index_keeps_no_copy_of_codes_and_forgets_replaced_terms(self, client, default_user_id, auth_header):
+        connection = Tortoise.get_connection('default')
+        snippets = await Snippet.filter(user_id=default_user_id).order_by('title')
+        response = await client.patch(f'/snippets/{snippets[0].id}', json={'code': 'print("bye")'}, headers=auth_header)
+        assert 200 == response.status_code
+        response = await client.delete(f'/snippets/{snippets[1].id}', headers=auth_header)
+        assert 204 == response.status_code
+
+        _, rows = await connection.execute_query('SELECT "title", "code" FROM "snippet_search"')
+        assert [(None, None)] * 2 == [(row['title'], row['code']) for row in rows]
+        for term, count in [('hello', 1), ('bye', 1), ('test', 2)]:
+            _, rows = await connection.execute_query(
+                'SELECT "rowid" FROM "snippet_search" WHERE "snippet_search" MATCH ?', [term]
+            )
+            assert count == len(rows)
+
+    async def test_index_follows_created_snippets_and_deleted_users(self, client, default_user_id, auth_header):
+        payload = {'title': 'created', 'code': 'SELECT 1', 'language': 'python', 'style': 'monokai'}
+        response = await client.post(f'/users/{default_user_id}/snippets', json=payload, headers=auth_header)
+        assert 201 == response.status_code
+        response = await client.get('/snippets/search', params={'q': 'select'})
+        assert ['created'] == [snippet['title'] for snippet in response.json()]
+
+        response = await client.delete(f'/users/{default_user_id}', headers=auth_header)
+        assert 204 == response.status_code
+
+        response = await client.get('/snippets/search', params={'q': 'hello'})
+        assert ['test 3'] == [snippet['title'] for snippet in response.json()]
@@ -141,10 +141,24 @@ async def test_should_update_snippet_given_correct_input(client, default_user_id
     data = response.json()
     assert is_valid_snippet(data)
 
-    snippet = await Snippet.filter(pk=snippet.id).get().prefetch_related('language', 'style')
+    snippet = await Snippet.filter(pk=snippet.id).get().prefetch_related('language', 'style', 'content')
     for key, value in payload.items():
         assert data[key] == value
         if key in ['language', 'style']:
             assert getattr(snippet, key).name == value
         else:
             assert getattr(snippet, key) == value
+
+
+async def test_should_invalidate_highlighted_snippet_cache_after_update(client, default_user_id, auth_header):
+    snippet = await create_snippet(default_user_id, code='print("hello")')
+    await client.get(f'/snippets/{snippet.id}/highlight')
+    response = await client.patch(
+        f'/snippets/{snippet.id}', json={'code': 'print("goodbye")'}, headers=auth_header  # type: ignore
+    )
+    assert 200 == response.status_code
+
+    response = await client.get(f'/snippets/{snippet.id}/highlight')
+
+    assert 200 == response.status_code
+    assert 'goodbye' in response.text
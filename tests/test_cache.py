@@ -0,0 +1,115 @@
+import time
+
+from pastebin.cache import LRUCache, PrincipalCache
+
+
+def test_should_return_cached_value_and_count_hits_and_misses():
+    cache = LRUCache(max_bytes=10)
+
+    assert cache.get('foo') is None
+    cache.set('foo', b'bar')
+
+    assert b'bar' == cache.get('foo')
+    assert 1 == cache.hits == cache.misses
+    assert 3 == cache.size
+
+
+def test_should_not_count_miss_of_lookup_with_a_fallback():
+    cache = LRUCache(max_bytes=10)
+    cache.set('foo', b'bar')
+
+    assert cache.get('bar', count_miss=False) is None
+    assert b'bar' == cache.get('foo', count_miss=False)
+    assert (1, 0) == (cache.hits, cache.misses)
+
+
+def test_should_evict_least_recently_used_entries_when_byte_budget_is_exceeded():
+    cache = LRUCache(max_bytes=10)
+    cache.set('a', b'aaaa')
+    cache.set('b', b'bbbb')
+    cache.get('a')
+    cache.set('c', b'cccc')
+
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert 'c' in cache
+    assert 1 == cache.evictions
+    assert 8 == cache.size
+
+
+def test_should_not_store_value_bigger_than_byte_budget():
+    cache = LRUCache(max_bytes=2)
+    cache.set('a', b'aaa')
+
+    assert 0 == len(cache)
+    assert 0 == cache.size
+
+
+def test_should_replace_existing_value_without_counting_it_twice():
+    cache = LRUCache(max_bytes=10)
+    cache.set('a', b'aaaa')
+    cache.set('a', b'aa')
+
+    assert b'aa' == cache.get('a')
+    assert 2 == cache.size
+
+
+def test_should_drop_all_entries_of_a_tag():
+    cache = LRUCache(max_bytes=10)
+    cache.set(('a', 1), b'a', tag='a')
+    cache.set(('a', 2), b'a', tag='a')
+    cache.set(('b', 1), b'b', tag='b')
+    cache.invalidate_tag('a')
+
+    assert [('b', 1)] == [key for key in [('a', 1), ('a', 2), ('b', 1)] if key in cache]
+    assert 1 == cache.size
+    assert {
+        'hits': 0,
+        'misses': 0,
+        'evictions': 0,
+        'entries': 1,
+        'bytes': 1,
+        'max_bytes': 10
+    } == cache.stats()
+
+
+class FakeUser:
+    def __init__(self, pk):
+        self.pk = pk
+
+
+def test_principal_cache_should_return_user_until_entry_expires(monkeypatch):
+    cache = PrincipalCache(ttl=10, max_entries=10)
+    user = FakeUser(1)
+    monkeypatch.setattr(time, 'time', lambda: 100)
+    cache.set('token', user, token_expiration=105)
+
+    assert user is cache.get('token')
+
+    # the token expires before the cache ttl
+    monkeypatch.setattr(time, 'time', lambda: 105)
+    assert cache.get('token') is None
+    assert 1 == cache.hits == cache.misses
+    assert 0 == len(cache)
+
+
+def test_principal_cache_should_drop_all_tokens_of_an_invalidated_user():
+    cache = PrincipalCache(ttl=10, max_entries=10)
+    cache.set('token_1', FakeUser(1), token_expiration=float('inf'))
+    cache.set('token_2', FakeUser(1), token_expiration=float('inf'))
+    cache.set('token_3', FakeUser(2), token_expiration=float('inf'))
+    cache.invalidate_user(1)
+
+    assert cache.get('token_1') is None
+    assert cache.get('token_2') is None
+    assert cache.get('token_3') is not None
+
+
+def test_principal_cache_should_drop_oldest_entries_when_full():
+    cache = PrincipalCache(ttl=10, max_entries=2)
+    for index in range(3):
+        cache.set(f'token_{index}', FakeUser(index), token_expiration=float('inf'))
+
+    assert 2 == len(cache)
+    assert cache.get('token_0') is None
+    assert 1 == cache.evictions
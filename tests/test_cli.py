@@ -0,0 +1,186 @@
+import json
+import pathlib
+import sqlite3
+import uuid
+
+import pytest
+from tortoise import Tortoise
+
+from cli.main import upsert_names
+from cli.contents import get_snippet_columns, move_codes
+from cli.search import rebuild_search_index
+from cli.transfer import Checkpoint, Progress, export_snippets, import_snippets
+from cli.uuids import UUID_COLUMNS, convert_uuids
+from pastebin.config import settings
+from pastebin.fields import COMPRESSED_MARKER
+from pastebin.snippets.models import Language, Snippet, SnippetContent
+from pastebin.snippets.search import search_snippet_ids
+from tests.conftest import create_models
+from tests.helpers import create_snippet
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_upsert_names_only_inserts_missing_names(client):
+    inserted, existing = await upsert_names(Language, ['python', 'Go', 'go', 'Rust'])
+
+    assert (2, 2) == (inserted, existing)
+    assert ['Go', 'Python', 'Ruby', 'Rust'] == sorted(await Language.all().values_list('name', flat=True))
+
+
+async def test_upsert_names_is_idempotent(client):
+    await upsert_names(Language, ['Go'])
+    inserted, existing = await upsert_names(Language, ['Go'])
+
+    assert (0, 3) == (inserted, existing)
+    assert 3 == await Language.all().count()
+
+
+async def test_exported_snippets_can_be_imported_back(client, tmp_path):
+    path = tmp_path / 'snippets.jsonl'
+    with path.open('wb') as file:
+        await export_snippets(file, chunk_size=2, progress=Progress(lambda _: None))
+    snippets = {snippet['id']: snippet for snippet in await Snippet.all().values('id', 'title', 'user_id', 'created_at')}
+    await Snippet.all().delete()
+
+    checkpoint_path = tmp_path / 'checkpoint.json'
+    progress = Progress(lambda _: None)
+    with path.open('rb') as file:
+        errors = await import_snippets(iter(file), 2, 2, Checkpoint(checkpoint_path, 2), progress)
+
+    assert [] == errors
+    assert 3 == progress.rows
+    imported = {snippet['id']: snippet for snippet in await Snippet.all().values('id', 'title', 'user_id', 'created_at')}
+    assert snippets == imported
+    assert {'batch_size': 2, 'done': [0, 1]} == json.loads(checkpoint_path.read_text())
+
+
+async def test_import_skips_batches_recorded_in_checkpoint_and_unknown_users(client, tmp_path):
+    path = tmp_path / 'snippets.jsonl'
+    with path.open('wb') as file:
+        await export_snippets(file, chunk_size=10, progress=Progress(lambda _: None))
+    await Snippet.all().delete()
+    lines = path.read_bytes().splitlines()
+    lines[2] = lines[2].replace(b'"user":"fisher"', b'"user":"unknown"')
+
+    checkpoint_path = tmp_path / 'checkpoint.json'
+    checkpoint_path.write_text(json.dumps({'batch_size': 1, 'done': [0]}))
+    errors = await import_snippets(iter(lines), 1, 2, Checkpoint(checkpoint_path, 1), Progress(lambda _: None))
+
+    assert 1 == len(errors)
+    assert 1 == await Snippet.all().count()
+    assert [0, 1, 2] == json.loads(checkpoint_path.read_text())['done']
+
+
+async def test_import_skips_snippets_already_imported(client, tmp_path):
+    path = tmp_path / 'snippets.jsonl'
+    with path.open('wb') as file:
+        await export_snippets(file, chunk_size=10, progress=Progress(lambda _: None))
+    lines = path.read_bytes().splitlines()
+    # the import stopped after the first batch was committed but before the checkpoint was saved
+    await Snippet.filter(id__not=json.loads(lines[0])['id']).delete()
+    contents = await SnippetContent.all().count()
+
+    progress = Progress(lambda _: None)
+    errors = await import_snippets(iter(lines), 1, 2, Checkpoint(None, 1), progress)
+
+    assert [] == errors
+    assert 2 == progress.rows
+    assert 3 == await Snippet.all().count()
+    assert contents == await SnippetContent.all().count()
+
+
+def test_checkpoint_refuses_a_different_batch_size(tmp_path):
+    checkpoint_path = tmp_path / 'checkpoint.json'
+    Checkpoint(checkpoint_path, 2).add(0)
+
+    with pytest.raises(ValueError):
+        Checkpoint(checkpoint_path, 3)
+
+
+@pytest.mark.skipif(settings.binary_uuid, reason='keys are already stored in 16 bytes')
+async def test_convert_uuids_stores_keys_in_16_bytes_and_keeps_relations(client):
+    connection = Tortoise.get_connection('default')
+    snippet_ids = sorted(await Snippet.all().values_list('id', flat=True))
+
+    converted = await convert_uuids(2, Progress(lambda _: None))
+
+    # 3 users, 2 languages, 2 styles, 3 snippets and the distinct foreign keys of snippets (2 users, 1 language, 1 style)
+    assert 14 == converted
+    for table, column in UUID_COLUMNS:
+        _, rows = await connection.execute_query(
+            f'SELECT DISTINCT typeof("{column}") AS type, length("{column}") AS length FROM "{table}"'
+        )
+        assert [('blob', 16)] == [(row['type'], row['length']) for row in rows]
+    _, rows = await connection.execute_query(
+        'SELECT s.id AS id FROM snippet s JOIN user u ON s.user_id = u.id JOIN language l ON s.language_id = l.id'
+        ' JOIN style st ON s.style_id = st.id'
+    )
+    assert snippet_ids == sorted(uuid.UUID(bytes=row['id']) for row in rows)
+    assert 0 == await convert_uuids(2, Progress(lambda _: None))
+
+
+async def test_move_codes_moves_legacy_codes_to_contents_and_drops_the_column(client):
+    connection = Tortoise.get_connection('default')
+    code = 'print("hello")\n' * 100
+    # snippet table as created before the deduplication, with a nullable content_id added by the command
+    await connection.execute_script(f"""
+        PRAGMA foreign_keys=OFF;
+        CREATE TABLE snippet_legacy AS SELECT * FROM snippet;
+        DROP TABLE snippet;
+        ALTER TABLE snippet_legacy RENAME TO snippet;
+        ALTER TABLE snippet ADD COLUMN code TEXT;
+        UPDATE snippet SET code = '{code}', content_id = NULL;
+        DELETE FROM snippet_content;
+        PRAGMA foreign_keys=ON;
+    """)
+
+    moved = await move_codes(2, Progress(lambda _: None))
+
+    assert 3 == moved
+    assert 'code' not in await get_snippet_columns(connection)
+    content = await SnippetContent.get()
+    assert (code, 3) == (content.code, content.refcount)
+    _, rows = await connection.execute_query('SELECT code FROM snippet_content')
+    assert rows[0]['code'].startswith(COMPRESSED_MARKER)
+    assert [code] * 3 == [snippet.code for snippet in await Snippet.all().prefetch_related('content')]
+    assert 0 == await move_codes(2, Progress(lambda _: None))
+
+
+def apply_migrations(path: pathlib.Path) -> None:
+    migrations = sorted(pathlib.Path(__file__).parents[1].joinpath('migrations', 'pastebin').glob('*.sql'))
+    with sqlite3.connect(path) as connection:
+        for migration in migrations:
+            upgrade = migration.read_text().split('-- upgrade --')[1].split('-- downgrade --')[0]
+            connection.executescript(upgrade)
+
+
+@pytest.mark.skipif(settings.binary_uuid, reason='migrations create keys as strings')
+async def test_database_built_from_migrations_stores_snippets_before_and_after_move_codes(tmp_path, default_user_id):
+    path = tmp_path / 'pastebin.sqlite3'
+    apply_migrations(path)
+    await Tortoise.init(
+        db_url=f'sqlite://{path}', modules={'pastebin': ['pastebin.users.models', 'pastebin.snippets.models']}
+    )
+    try:
+        await create_models(default_user_id)
+        assert 0 == await move_codes(2, Progress(lambda _: None))
+        assert 'code' not in await get_snippet_columns(Tortoise.get_connection('default'))
+        await create_snippet(default_user_id, code='print("migrated")')
+
+        snippets = await Snippet.all().prefetch_related('content')
+        assert 4 == len(snippets)
+        assert 'print("migrated")' in [snippet.code for snippet in snippets]
+    finally:
+        await Tortoise.close_connections()
+
+
+async def test_rebuild_search_index_indexes_all_snippets(client):
+    connection = Tortoise.get_connection('default')
+    await connection.execute_script('DROP TABLE "snippet_search"')
+    progress = Progress(lambda _: None)
+
+    await rebuild_search_index(2, progress)
+
+    assert 3 == progress.rows
+    assert 3 == len(await search_snippet_ids(connection, 'hello', 10))
@@ -0,0 +1,152 @@
+import gzip
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from pastebin.compression import CompressionMiddleware, choose_encoding, compress, decode_etag, encode_etag
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize(('accept_encoding', 'encoding'), [
+    ('', None),
+    ('identity', None),
+    ('gzip', 'gzip'),
+    ('deflate, GZIP;q=0.5', 'gzip'),
+    ('gzip;q=0', None),
+    ('*', 'gzip'),
+    ('*, gzip;q=0', None),
+    ('gzip;q=foo', None)
+])
+def test_choose_encoding_honours_qualities(accept_encoding, encoding, monkeypatch):
+    monkeypatch.setattr('pastebin.compression.ENCODINGS', ('gzip',))
+
+    assert encoding == choose_encoding(accept_encoding)
+
+
+def test_choose_encoding_prefers_brotli_when_installed(monkeypatch):
+    monkeypatch.setattr('pastebin.compression.ENCODINGS', ('br', 'gzip'))
+
+    assert 'br' == choose_encoding('gzip, deflate, br')
+    assert 'gzip' == choose_encoding('gzip, br;q=0.5')
+
+
+def test_compress_produces_gzip_data():
+    assert b'hello' * 100 == gzip.decompress(compress(b'hello' * 100, 'gzip'))
+
+
+def test_compress_produces_brotli_data():
+    brotli = pytest.importorskip('brotli')
+
+    assert b'hello' * 100 == brotli.decompress(compress(b'hello' * 100, 'br'))
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'br'])
+def test_encoded_etag_is_decoded_to_the_plain_one(encoding):
+    assert '"foo-html-{}"'.format(encoding) == encode_etag('"foo-html"', encoding)
+    assert '"foo-html"' == decode_etag(encode_etag('"foo-html"', encoding))
+    assert '"foo-html"' == decode_etag('"foo-html"')
+    assert 'W/"foo-{}"'.format(encoding) == encode_etag('W/"foo"', encoding)
+
+
+def test_unquoted_etag_is_not_encoded():
+    assert 'a82d46dd' == encode_etag('a82d46dd', 'gzip')
+
+
+def big_response(_):
+    return PlainTextResponse('hello' * 200, headers={'ETag': '"foo"'})
+
+
+def small_response(_):
+    return PlainTextResponse('hello', headers={'ETag': '"foo"'})
+
+
+def precompressed_response(_):
+    return Response(gzip.compress(b'hello' * 200), headers={'Content-Encoding': 'gzip'})
+
+
+def streaming_response(_):
+    async def chunks():
+        for _ in range(10):
+            yield b'hello' * 100
+
+    return StreamingResponse(chunks())
+
+
+@pytest.fixture()
+async def test_client():
+    app = Starlette(routes=[
+        Route('/big', big_response),
+        Route('/small', small_response),
+        Route('/precompressed', precompressed_response),
+        Route('/streaming', streaming_response)
+    ])
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+    async with httpx.AsyncClient(app=app, base_url='http://testserver') as test_client:
+        yield test_client
+
+
+@pytest.mark.parametrize('path', ['/big', '/streaming'])
+async def test_middleware_compresses_big_responses(test_client, path):
+    response = await test_client.get(path, headers={'Accept-Encoding': 'gzip'})
+
+    assert 'gzip' == response.headers['content-encoding']
+    assert 'Accept-Encoding' == response.headers['vary']
+    assert response.text.startswith('hellohello')
+
+
+async def test_middleware_gives_compressed_responses_their_own_etag(test_client):
+    response = await test_client.get('/big', headers={'Accept-Encoding': 'gzip'})
+
+    assert '"foo-gzip"' == response.headers['etag']
+
+    response = await test_client.get('/small', headers={'Accept-Encoding': 'gzip'})
+
+    assert '"foo"' == response.headers['etag']
+
+
+async def test_middleware_sets_length_of_compressed_response(test_client):
+    response = await test_client.get('/big', headers={'Accept-Encoding': 'gzip'})
+
+    assert len(compress(b'hello' * 200, 'gzip')) == int(response.headers['content-length'])
+
+
+@pytest.mark.parametrize(('path', 'accept_encoding'), [('/small', 'gzip'), ('/big', 'identity')])
+async def test_middleware_does_not_compress_small_responses_or_when_client_does_not_accept_it(
+        test_client, path, accept_encoding
+):
+    response = await test_client.get(path, headers={'Accept-Encoding': accept_encoding})
+
+    assert 'content-encoding' not in response.headers
+
+
+async def test_middleware_does_not_compress_responses_already_encoded(test_client):
+    response = await test_client.get('/precompressed', headers={'Accept-Encoding': 'gzip'})
+
+    assert 'gzip' == response.headers['content-encoding']
+    assert 'hello' * 200 == response.text
+
+
+async def test_openapi_schema_is_compressed(client):
+    response = await client.get('/openapi.json', headers={'Accept-Encoding': 'gzip'})
+
+    assert 200 == response.status_code
+    assert 'gzip' == response.headers['content-encoding']
+    assert 'Pastebin API' == response.json()['info']['title']
+
+
+async def test_static_files_keep_their_etag_when_compressed(client):
+    headers = {'Accept-Encoding': 'gzip'}
+    response = await client.get('/static/css/style.css', headers=headers)
+    etag = response.headers['etag']
+
+    assert 'gzip' == response.headers['content-encoding']
+    assert '"' not in etag
+
+    response = await client.get('/static/css/style.css', headers={**headers, 'If-None-Match': etag})
+
+    assert 304 == response.status_code
+    assert etag == response.headers['etag']
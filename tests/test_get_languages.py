@@ -59,3 +59,22 @@ async def test_returns_languages_with_pagination(client, previous_url, next_url,
     assert data_length == len(data)
     for item in data:
         assert is_valid_language(item)
+
+
+async def test_returns_languages_with_cursor_pagination(client):
+    response = await client.get('/languages', params={'cursor': '', 'page_size': 1})
+
+    assert 200 == response.status_code
+    assert '' == response.headers['x-previous-page']
+    assert 'cursor=' in response.headers['x-next-page']
+    assert 'page=' not in response.headers['x-next-page'].replace('page_size=', '')
+    first_language = response.json()[0]
+
+    response = await client.get(response.headers['x-next-page'])
+
+    assert 200 == response.status_code
+    assert '' == response.headers['x-next-page']
+    data = response.json()
+    assert 1 == len(data)
+    assert is_valid_language(data[0])
+    assert first_language != data[0]
@@ -0,0 +1,64 @@
+import uuid
+
+import pytest
+from tortoise import Tortoise
+from tortoise.exceptions import IntegrityError
+
+from pastebin.helpers import after_keyset
+from pastebin.snippets.indexes import deduplicate_names
+from pastebin.snippets.models import Language, Snippet, Style
+from pastebin.users.models import User
+
+pytestmark = pytest.mark.anyio
+
+
+async def get_query_plan(sql: str) -> str:
+    _, rows = await Tortoise.get_connection('default').execute_query(f'EXPLAIN QUERY PLAN {sql}')
+    return ' '.join(row['detail'] for row in rows)
+
+
+async def test_user_snippets_query_uses_user_keyset_index(client, default_user_id):
+    sql = Snippet.filter(user_id=default_user_id).order_by('created_at', 'id').limit(10).sql()
+    plan = await get_query_plan(sql)
+
+    assert 'idx_snippet_user_id_c3c58f' in plan
+    assert 'TEMP B-TREE' not in plan
+
+
+async def test_snippets_keyset_query_uses_keyset_index(client):
+    snippet = await Snippet.first()
+    sql = Snippet.filter(after_keyset(snippet.created_at, snippet.id)).order_by('created_at', 'id').limit(10).sql()
+    plan = await get_query_plan(sql)
+
+    assert 'idx_snippet_created_329d33' in plan
+    assert 'TEMP B-TREE' not in plan
+
+
+async def test_users_keyset_query_uses_keyset_index(client):
+    plan = await get_query_plan(User.all().order_by('created_at', 'id').limit(10).sql())
+
+    assert 'idx_user_created_5e2aef' in plan
+
+
+@pytest.mark.parametrize(('model_class', 'index'), [(Language, 'uidx_language_name'), (Style, 'uidx_style_name')])
+async def test_case_insensitive_name_lookup_uses_name_index(client, model_class, index):
+    plan = await get_query_plan(model_class.filter(name__iexact='python').sql())
+
+    assert index in plan
+
+
+async def test_names_are_unique_regardless_of_the_case(client):
+    with pytest.raises(IntegrityError):
+        await Language.create(name='PYTHON')
+
+
+async def test_deduplicate_names_moves_snippets_to_the_kept_row(client):
+    connection = Tortoise.get_connection('default')
+    await connection.execute_script('DROP INDEX "uidx_style_name"')
+    duplicate = await Style.create(id=str(uuid.UUID(int=0)), name='FRIENDLY')
+    original = await Style.filter(name='friendly').get()
+    await Snippet.filter(style_id=original.id).update(style_id=duplicate.id)
+
+    assert 1 == await deduplicate_names(Style)
+    assert ['FRIENDLY'] == await Style.filter(name__iexact='friendly').values_list('name', flat=True)
+    assert 0 == await Snippet.filter(style_id=original.id).count()
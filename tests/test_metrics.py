@@ -0,0 +1,96 @@
+import os
+import subprocess
+import sys
+from typing import Dict, Optional
+
+import pytest
+from prometheus_client import REGISTRY
+from prometheus_client.parser import text_string_to_metric_families
+
+from pastebin.metrics import monitor_queries
+from pastebin.snippets.models import Snippet
+
+pytestmark = pytest.mark.anyio
+
+
+def get_value(name: str, labels: Optional[Dict[str, str]] = None) -> float:
+    return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+
+async def test_counts_and_times_requests_by_route_template(client, default_user_id):
+    labels = {'method': 'GET', 'route': '/users/{user_id}'}
+    requests = get_value('pastebin_http_requests_total', {**labels, 'status': '200'})
+    durations = get_value('pastebin_http_request_duration_seconds_count', labels)
+
+    response = await client.get(f'/users/{default_user_id}')
+
+    assert 200 == response.status_code
+    assert requests + 1 == get_value('pastebin_http_requests_total', {**labels, 'status': '200'})
+    assert durations + 1 == get_value('pastebin_http_request_duration_seconds_count', labels)
+    assert 0 == get_value('pastebin_http_requests_in_progress', {'method': 'GET'})
+
+
+async def test_labels_requests_matching_no_route_as_unmatched(client):
+    labels = {'method': 'GET', 'route': 'unmatched', 'status': '404'}
+    requests = get_value('pastebin_http_requests_total', labels)
+
+    response = await client.get('/unknown/path')
+
+    assert 404 == response.status_code
+    assert requests + 1 == get_value('pastebin_http_requests_total', labels)
+
+
+async def test_attributes_database_queries_to_the_route_running_them(client):
+    monitor_queries()
+    queries = get_value('pastebin_db_queries_total', {'route': '/languages'})
+    durations = get_value('pastebin_db_query_duration_seconds_count', {'route': '/languages'})
+
+    response = await client.get('/languages')
+
+    assert 200 == response.status_code
+    new_queries = get_value('pastebin_db_queries_total', {'route': '/languages'}) - queries
+    assert new_queries >= 1
+    assert new_queries == get_value('pastebin_db_query_duration_seconds_count', {'route': '/languages'}) - durations
+
+
+async def test_metrics_endpoint_exposes_statistics_of_components(client):
+    snippet = await Snippet.first()
+    for _ in range(2):
+        assert 200 == (await client.get(f'/snippets/{snippet.id}/highlight')).status_code
+    assert 200 == (await client.post('/token', data={'username': 'Bob', 'password': 'hell'})).status_code
+    for _ in range(2):
+        assert 200 == (await client.get('/snippets/export', params={'language': 'python'})).status_code
+
+    response = await client.get('/metrics')
+
+    assert 200 == response.status_code
+    assert response.headers['content-type'].startswith('text/plain')
+    samples = {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for family in text_string_to_metric_families(response.text)
+        for sample in family.samples
+    }
+    assert samples[('pastebin_bcrypt_jobs_total', ())] >= 1
+    assert samples[('pastebin_bcrypt_seconds_total', ())] > 0
+    assert samples[('pastebin_highlight_jobs_total', ())] >= 1
+    assert samples[('pastebin_highlight_seconds_total', ())] > 0
+    assert 0 < samples[('pastebin_cache_hit_ratio', (('cache', 'highlight'),))] < 1
+    assert ('pastebin_cache_entries', (('cache', 'principal'),)) in samples
+    assert samples[('pastebin_cache_bytes', (('cache', 'highlight'),))] > 0
+    assert ('pastebin_cache_evictions_total', (('cache', 'highlight'),)) in samples
+    assert ('pastebin_cache_evictions_total', (('cache', 'principal'),)) in samples
+    assert 0 < samples[('pastebin_cache_hit_ratio', (('cache', 'language'),))] < 1
+
+
+def test_metrics_of_workers_are_aggregated_in_multiprocess_mode(tmp_path):
+    env = {**os.environ, 'PROMETHEUS_MULTIPROC_DIR': str(tmp_path)}
+    worker = "from pastebin.metrics import REQUESTS; REQUESTS.labels('GET', '/styles', '200').inc()"
+    for _ in range(2):
+        subprocess.run([sys.executable, '-c', worker], env=env, check=True)
+
+    scraper = 'from pastebin.metrics import render_metrics; print(render_metrics().decode())'
+    output = subprocess.run(
+        [sys.executable, '-c', scraper], env=env, check=True, capture_output=True, text=True
+    ).stdout
+
+    assert 'pastebin_http_requests_total{method="GET",route="/styles",status="200"} 2.0' in output
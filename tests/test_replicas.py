@@ -0,0 +1,105 @@
+import shutil
+
+import httpx
+import pytest
+from tortoise import Tortoise
+
+from pastebin.database import LEAST_BUSY, MonitoredPool, READ_PRIMARY_COOKIE, replica_router
+from pastebin.dependencies import principal_cache
+from pastebin.main import app
+from pastebin.snippets.catalogue import invalidate_catalogues
+from pastebin.snippets.indexes import create_name_indexes
+from pastebin.snippets.search import create_search_table
+from tests.conftest import create_models
+from tests.helpers import create_snippet
+from tests.test_database import FakeAsyncpgPool
+
+pytestmark = pytest.mark.anyio
+
+MODULES = ['pastebin.users.models', 'pastebin.snippets.models']
+REPLICAS = ['replica_0', 'replica_1']
+
+
+@pytest.fixture()
+async def client(tmp_path, monkeypatch, default_user_id) -> httpx.AsyncClient:
+    """The primary and its replicas are sqlite files, replicas are copies of the primary made before the test."""
+    primary = tmp_path / 'primary.db'
+    await Tortoise.init(db_url=f'sqlite://{primary}', modules={'pastebin': MODULES})
+    await Tortoise.generate_schemas()
+    await create_name_indexes()
+    await create_search_table()
+    await create_models(default_user_id)
+    await Tortoise.close_connections()
+
+    connections = {'default': f'sqlite://{primary}'}
+    for name in REPLICAS:
+        replica = tmp_path / f'{name}.db'
+        shutil.copy(primary, replica)
+        connections[name] = f'sqlite://{replica}'
+    await Tortoise.init(config={
+        'connections': connections,
+        'apps': {'pastebin': {'models': MODULES, 'default_connection': 'default'}}
+    })
+    monkeypatch.setattr(replica_router, 'names', REPLICAS)
+    monkeypatch.setattr(replica_router, 'reads', {})
+    invalidate_catalogues()
+    principal_cache.clear()
+    async with httpx.AsyncClient(app=app, base_url='http://testserver') as test_client:
+        yield test_client
+    await Tortoise.close_connections()
+
+
+async def test_get_requests_read_from_replicas_in_turn(client, default_user_id):
+    for _ in range(2):
+        response = await client.get('/snippets/')
+        assert 200 == response.status_code
+        assert 3 == len(response.json())
+    response = await client.get(f'/users/{default_user_id}')
+
+    assert 200 == response.status_code
+    assert {'replica_0': 2, 'replica_1': 1} == replica_router.stats()
+
+
+async def test_replicas_do_not_see_writes_of_primary(client, default_user_id):
+    snippet = await create_snippet(default_user_id)
+    response = await client.get(f'/snippets/{snippet.id}')
+
+    assert 404 == response.status_code
+
+
+async def test_clients_read_from_primary_after_a_write(client, auth_header, default_user_id):
+    response = await client.post(f'/users/{default_user_id}/snippets', headers=auth_header, json={
+        'title': 'foo', 'code': 'print("foo")', 'language': 'python', 'style': 'monokai'
+    })
+    assert 201 == response.status_code
+    assert READ_PRIMARY_COOKIE in response.cookies
+
+    snippet_id = response.json()['id']
+    response = await client.get(f'/snippets/{snippet_id}')
+    assert 200 == response.status_code
+
+    client.cookies.clear()
+    response = await client.get(f'/snippets/{snippet_id}')
+    assert 404 == response.status_code
+
+
+async def test_failed_writes_do_not_set_read_primary_cookie(client, default_user_id):
+    response = await client.post(f'/users/{default_user_id}/snippets', json={})
+
+    assert 401 == response.status_code
+    assert READ_PRIMARY_COOKIE not in response.cookies
+
+
+async def test_least_busy_selection_avoids_loaded_replicas(client, monkeypatch):
+    monkeypatch.setattr(replica_router, 'selection', LEAST_BUSY)
+    busy_pool = FakeAsyncpgPool()
+    await busy_pool.acquire()
+    connection = Tortoise.get_connection('replica_0')
+    connection._pool = MonitoredPool(busy_pool)
+    try:
+        for _ in range(3):
+            assert 200 == (await client.get('/snippets/')).status_code
+    finally:
+        del connection._pool
+
+    assert {'replica_1': 3} == replica_router.stats()
@@ -61,3 +61,17 @@ async def test_should_delete_user_when_giving_user_id_and_being_admin(client, de
     assert 204 == response.status_code
     user = await User.filter(pk=default_user_id).get_or_none()
     assert user is None
+
+
+async def test_should_reject_cached_token_of_admin_deleted_by_another_worker(client, default_user_id):
+    auth_header = {'Authorization': f'Bearer {create_access_token({"sub": "admin"})}'}
+    payload = {'title': 'foo', 'code': 'print("foo")', 'language': 'python', 'style': 'monokai'}
+    response = await client.post(f'/users/{default_user_id}/snippets', json=payload, headers=auth_header)
+    assert 201 == response.status_code
+    # the cache of this worker is not invalidated by a deletion made elsewhere
+    await User.filter(pseudo='admin').delete()
+
+    response = await client.delete(f'/users/{default_user_id}', headers=auth_header)
+
+    assert 401 == response.status_code
+    assert await User.filter(pk=default_user_id).exists()
@@ -84,3 +84,37 @@ class TestGetSingleUser:
             ]
         }
         assert message == response.json()
+
+
+class TestConditionalGetUser:
+    """Tests conditional requests on GET /users/{user_id}"""
+
+    async def test_returns_304_when_etag_matches(self, client, default_user_id):
+        response = await client.get(f'/users/{default_user_id}')
+        etag = response.headers['etag']
+
+        response = await client.get(f'/users/{default_user_id}', headers={'If-None-Match': f'"foo", W/{etag}'})
+
+        assert 304 == response.status_code
+        assert etag == response.headers['etag']
+
+    async def test_returns_full_response_when_user_is_modified_since_given_date(self, client, default_user_id):
+        response = await client.get(f'/users/{default_user_id}', headers={
+            'If-Modified-Since': 'Mon, 01 Jan 2001 00:00:00 GMT'
+        })
+
+        assert 200 == response.status_code
+        assert is_valid_user(response.json())
+        assert 'last-modified' in response.headers
+
+    async def test_handles_if_modified_since_dates_without_time_zone(self, client, default_user_id):
+        # -0000 means an unknown zone, such dates are parsed as naive datetimes
+        response = await client.get(f'/users/{default_user_id}', headers={
+            'If-Modified-Since': 'Mon, 01 Jan 2001 00:00:00 -0000'
+        })
+        assert 200 == response.status_code
+
+        response = await client.get(f'/users/{default_user_id}', headers={
+            'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 -0000'
+        })
+        assert 304 == response.status_code
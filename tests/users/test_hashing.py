@@ -0,0 +1,29 @@
+import pytest
+
+from pastebin.users.hashing import HashingPool, hash_password, verify_password
+from pastebin.users.models import User
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_should_hash_and_verify_password_in_thread_pool():
+    pool = HashingPool(max_workers=1)
+    password_hash = await pool.hash_password('foo')
+
+    assert await pool.verify_password('foo', password_hash)
+    assert not await pool.verify_password('bar', password_hash)
+    stats = pool.stats()
+    assert 3 == stats['jobs']
+    assert 0 == stats['queued'] == stats['running']
+    assert stats['max_wait_seconds'] >= 0
+    assert stats['total_run_seconds'] > 0
+
+
+async def test_async_password_methods_are_compatible_with_sync_ones():
+    user = User()
+    await user.aset_password('foo')
+
+    assert user.check_password('foo')
+    assert await user.acheck_password('foo')
+    assert not await user.acheck_password('bar')
+    assert verify_password('foo', hash_password('foo'))
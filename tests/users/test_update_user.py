@@ -187,3 +187,29 @@ async def test_should_update_and_return_user_when_given_correct_payload_with_pas
     assert user.check_password(payload['password'])
 
     assert is_valid_user(response.json())
+
+
+async def test_should_reject_token_of_previous_pseudo_after_pseudo_update(client, default_user_id, auth_header):
+    response = await client.patch(f'/users/{default_user_id}', json={'pseudo': 'Bobby'}, headers=auth_header)
+    assert 200 == response.status_code
+
+    response = await client.patch(f'/users/{default_user_id}', json={'firstname': 'Bobby'}, headers=auth_header)
+
+    assert 401 == response.status_code
+    assert {'detail': 'Could not validate credentials'} == response.json()
+
+
+async def test_should_reject_cached_token_of_previous_pseudo_updated_by_another_worker(
+        client, default_user_id, auth_header
+):
+    payload = {'title': 'foo', 'code': 'print("foo")', 'language': 'python', 'style': 'monokai'}
+    response = await client.post(f'/users/{default_user_id}/snippets', json=payload, headers=auth_header)
+    assert 201 == response.status_code
+    # the cache of this worker is not invalidated by a change made elsewhere
+    user = await User.get(pk=default_user_id)
+    user.pseudo = 'Bobby'
+    await user.save()
+
+    response = await client.patch(f'/users/{default_user_id}', json={'firstname': 'Bob'}, headers=auth_header)
+
+    assert 401 == response.status_code